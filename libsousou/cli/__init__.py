@@ -1,6 +1,31 @@
 """
 Command line utility framework.
+
+The names below are imported on first access, so that importing a module
+of this package, such as :mod:`libsousou.cli.client`, does not import the
+parser and its plugins.
 """
-from libsousou.cli.argument import Argument
-from libsousou.cli.baseparser import parser
-from libsousou.cli.command import BaseCommand
+import importlib
+
+
+__all__ = ['Argument', 'BaseCommand', 'parser']
+
+_exports = {
+    'Argument': 'libsousou.cli.argument',
+    'BaseCommand': 'libsousou.cli.command',
+    'parser': 'libsousou.cli.baseparser',
+}
+
+
+def __getattr__(name):
+    try:
+        module = _exports[name]
+    except KeyError:
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(
+            __name__, name))
+    value = globals()[name] = getattr(importlib.import_module(module), name)
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
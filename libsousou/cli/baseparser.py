@@ -1,5 +1,8 @@
 import argparse
+import collections
+import contextlib
 import sys
+import time
 
 from libsousou.module_loading import import_string
 
@@ -9,21 +12,52 @@ class ParserExit(Exception):
     pass
 
 
-def exit_parser(exitcode, *args, **kwargs):
-    raise ParserExit(exitcode, *args)
+def exit_parser(status=0, message=None):
+    raise ParserExit(status, message)
 
 
 class BaseParser(object):
     """
     Command-line argument parser base class that registers all
     subcommands.
+
+    The parser accepts the following options before the subcommand:
+
+    ``--profile[=FILE]``
+        Run the command under :mod:`cProfile`. The profile is written
+        to ``FILE``, or summarized on stderr if no file is given.
+    ``--profile-format {pstats,callgrind-text,json}``
+        The format of the profile written to ``FILE``.
+    ``--timings``
+        Report the wall and CPU time spent on importing and constructing
+        commands, parsing arguments and handling the command on stderr.
     """
+    PHASES = ('import', 'construct', 'parse', 'handle')
 
     def __init__(self, program_name="", exit=sys.exit):
         self._parser = argparse.ArgumentParser() if not program_name\
             else argparse.ArgumentParser(program_name)
         self._subparsers = self._parser.add_subparsers(dest="subparser_name")
-        self._exit = lambda x, *a, **kw: exit
+        self._exit = exit
+        self._parser.add_argument('--profile', nargs='?', metavar='FILE',
+            dest='_profile', help='profile the command (see --profile-format)')
+        self._parser.add_argument('--profile-format', dest='_profile_format',
+            choices=['pstats', 'callgrind-text', 'json'], default='pstats',
+            help='the format of the profile written to FILE')
+        self._parser.add_argument('--timings', action='store_true',
+            dest='_timings', help='report the time spent in each phase')
+
+        # Maps phase names to the accumulated wall and CPU time.
+        self._phases = collections.OrderedDict(
+            (x, [0.0, 0.0]) for x in self.PHASES)
+
+        #: The dotted paths of the modules holding the registered commands.
+        self.command_modules = []
+
+        # Maps the names of lazily registered commands to a tuple holding
+        # the dotted path to the command class and its placeholder
+        # subparser.
+        self._lazy_commands = {}
 
         # This is a hack. The ArgumentParser invokes its exit() method
         # if the command-parsing failed. But *we* want to decide wether
@@ -35,39 +69,162 @@ class BaseParser(object):
         # Note that the return value is only useful when something else
         # than sys.exit was passed to BaseParser.__init__
         try:
-            self.run(*args, **kwargs)
-            return self._exit(0)
+            return self._exit(self.run(*args, **kwargs) or 0)
         except ParserExit as e:
-            return self._exit(*e.args)
+            status, message = e.args
+            if message:
+                sys.stderr.write(message)
+            return self._exit(status)
 
     def run(self, *args, **kwargs):
         """Execute the command identified by a list holding the command-line
         parameters.
         """
         args = self.parse_args(*args, **kwargs)
-        return args.func(args)
+        if args._profile is None and not args._timings:
+            return args.func(args)
 
-    def register_commands(self, command_list):
+        from libsousou.cli import profiling
+        try:
+            with self._phase('handle'):
+                if args._profile is not None:
+                    return profiling.profile_call(args.func, args,
+                        args._profile, args._profile_format)
+                return args.func(args)
+        finally:
+            if args._timings:
+                sys.stderr.write(profiling.format_timings(self._phases))
+
+    def register_commands(self, command_list, lazy=False, manifest_path=None):
         """Registers commands to the base parser.
 
         Args:
             command_list: a list of strings specifying the dotted
                 path to modules holding commands.
+            lazy: if ``True``, the commands are listed from a cached
+                manifest and only the module of the selected command
+                is imported.
+            manifest_path: the path of the cached manifest; see
+                :func:`libsousou.cli.manifest.load`.
+
+        Returns:
+            None
+        """
+        if not lazy:
+            for module_path in command_list:
+                with self._phase('import'):
+                    Command = import_string(module_path + '.Command')
+                self.add_command(Command)
+            return
+
+        from libsousou.cli import manifest
+        for entry in manifest.load(command_list, manifest_path):
+            self.add_lazy_command(entry['name'], entry['path'],
+                help_text=entry['help'], prog=entry['prog'])
+
+    def register_plugins(self, registry=None, lazy=False):
+        """Registers the commands provided by plugins in the
+        ``libsousou.commands`` entry point group.
+
+        Args:
+            registry: a :class:`~libsousou.plugins.PluginRegistry`;
+                defaults to :data:`libsousou.plugins.registry`.
+            lazy: if ``True``, a plugin is only imported when its
+                command is selected.
 
         Returns:
             None
         """
-        for module_path in command_list:
-            Command = import_string(module_path + '.Command')
-            self.add_command(Command)
+        if registry is None:
+            from libsousou import plugins
+            registry = plugins.registry
+        for plugin in registry.plugins('command'):
+            if lazy:
+                self.add_lazy_command(plugin.name, plugin.path,
+                    help_text=plugin.help)
+            else:
+                self.add_command(import_string(plugin.path))
+
+    def add_lazy_command(self, name, dotted_path, help_text=None, prog=None):
+        """Adds a command to the parser without importing it. The command
+        class is imported, and its arguments are added, when the
+        command is selected on the command line.
+
+        Args:
+            name: the name of the command.
+            dotted_path: the dotted path to the command class.
+            help_text: the help text of the command.
+            prog: the usage information of the command.
+
+        Returns:
+            None
+        """
+        module_path = dotted_path.rsplit('.', 1)[0]
+        if module_path not in self.command_modules:
+            self.command_modules.append(module_path)
+        kwargs = {}
+        if help_text:
+            kwargs['help'] = help_text
+        if prog:
+            kwargs['prog'] = prog
+        subparser = self._subparsers.add_parser(name, **kwargs)
+        self._lazy_commands[name] = (dotted_path, subparser)
 
     def add_command(self, command_class):
         """Adds a command to the parser."""
-        command = command_class()
-        command.add_to_subparsers(self._subparsers)
-
-    def parse_args(self, *args, **kwargs):
-        return self._parser.parse_args(*args, **kwargs)
+        if command_class.__module__ not in self.command_modules:
+            self.command_modules.append(command_class.__module__)
+        with self._phase('construct'):
+            command = command_class()
+            command.add_to_subparsers(self._subparsers)
+
+    def load_commands(self):
+        """Import and add all lazily registered commands."""
+        for name in list(self._lazy_commands):
+            self._load_lazy_command([name])
+
+    def parse_args(self, args=None, namespace=None):
+        args = list(sys.argv[1:] if args is None else args)
+
+        # An argument following --profile would be taken as its value,
+        # even if it is the subcommand; an explicit empty value prevents
+        # this.
+        i = 0
+        while i < len(args) and args[i].startswith('-'):
+            if args[i] == '--profile':
+                args[i] = '--profile='
+            elif args[i] == '--profile-format':
+                i += 1
+            i += 1
+
+        if self._lazy_commands:
+            self._load_lazy_command(args)
+        with self._phase('parse'):
+            return self._parser.parse_args(args, namespace)
+
+    @contextlib.contextmanager
+    def _phase(self, name):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            phase = self._phases[name]
+            phase[0] += time.perf_counter() - wall
+            phase[1] += time.process_time() - cpu
+
+    def _load_lazy_command(self, args):
+        # The first argument naming a lazily registered command selects
+        # it.
+        for arg in args:
+            if arg in self._lazy_commands:
+                break
+        else:
+            return
+        dotted_path, subparser = self._lazy_commands.pop(arg)
+        with self._phase('import'):
+            Command = import_string(dotted_path)
+        with self._phase('construct'):
+            Command().add_to_parser(subparser)
 
 
 parser = BaseParser()
@@ -0,0 +1,130 @@
+"""
+Thin client for :class:`~libsousou.cli.server.CommandServer`. The client
+forwards the command line, environment, working directory and standard
+streams to a running server and exits with the status of the command.
+If no server is running, the command is executed in-process.
+
+Example entry point:
+
+.. code:: python
+
+    from libsousou.cli import client
+
+    def parser_factory():
+        from myapp.cli import parser
+        return parser
+
+    def main():
+        client.main(parser_factory, '/run/myapp/cli.sock')
+
+Only the standard library modules needed to talk to the server are
+imported, so that invocations through a warm server start quickly.
+"""
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+
+from libsousou import fdpass
+
+
+STATUS = struct.Struct('!i')
+
+#: The exit status reported when the connection to the server is lost.
+EXIT_CONNECTION_LOST = 255
+
+
+def connect(socket_path):
+    """Connect to the server listening on `socket_path`. Raises
+    :exc:`OSError` if no server is listening.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+def invoke(sock, argv, env=None, cwd=None, fds=(0, 1, 2)):
+    """Execute a command on the server connected to `sock`.
+
+    Args:
+        sock: a socket returned by :func:`connect`.
+        argv: the command-line arguments, excluding the program name.
+        env: the environment; defaults to :data:`os.environ`.
+        cwd: the working directory; defaults to the current directory.
+        fds: the file descriptors used as stdin, stdout and stderr
+            of the command.
+
+    Returns:
+        int: the exit status of the command.
+    """
+    request = {
+        'argv': list(argv),
+        'prog': sys.argv[0],
+        'env': dict(os.environ if env is None else env),
+        'cwd': cwd or os.getcwd()
+    }
+    fdpass.send_message(sock, json.dumps(request).encode('utf-8'), list(fds))
+    try:
+        pid, = STATUS.unpack(fdpass.recv_exactly(sock, STATUS.size))
+    except EOFError:
+        return EXIT_CONNECTION_LOST
+
+    # Forward interrupts to the process executing the command.
+    def forward(signum, frame):
+        os.kill(pid, signum)
+
+    handlers = {}
+    for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+        handlers[signum] = signal.signal(signum, forward)
+    try:
+        status, = STATUS.unpack(fdpass.recv_exactly(sock, STATUS.size))
+    except EOFError:
+        status = EXIT_CONNECTION_LOST
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+    return status
+
+
+def run(parser_factory, socket_path, argv=None):
+    """Execute a command on the server listening on `socket_path`, or
+    in-process using the parser returned by `parser_factory` if no
+    server is running.
+
+    Returns:
+        int: the exit status of the command.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    try:
+        sock = connect(socket_path)
+    except OSError:
+        parser = parser_factory()
+        try:
+            return parser.run_from_command_line(argv) or 0
+        except SystemExit as e:
+            return exit_status(e.code)
+    with sock:
+        return invoke(sock, argv)
+
+
+def main(parser_factory, socket_path, argv=None):
+    """Like :func:`run`, but exit the interpreter with the exit
+    status of the command.
+    """
+    sys.exit(run(parser_factory, socket_path, argv))
+
+
+def exit_status(code):
+    """Convert the argument of :func:`sys.exit` to an exit status."""
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
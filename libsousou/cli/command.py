@@ -40,8 +40,7 @@ class BaseCommand(metaclass=abc.ABCMeta):
         self._parser = None
 
     def execute(self, args):
-        self.handle(args)
-        return 0
+        return self.handle(args) or 0
 
     @abc.abstractmethod
     def handle(self, args):
@@ -49,17 +48,28 @@ class BaseCommand(metaclass=abc.ABCMeta):
 
         Args:
             args: the parsed command line arguments.
+
+        Returns:
+            int: an optional exit code; ``None`` is considered ``0``.
         """
 
-    def add_to_subparsers(self, subparsers):
-        """Add the command to subparsers."""
-        args = [self.command_name]
+    def get_subparser_kwargs(self):
+        """Return the keyword arguments used to create the subparser."""
         kwargs = {}
         if self.help_text:
             kwargs['help'] = self.help_text
         if self.prog:
             kwargs['prog'] = self.prog
-        self._parser = subparsers.add_parser(*args, **kwargs)
+        return kwargs
+
+    def add_to_subparsers(self, subparsers):
+        """Add the command to subparsers."""
+        self.add_to_parser(subparsers.add_parser(self.command_name,
+            **self.get_subparser_kwargs()))
+
+    def add_to_parser(self, parser):
+        """Add the arguments of the command to an existing (sub)parser."""
+        self._parser = parser
         for arg in self.arguments:
             Argument.add_to_subparser(arg, self._parser)
         self._parser.set_defaults(func=self.execute)
@@ -0,0 +1,227 @@
+"""
+Measures the time it takes to import modules, using the ``-X importtime``
+option of the Python interpreter in a fresh subprocess. Exposes the
+``importtime`` command and a function API that may be used to guard
+startup latency in a test suite.
+"""
+import json
+import os
+import subprocess
+import sys
+
+from libsousou.cli.argument import Argument
+from libsousou.cli.command import BaseCommand
+from libsousou.module_loading import import_string
+
+
+MARKER = 'libsousou.cli.importtime: start'
+
+# Imports the dotted paths passed on the command line. A path may refer
+# to a module or to an attribute of a module. Note that __import__() is
+# used because importlib.import_module() bypasses the interpreter's
+# import timer for the requested module itself.
+SCRIPT = """
+import sys
+sys.stderr.write({marker!r} + chr(10))
+sys.stderr.flush()
+for path in sys.argv[1:]:
+    try:
+        __import__(path)
+    except ImportError:
+        module_path, name = path.rsplit('.', 1)
+        __import__(module_path)
+        getattr(sys.modules[module_path], name)
+""".format(marker=MARKER)
+
+
+class ImportNode(object):
+    """Represents a module in the import tree."""
+
+    def __init__(self, name, self_us, cumulative_us, children=None):
+        self.name = name
+        self.self_us = self_us
+        self.cumulative_us = cumulative_us
+        self.children = children or []
+
+    def walk(self, depth=0):
+        """Yield (depth, node) tuples for this node and its descendants,
+        sorted by cumulative import time.
+        """
+        yield depth, self
+        for child in sort_nodes(self.children):
+            yield from child.walk(depth + 1)
+
+    def as_dict(self):
+        return {
+            'module': self.name,
+            'self_us': self.self_us,
+            'cumulative_us': self.cumulative_us,
+            'children': [x.as_dict() for x in sort_nodes(self.children)]
+        }
+
+
+def sort_nodes(nodes):
+    return sorted(nodes, key=lambda x: x.cumulative_us, reverse=True)
+
+
+def parse(output):
+    """Parse the output of ``python -X importtime`` into a list of
+    :class:`ImportNode` instances, holding the top-level imports.
+    Lines preceding :data:`MARKER` are ignored.
+    """
+    lines = output.splitlines()
+    if MARKER in lines:
+        lines = lines[lines.index(MARKER) + 1:]
+
+    # Modules are printed after the modules they import, with an
+    # indentation of two spaces per level.
+    pending = {}
+    for line in lines:
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        node = ImportNode(name.strip(), int(fields[0]), int(fields[1]),
+            pending.pop(depth + 1, []))
+        pending.setdefault(depth, []).append(node)
+    return sort_nodes(pending.get(0, []))
+
+
+def measure(paths, repeat=1, executable=None):
+    """Import `paths` in a fresh interpreter and return the import tree.
+
+    Args:
+        paths: a list of dotted paths to import.
+        repeat: the number of measurements; the fastest run is returned.
+        executable: the Python interpreter, defaults to
+            :data:`sys.executable`.
+
+    Returns:
+        list: the top-level :class:`ImportNode` instances.
+    """
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(x for x in sys.path if x)
+    best = None
+    for i in range(max(repeat, 1)):
+        p = subprocess.run(
+            [executable or sys.executable, '-X', 'importtime', '-c', SCRIPT]
+                + list(paths),
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+            universal_newlines=True)
+        if p.returncode != 0:
+            raise ImportError("Unable to import {0}:\n{1}".format(
+                ', '.join(paths), p.stderr.split(MARKER)[-1].strip()))
+        nodes = parse(p.stderr)
+        if best is None or total(nodes) < total(best):
+            best = nodes
+    return best
+
+
+def total(nodes):
+    """Return the total import time of `nodes`, in microseconds."""
+    return sum(x.cumulative_us for x in nodes)
+
+
+def format_text(nodes, max_depth=None, min_us=0):
+    """Format the import tree as human-readable text."""
+    lines = ["{0:>10} {1:>10}  {2}".format('self [us]', 'cumul [us]', 'module')]
+    for node in nodes:
+        for depth, child in node.walk():
+            if max_depth is not None and depth > max_depth:
+                continue
+            if child.cumulative_us < min_us:
+                continue
+            lines.append("{0:>10} {1:>10}  {2}{3}".format(
+                child.self_us, child.cumulative_us, '  ' * depth, child.name))
+    lines.append("Total: {0} us".format(total(nodes)))
+    return '\n'.join(lines)
+
+
+def format_json(nodes):
+    """Format the import tree as a JSON document."""
+    return json.dumps({
+        'total_us': total(nodes),
+        'modules': [x.as_dict() for x in nodes]
+    }, indent=2)
+
+
+def compare(nodes, baseline, threshold):
+    """Compare the import tree with a baseline, as written by
+    :func:`format_json`.
+
+    Args:
+        nodes: the import tree.
+        baseline: a dictionary holding the baseline.
+        threshold: the allowed increase of the total import time,
+            as a percentage of the baseline.
+
+    Returns:
+        tuple: a boolean indicating if the import time regressed past
+            `threshold` and a list of (module, baseline, current) tuples
+            for the top-level modules that became slower.
+    """
+    previous = {x['module']: x['cumulative_us'] for x in baseline['modules']}
+    slower = [(x.name, previous[x.name], x.cumulative_us) for x in nodes
+        if x.name in previous and x.cumulative_us > previous[x.name]]
+    limit = baseline['total_us'] * (1 + threshold / 100.0)
+    return total(nodes) > limit, slower
+
+
+class Command(BaseCommand):
+    command_name = 'importtime'
+    help_text = 'Report the import time of modules and registered commands'
+    args = [
+        Argument('paths', nargs='*',
+            help='dotted paths to import'),
+        Argument('--parser', dest='parser_path',
+            help=('dotted path to a BaseParser instance; imports all '
+                  'commands registered on the parser')),
+        Argument('--format', choices=['text', 'json'], default='text',
+            dest='output_format', help='the output format'),
+        Argument('--depth', type=int, default=None,
+            help='only report modules up to this depth'),
+        Argument('--min-time', type=int, default=0, dest='min_us',
+            help='hide modules importing faster than this (us)'),
+        Argument('--repeat', type=int, default=1,
+            help='measure this many times and report the fastest run'),
+        Argument('--baseline',
+            help='a JSON report to compare against'),
+        Argument('--threshold', type=float, default=10.0,
+            help='the allowed regression against the baseline (percent)'),
+        Argument('--save-baseline',
+            help='write the JSON report to this file'),
+    ]
+
+    def handle(self, args):
+        paths = list(args.paths)
+        if args.parser_path:
+            paths.extend(import_string(args.parser_path).command_modules)
+        if not paths:
+            print("No modules to import.", file=sys.stderr)
+            return 2
+
+        nodes = measure(paths, repeat=args.repeat)
+        if args.output_format == 'json':
+            print(format_json(nodes))
+        else:
+            print(format_text(nodes, max_depth=args.depth, min_us=args.min_us))
+
+        if args.save_baseline:
+            with open(args.save_baseline, 'w') as f:
+                f.write(format_json(nodes))
+
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            regressed, slower = compare(nodes, baseline, args.threshold)
+            for name, before, after in slower:
+                print("{0}: {1} us -> {2} us".format(name, before, after),
+                    file=sys.stderr)
+            if regressed:
+                print("Import time regressed: {0} us, baseline {1} us".format(
+                    total(nodes), baseline['total_us']), file=sys.stderr)
+                return 1
+        return 0
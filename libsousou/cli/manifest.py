@@ -0,0 +1,147 @@
+"""
+Maintains a manifest of the commands in a list of command modules, so
+that :class:`~libsousou.cli.baseparser.BaseParser` can list and dispatch
+commands without importing their modules. The manifest records the
+source files of each command module and of the modules of the same
+top-level package loaded along with it, and is regenerated when one of
+them changes.
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+
+from libsousou import plugins
+from libsousou.module_loading import import_string
+
+
+MANIFEST_VERSION = 2
+
+#: The attributes of a command recorded in the manifest.
+ATTRIBUTES = ('command_name', 'help_text', 'prog')
+
+
+def get_default_manifest_path(command_list):
+    """Return the path of the cached manifest for `command_list`."""
+    key = hashlib.sha1('\n'.join([sys.argv[0]] + list(command_list))
+        .encode('utf-8')).hexdigest()
+    return os.path.join(plugins.get_cache_dir(), 'manifests', key + '.json')
+
+
+def build(command_list):
+    """Import the commands in `command_list` and return the manifest
+    entries.
+
+    Args:
+        command_list: a list of strings specifying the dotted path to
+            modules holding commands.
+
+    Returns:
+        list: a list of dictionaries.
+    """
+    entries = []
+    for module_path in command_list:
+        Command = import_string(module_path + '.Command')
+        # Attributes defined as properties are read from an instance.
+        command = Command
+        if any(isinstance(getattr(Command, x), property) for x in ATTRIBUTES):
+            command = Command()
+        entries.append({
+            'name': command.command_name,
+            'help': command.help_text,
+            'prog': command.prog,
+            'path': module_path + '.Command',
+            'files': get_source_files(Command.__module__)
+        })
+    return entries
+
+
+def get_source_files(module_name):
+    """Return a dictionary mapping the source files of the loaded modules
+    in the top-level package of `module_name` to their modification
+    times.
+    """
+    package = module_name.split('.', 1)[0]
+    files = {}
+    for name, module in list(sys.modules.items()):
+        if name != package and not name.startswith(package + '.'):
+            continue
+        filename = getattr(module, '__file__', None)
+        if not filename:
+            continue
+        try:
+            files[filename] = os.stat(filename).st_mtime
+        except (IOError, OSError):
+            continue
+    return files
+
+
+def is_current(entries):
+    """Return a boolean indicating if the source files of the entries
+    are unchanged.
+    """
+    files = {}
+    for entry in entries:
+        files.update(entry['files'])
+    for filename, mtime in files.items():
+        try:
+            if os.stat(filename).st_mtime != mtime:
+                return False
+        except (IOError, OSError):
+            return False
+    return True
+
+
+def read(path, command_list):
+    """Return the entries in the manifest at `path`, or ``None`` if it
+    does not exist or is stale.
+    """
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION\
+    or manifest.get('modules') != list(command_list)\
+    or not is_current(manifest['commands']):
+        return None
+    return manifest['commands']
+
+
+def write(path, command_list, entries):
+    """Atomically write the manifest to `path`. Returns a boolean
+    indicating if the manifest was written.
+    """
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'modules': list(command_list),
+        'commands': entries
+    }
+    dirname = os.path.dirname(path)
+    try:
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.manifest')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(manifest, f)
+            os.replace(tmp, path)
+        except Exception:
+            os.unlink(tmp)
+            raise
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def load(command_list, path=None):
+    """Return the manifest entries for `command_list`, reading them from
+    the cached manifest if it is current, or building and caching them
+    otherwise.
+    """
+    path = path or get_default_manifest_path(command_list)
+    entries = read(path, command_list)
+    if entries is None:
+        entries = build(command_list)
+        write(path, command_list, entries)
+    return entries
@@ -0,0 +1,188 @@
+"""
+Base class for commands that process a stream of input records in
+parallel.
+"""
+import abc
+import multiprocessing
+import signal
+import sys
+import threading
+import time
+
+from libsousou.cli.argument import Argument
+from libsousou.cli.command import BaseCommand
+
+
+# The command instance in a worker process, set by _init_worker().
+_command = None
+
+
+def _init_worker(command):
+    global _command
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _command = command
+
+
+def _handle_item(item):
+    return _command.handle_item(item)
+
+
+class ProgressReporter(object):
+    """Reports the number of processed items and the throughput to a
+    file object.
+    """
+
+    def __init__(self, stream, interval):
+        self.stream = stream
+        self.interval = interval
+        self.count = 0
+        self.started = self.reported = time.time()
+
+    def update(self, n=1):
+        self.count += n
+        if not self.interval:
+            return
+        now = time.time()
+        if now - self.reported >= self.interval:
+            self.reported = now
+            self.report(now)
+
+    def report(self, now=None, final=False):
+        elapsed = (now or time.time()) - self.started
+        self.stream.write("{0}{1} items, {2:.1f} items/s\n".format(
+            'Done: ' if final else '', self.count,
+            self.count / elapsed if elapsed else 0.0))
+        self.stream.flush()
+
+
+class ParallelCommand(BaseCommand):
+    """A command that reads records from standard input or a file and
+    applies :meth:`handle_item` to each of them, optionally in a pool of
+    worker processes. Subclasses must implement :meth:`handle_item`,
+    which is invoked in the worker processes and must therefore be
+    picklable, as must the command instance itself.
+
+    The number of items in flight is bounded, so memory usage does not
+    depend on the size of the input. On ``SIGINT``, no more input is
+    read and the items in flight are finished; a second ``SIGINT``
+    terminates the workers.
+    """
+    default_args = [
+        Argument('--jobs', '-j', type=int, default=1,
+            help='the number of worker processes (default: 1)'),
+        Argument('--chunk-size', type=int, default=64,
+            help='the number of items sent to a worker at once'),
+        Argument('--ordered', action='store_true', default=False,
+            help='write results in input order instead of as they complete'),
+        Argument('--input', '-i', default='-',
+            help='read items from this file instead of standard input'),
+        Argument('--progress', type=float, default=None,
+            help=('report progress on stderr every N seconds; defaults to '
+                  '1 if stderr is a terminal, disabled otherwise')),
+    ]
+
+    #: The maximum number of items in flight, per worker and chunk.
+    backlog_factor = 4
+
+    def __getstate__(self):
+        # The argparse parser is not needed in the worker processes.
+        state = dict(self.__dict__)
+        state['_parser'] = None
+        return state
+
+    @abc.abstractmethod
+    def handle_item(self, item):
+        """Process a single item and return the result. A result of
+        ``None`` is not written to the output.
+        """
+        raise NotImplementedError
+
+    def read_items(self, stream):
+        """Yield the items in the input stream. The default
+        implementation yields lines without the line terminator.
+        """
+        for line in stream:
+            yield line.rstrip('\n')
+
+    def write_result(self, result, stream):
+        """Write a result to the output stream."""
+        if result is not None:
+            stream.write(str(result) + '\n')
+
+    def handle(self, args):
+        interval = args.progress
+        if interval is None:
+            interval = 1.0 if sys.stderr.isatty() else 0
+        progress = ProgressReporter(sys.stderr, interval)
+        stream = sys.stdin if args.input == '-' else open(args.input)
+        try:
+            if args.jobs > 1:
+                interrupted = self._handle_parallel(args, stream, progress)
+            else:
+                interrupted = self._handle_serial(stream, progress)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            sys.stdout.flush()
+        if interval:
+            progress.report(final=True)
+        return 130 if interrupted else 0
+
+    def _handle_serial(self, stream, progress):
+        try:
+            for item in self.read_items(stream):
+                self.write_result(self.handle_item(item), sys.stdout)
+                progress.update()
+        except KeyboardInterrupt:
+            return True
+        return False
+
+    def _handle_parallel(self, args, stream, progress):
+        chunk_size = max(args.chunk_size, 1)
+        slots = threading.Semaphore(
+            max(args.jobs * chunk_size * self.backlog_factor, chunk_size))
+        stopping = threading.Event()
+
+        # The pool consumes the input from a separate thread; the
+        # semaphore blocks it while too many items are in flight.
+        def items():
+            for item in self.read_items(stream):
+                slots.acquire()
+                if stopping.is_set():
+                    return
+                yield item
+
+        # Pool.imap() returns a generator when chunking, which would be
+        # closed by a KeyboardInterrupt, so the first SIGINT only stops
+        # reading the input.
+        def interrupt(signum, frame):
+            if stopping.is_set():
+                raise KeyboardInterrupt
+            sys.stderr.write("Interrupted, finishing items in flight\n")
+            stopping.set()
+            slots.release()
+
+        pool = multiprocessing.Pool(args.jobs, initializer=_init_worker,
+            initargs=(self,))
+        imap = pool.imap if args.ordered else pool.imap_unordered
+        results = imap(_handle_item, items(), chunk_size)
+        handler = None
+        if threading.current_thread() is threading.main_thread():
+            handler = signal.signal(signal.SIGINT, interrupt)
+        try:
+            for result in results:
+                slots.release()
+                self.write_result(result, sys.stdout)
+                progress.update()
+        except BaseException:
+            stopping.set()
+            slots.release()
+            pool.terminate()
+            raise
+        else:
+            pool.close()
+        finally:
+            if handler is not None:
+                signal.signal(signal.SIGINT, handler)
+            pool.join()
+        return stopping.is_set()
@@ -0,0 +1,118 @@
+"""
+Profiling support for :class:`~libsousou.cli.baseparser.BaseParser`. This
+module is only imported when the ``--profile`` or ``--timings`` options
+are given.
+"""
+import cProfile
+import json
+import os
+import pstats
+import sys
+
+
+FORMATS = ('pstats', 'callgrind-text', 'json')
+
+#: The number of functions reported when no output file is given.
+SUMMARY_LIMIT = 30
+
+
+def profile_call(func, args, output=None, output_format='pstats'):
+    """Invoke `func` with `args` under :mod:`cProfile` and write the
+    profile to `output`, or print a summary to stderr if `output`
+    is empty.
+
+    Returns:
+        the return value of `func`.
+    """
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(func, args)
+    finally:
+        write_profile(profile, output, output_format)
+
+
+def write_profile(profile, output, output_format='pstats'):
+    """Write the profile to the file `output` in the specified format."""
+    if not output:
+        stats = pstats.Stats(profile, stream=sys.stderr)
+        stats.sort_stats('cumulative').print_stats(SUMMARY_LIMIT)
+        return
+
+    if output_format == 'pstats':
+        profile.dump_stats(output)
+        return
+
+    stats = pstats.Stats(profile).stats
+    with open(output, 'w') as f:
+        if output_format == 'json':
+            json.dump(to_json(stats), f, indent=2)
+        elif output_format == 'callgrind-text':
+            write_callgrind(stats, f)
+        else:
+            raise ValueError("Unknown profile format: " + output_format)
+
+
+def label(func):
+    filename, lineno, name = func
+    return "{0}:{1}({2})".format(filename, lineno, name)
+
+
+def to_json(stats):
+    """Convert the :attr:`pstats.Stats.stats` dictionary to a
+    JSON-serializable list, sorted by cumulative time.
+    """
+    entries = []
+    for func, (cc, nc, tt, ct, callers) in stats.items():
+        entries.append({
+            'function': label(func),
+            'primitive_calls': cc,
+            'calls': nc,
+            'tottime': tt,
+            'cumtime': ct,
+            'callers': [label(x) for x in callers]
+        })
+    entries.sort(key=lambda x: x['cumtime'], reverse=True)
+    return entries
+
+
+def write_callgrind(stats, f):
+    """Write the :attr:`pstats.Stats.stats` dictionary in the text format
+    read by KCachegrind. Costs are expressed in microseconds.
+    """
+    f.write("version: 1\ncreator: libsousou\nevents: Microseconds\n\n")
+
+    # Invert the callers mapping to obtain the callees of each function.
+    callees = {}
+    for func, (cc, nc, tt, ct, callers) in stats.items():
+        for caller, value in callers.items():
+            callees.setdefault(caller, []).append((func, value))
+
+    for func, (cc, nc, tt, ct, callers) in stats.items():
+        filename, lineno, name = func
+        f.write("fl={0}\nfn={1}\n".format(filename, label(func)))
+        f.write("{0} {1}\n".format(lineno, int(tt * 1e6)))
+        for callee, value in callees.get(func, []):
+            # The caller statistics are (calls, primitive calls, tottime,
+            # cumtime) tuples, or a call count on older versions.
+            calls, cumtime = (value[0], value[3])\
+                if isinstance(value, tuple) else (value, 0)
+            f.write("cfl={0}\ncfn={1}\ncalls={2} {3}\n{4} {5}\n".format(
+                callee[0], label(callee), calls, callee[1], lineno,
+                int(cumtime * 1e6)))
+        f.write("\n")
+
+
+def format_timings(phases):
+    """Format a dictionary mapping phase names to (wall, cpu) tuples,
+    holding seconds, as a table.
+    """
+    lines = ["{0:<12} {1:>10} {2:>10}".format('phase', 'wall [ms]', 'cpu [ms]')]
+    wall_total = cpu_total = 0.0
+    for name, (wall, cpu) in phases.items():
+        wall_total += wall
+        cpu_total += cpu
+        lines.append("{0:<12} {1:>10.3f} {2:>10.3f}".format(
+            name, wall * 1000, cpu * 1000))
+    lines.append("{0:<12} {1:>10.3f} {2:>10.3f}".format(
+        'total', wall_total * 1000, cpu_total * 1000))
+    return os.linesep.join(lines) + os.linesep
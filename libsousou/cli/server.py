@@ -0,0 +1,213 @@
+"""
+Keeps a :class:`~libsousou.cli.baseparser.BaseParser` and its commands
+loaded in a long-running process, which executes command invocations
+received from :mod:`libsousou.cli.client` over a Unix domain socket.
+Every invocation is executed in a forked child, so commands cannot
+affect each other or the server.
+
+The socket is only accessible to the user running the server, and
+connections from processes of other users are rejected where the
+platform reports the credentials of the peer (``SO_PEERCRED``).
+"""
+import json
+import logging
+import os
+import signal
+import socket
+import struct
+import sys
+import traceback
+
+from libsousou import fdpass
+from libsousou.cli.argument import Argument
+from libsousou.cli.client import STATUS
+from libsousou.cli.client import exit_status
+from libsousou.cli.command import BaseCommand
+from libsousou.module_loading import import_string
+from libsousou.process.selector import SelectorProcess
+from libsousou.process.sockets import bind_socket
+
+
+def get_peer_uid(sock):
+    """Return the user id of the process connected to the Unix domain
+    socket `sock`, or ``None`` if the platform does not report it.
+    """
+    if not hasattr(socket, 'SO_PEERCRED'):
+        return None
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+        struct.calcsize('3i'))
+    return struct.unpack('3i', creds)[1]
+
+
+class CommandServer(SelectorProcess):
+    """Serves command invocations for `parser` on `socket_path`.
+
+    Args:
+        parser: a :class:`~libsousou.cli.baseparser.BaseParser`.
+        socket_path: the path of the Unix domain socket.
+        backlog: the size of the accept queue.
+    """
+    logger_name = 'libsousou.cli.server'
+    signals = [signal.SIGCHLD]
+
+    def __init__(self, parser, socket_path, backlog=128, **kwargs):
+        super(CommandServer, self).__init__(**kwargs)
+        self.parser = parser
+        self.socket_path = socket_path
+        self.backlog = backlog
+        self.listener = None
+        self.children = set()
+
+        #: The user id that connecting processes must run as.
+        self.uid = os.getuid()
+
+    def setup(self):
+        # Import and construct all commands so that the children do not
+        # have to.
+        self.parser.load_commands()
+        self.listener = (self.sockets or {}).get('listener')
+        if self.listener is None:
+            self.listener = bind_socket('unix:' + self.socket_path,
+                self.backlog, mode=0o600)
+        self.add_reader(self.listener, self.accept)
+        self.logger.info("Listening on {0}".format(self.socket_path))
+
+    def main_event(self):
+        self.reap_children()
+        self.poll()
+
+    def signal_handler(self, signum, frame):
+        if signum == signal.SIGCHLD:
+            self.wakeup()
+            return
+        super(CommandServer, self).signal_handler(signum, frame)
+
+    def accept(self):
+        """Accept a connection and execute its command in a forked
+        child.
+        """
+        try:
+            conn, _ = self.listener.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        uid = get_peer_uid(conn)
+        if uid is not None and uid != self.uid:
+            self.logger.warning("Rejected a connection from uid {0}".format(
+                uid))
+            conn.close()
+            return
+
+        # Flush buffers so that the child does not write them again.
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            self.handle_connection(conn)
+        conn.close()
+        self.children.add(pid)
+
+    def reap_children(self):
+        """Collect the exit status of finished children."""
+        for pid in list(self.children):
+            try:
+                finished, _ = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                finished = pid
+            if finished:
+                self.children.discard(pid)
+
+    def listening_sockets(self):
+        return {'listener': self.listener} if self.listener else {}
+
+    def stop_accepting(self):
+        # Running commands finish. If the listener was handed off, the
+        # socket path belongs to the replacement server.
+        if self.listener is not None:
+            self.remove_reader(self.listener)
+            self.listener.close()
+            self.listener = None
+            if not self.handoff_path:
+                try:
+                    os.unlink(self.socket_path)
+                except OSError:
+                    pass
+
+    def is_drained(self):
+        self.reap_children()
+        return not self.children
+
+    def handle_connection(self, conn):
+        """Execute the command received on `conn`. Runs in the forked
+        child and never returns.
+        """
+        status = 1
+        try:
+            self.listener.close()
+            for signum in self.signals:
+                signal.signal(signum, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            conn.sendall(STATUS.pack(os.getpid()))
+            payload, fds = fdpass.recv_message(conn, maxfds=3)
+            status = self.execute(json.loads(payload.decode('utf-8')), fds)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                # os._exit() skips the handlers flushed at exit, and the
+                # thread of a queued log is a daemon.
+                self.stop_log_queue()
+                logging.shutdown()
+                sys.stdout.flush()
+                sys.stderr.flush()
+                conn.sendall(STATUS.pack(status))
+            finally:
+                os._exit(0)
+
+    def execute(self, request, fds):
+        """Execute a command in the environment specified by `request`,
+        using `fds` as the standard streams.
+
+        Returns:
+            int: the exit status.
+        """
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        sys.argv = [request.get('prog') or sys.argv[0]] + request['argv']
+        try:
+            status = self.parser.run_from_command_line(request['argv'])
+        except SystemExit as e:
+            return exit_status(e.code)
+        return status if isinstance(status, int) else 0
+
+    def do_cleanup(self, graceful):
+        if self.listener is not None:
+            self.remove_reader(self.listener)
+            self.listener.close()
+            self.listener = None
+            try:
+                os.unlink(self.socket_path)
+            except OSError:
+                pass
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+
+class Command(BaseCommand):
+    command_name = 'serve'
+    help_text = 'Execute commands from a warm interpreter'
+    args = [
+        Argument('parser_path',
+            help='dotted path to the BaseParser instance to serve'),
+        Argument('--socket', dest='socket_path', required=True,
+            help='the path of the Unix domain socket'),
+    ]
+
+    def handle(self, args):
+        CommandServer(import_string(args.parser_path), args.socket_path).start()
@@ -0,0 +1,85 @@
+"""
+Passing of file descriptors between processes over Unix domain sockets,
+using ``SCM_RIGHTS`` ancillary data. This module only depends on the
+standard library modules it uses, so that it is cheap to import.
+"""
+import array
+import socket
+import struct
+
+
+HEADER = struct.Struct('!I')
+
+
+def send_fds(sock, data, fds):
+    """Send `data` over the Unix domain socket `sock`, along with
+    duplicates of the file descriptors `fds`.
+
+    Args:
+        sock: a connected :class:`socket.socket` of the ``AF_UNIX``
+            family.
+        data: a non-empty bytes object.
+        fds: a list of integer file descriptors.
+
+    Returns:
+        int: the number of bytes sent.
+    """
+    ancdata = [(socket.SOL_SOCKET, socket.SCM_RIGHTS, array.array('i', fds))]\
+        if fds else []
+    return sock.sendmsg([data], ancdata)
+
+
+def recv_fds(sock, bufsize, maxfds):
+    """Receive up to `bufsize` bytes and at most `maxfds` file
+    descriptors from the Unix domain socket `sock`.
+
+    Returns:
+        tuple: the data and a list of file descriptors, which are owned
+            by the caller.
+    """
+    fds = array.array('i')
+    data, ancdata, flags, addr = sock.recvmsg(bufsize,
+        socket.CMSG_SPACE(maxfds * fds.itemsize))
+    for level, kind, cdata in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cdata[:len(cdata) - (len(cdata) % fds.itemsize)])
+    return data, list(fds)
+
+
+def recv_exactly(sock, size):
+    """Receive exactly `size` bytes from `sock`. Raises :exc:`EOFError`
+    if the connection was closed before.
+    """
+    buf = bytearray()
+    while len(buf) < size:
+        chunk = sock.recv(size - len(buf))
+        if not chunk:
+            raise EOFError("Connection closed")
+        buf.extend(chunk)
+    return bytes(buf)
+
+
+def send_message(sock, payload, fds=None):
+    """Send a length-prefixed message, optionally passing file
+    descriptors with it.
+    """
+    data = HEADER.pack(len(payload)) + payload
+    sent = send_fds(sock, data, fds or [])
+    if sent < len(data):
+        sock.sendall(data[sent:])
+
+
+def recv_message(sock, maxfds=0):
+    """Receive a message sent with :func:`send_message`.
+
+    Returns:
+        tuple: the payload and a list of file descriptors.
+    """
+    header, fds = recv_fds(sock, HEADER.size, maxfds)\
+        if maxfds else (sock.recv(HEADER.size), [])
+    if not header:
+        raise EOFError("Connection closed")
+    if len(header) < HEADER.size:
+        header += recv_exactly(sock, HEADER.size - len(header))
+    size, = HEADER.unpack(header)
+    return recv_exactly(sock, size), fds
@@ -35,11 +35,15 @@ import importlib
 import os
 import random
 
+from libsousou import plugins
+from libsousou.module_loading import import_string
+
 random = random.SystemRandom()
 UNUSABLE_PASSWORD_PREFIX = '!'  # This will never be a valid encoded hash
 UNUSABLE_PASSWORD_SUFFIX_LENGTH = 40  # number of random chars to add after UNUSABLE_PASSWORD_PREFIX
 HASHERS = None
 PREFERRED_HASHER = None
+PLUGIN_HASHERS = {}
 DEFAULT_HASHER = 'libsousou.hashers.PBKDF2PasswordHasherSHA512'
 PASSWORD_HASHERS = [
     'libsousou.hashers.PBKDF2PasswordHasherSHA512',
@@ -118,11 +122,40 @@ def get_hasher(algorithm='default'):
         try:
             return hashers[algorithm]
         except KeyError:
+            pass
+        try:
+            return get_plugin_hasher(algorithm)
+        except (LookupError, ImportError):
             raise ValueError(
-                "Unknown password hashing algorithm '%s'.".format(algorithm)
+                "Unknown password hashing algorithm '{0}'.".format(algorithm)
             )
 
 
+def get_plugin_hasher(algorithm):
+    """
+    Returns an instance of the hasher provided by the plugin named
+    `algorithm` (see :mod:`libsousou.plugins`). The plugin is imported
+    on first use. The existing plugin index is used as is, and the
+    installed distributions are only scanned if `algorithm` is not
+    listed in it and it is stale.
+    """
+    plugin = plugins.registry.get_indexed('hasher', algorithm)
+    # Instances are cached per plugin, so that a plugin that changed
+    # when the registry was refreshed is imported again.
+    try:
+        return PLUGIN_HASHERS[plugin]
+    except KeyError:
+        pass
+    hasher = import_string(plugin.path)()
+    if hasher.algorithm != algorithm:
+        raise ValueError(
+            "Plugin '{0}' provides a hasher for '{1}'.".format(
+                algorithm, hasher.algorithm)
+        )
+    PLUGIN_HASHERS[plugin] = hasher
+    return hasher
+
+
 def get_hashers():
     hashers = [DEFAULT_HASHER]
     return hashers
@@ -131,8 +164,7 @@ def get_hashers():
 def get_hashers():
     hashers = []
     for hasher_path in PASSWORD_HASHERS:
-        module_name, class_name = hasher_path.rsplit('.', 1)
-        hasher_cls = getattr(importlib.import_module(module_name), class_name)
+        hasher_cls = import_string(hasher_path)
         hasher = hasher_cls()
         assert hasattr(hasher, 'algorithm')
         hashers.append(hasher)
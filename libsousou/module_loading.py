@@ -1,12 +1,123 @@
 import importlib
 import sys
+import threading
+
+
+class ImportStringResolver(object):
+    """Resolves dotted paths to Python objects and caches the outcome,
+    both for successful and failed lookups. The cache is invalidated
+    when :func:`importlib.invalidate_caches` is invoked, so that
+    modules installed at runtime are picked up.
+    """
+
+    def __init__(self):
+        self._resolved = {}
+        self._failed = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, dotted_path):
+        """Return the attribute designated by `dotted_path`, or raise
+        :exc:`ImportError`.
+        """
+        try:
+            return self._resolved[dotted_path]
+        except KeyError:
+            pass
+        try:
+            failure = self._failed[dotted_path]
+        except KeyError:
+            pass
+        else:
+            raise self._make_error(*failure)
+
+        try:
+            value = self._import(dotted_path)
+        except ImportError as e:
+            # Only the details of the failure are cached, since the
+            # exception references the frames of its traceback.
+            with self._lock:
+                self._failed[dotted_path] = (type(e), str(e), e.name, e.path)
+            raise
+        with self._lock:
+            self._resolved[dotted_path] = value
+        return value
+
+    def preload(self, paths):
+        """Resolve all dotted paths in `paths` and return a list
+        containing the paths that could not be imported.
+        """
+        failed = []
+        for dotted_path in paths:
+            try:
+                self.resolve(dotted_path)
+            except ImportError:
+                failed.append(dotted_path)
+        return failed
+
+    def invalidate_caches(self):
+        """Clears the positive and negative result cache."""
+        with self._lock:
+            self._resolved.clear()
+            self._failed.clear()
+
+    def _make_error(self, cls, msg, name, path):
+        # Create a new exception for a cached failure.
+        try:
+            return cls(msg, name=name, path=path)
+        except TypeError:
+            return ImportError(msg, name=name, path=path)
+
+    def _import(self, dotted_path):
+        try:
+            module_path, class_name = dotted_path.rsplit('.', 1)
+        except ValueError as e:
+            msg = "{0} doesn't look like a module path".format(dotted_path)
+            raise ImportError(msg) from e
+
+        module = importlib.import_module(module_path)
+
+        try:
+            return getattr(module, class_name)
+        except AttributeError as e:
+            msg = 'Module "{0}" does not define a "{1}" attribute/class'.format(
+                dotted_path, class_name)
+            raise ImportError(msg) from e
+
+
+class _InvalidationHook(object):
+    """A meta path finder that never finds anything; it is only
+    installed to be notified by :func:`importlib.invalidate_caches`.
+    """
+
+    def __init__(self, resolver):
+        self.resolver = resolver
+
+    def find_spec(self, fullname, path, target=None):
+        return None
+
+    def invalidate_caches(self):
+        self.resolver.invalidate_caches()
+
+
+def _install_hook(resolver):
+    # Replace the hook installed by a previous call, or by a previous
+    # import of this module, e.g. by importlib.reload().
+    sys.meta_path[:] = [x for x in sys.meta_path
+        if not (type(x).__module__ == __name__
+            and type(x).__name__ == '_InvalidationHook')]
+    sys.meta_path.append(_InvalidationHook(resolver))
+
+
+resolver = ImportStringResolver()
+_install_hook(resolver)
 
 
 def import_string(dotted_path):
     """
     Import a dotted module path and return the attribute/class
     designated by the last name in the path. Raise :exc:`ImportError`
-    if the import failed.
+    if the import failed. Results are cached; call
+    :func:`importlib.invalidate_caches` to clear the cache.
 
     Args:
         dotted_path: a string containing the fully-qualified path
@@ -15,17 +126,41 @@ def import_string(dotted_path):
     Returns:
         object: the attribute specified by `dotted_path`.
     """
-    try:
-        module_path, class_name = dotted_path.rsplit('.', 1)
-    except ValueError as e:
-        msg = "{0} doesn't look like a module path".format(dotted_path)
-        raise ImportError(msg) from e
-
-    module = importlib.import_module(module_path)
-
-    try:
-        return getattr(module, class_name)
-    except AttributeError as e:
-        msg = 'Module "{0}" does not define a "{1}" attribute/class'.format(
-            dotted_path, class_name)
-        raise ImportError(msg) from e
+    return resolver.resolve(dotted_path)
+
+
+def preload(paths):
+    """Import all dotted paths in `paths` ahead of time, e.g. in the
+    parent of a pre-forking server so that the children share the
+    imported modules copy-on-write.
+
+    Args:
+        paths: an iterable of dotted paths, as accepted by
+            :func:`import_string`.
+
+    Returns:
+        list: the paths that could not be imported.
+    """
+    return resolver.preload(paths)
+
+
+def get_preload_modules(paths):
+    """Return the names of the modules that must be imported to resolve
+    the dotted paths in `paths`, e.g. for
+    :meth:`multiprocessing.context.BaseContext.set_forkserver_preload`.
+    A path may itself designate a module, so both the path and the
+    module containing its last name are included.
+
+    Args:
+        paths: an iterable of dotted paths, as accepted by
+            :func:`import_string`.
+
+    Returns:
+        list
+    """
+    modules = []
+    for dotted_path in paths:
+        for name in (dotted_path.rsplit('.', 1)[0], dotted_path):
+            if name not in modules:
+                modules.append(name)
+    return modules
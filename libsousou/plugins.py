@@ -0,0 +1,240 @@
+"""
+Discovers plugins (password hashers and command-line commands) through
+package entry points. The result of the discovery is written to an index
+file, which is reused as long as the metadata of the installed
+distributions does not change. Plugins are only imported when they are
+used.
+
+A distribution provides plugins by declaring entry points in the
+``libsousou.hashers`` or ``libsousou.commands`` groups:
+
+.. code:: python
+
+    setup(
+        ...
+        entry_points={
+            'libsousou.hashers': [
+                'bcrypt = myapp.hashers:BCryptPasswordHasher',
+            ],
+            'libsousou.commands': [
+                'migrate = myapp.commands.migrate:Command',
+            ]
+        }
+    )
+
+The name of a hasher entry point must equal the ``algorithm`` of the
+hasher.
+"""
+import collections
+import hashlib
+import json
+import logging
+import os
+import sys
+import tempfile
+
+from libsousou.module_loading import import_string
+
+
+INDEX_VERSION = 1
+
+#: Maps plugin kinds to entry point groups.
+ENTRY_POINT_GROUPS = collections.OrderedDict([
+    ('hasher', 'libsousou.hashers'),
+    ('command', 'libsousou.commands'),
+])
+
+METADATA_SUFFIXES = ('.dist-info', '.egg-info', '.egg-link')
+
+Plugin = collections.namedtuple('Plugin', ['name', 'kind', 'path', 'help'])
+
+logger = logging.getLogger(__name__)
+
+
+def get_cache_dir():
+    """Return the directory holding the caches maintained by
+    :mod:`libsousou`.
+    """
+    cache_dir = os.getenv('XDG_CACHE_HOME')\
+        or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_dir, 'libsousou')
+
+
+def get_default_index_path():
+    """Return the path of the plugin index, which may be specified with
+    the ``LIBSOUSOU_PLUGIN_INDEX`` environment variable.
+    """
+    return os.getenv('LIBSOUSOU_PLUGIN_INDEX')\
+        or os.path.join(get_cache_dir(), 'plugins.json')
+
+
+def get_metadata_key(path=None):
+    """Return a string identifying the set of installed distributions,
+    computed from the modification times of their metadata.
+
+    Args:
+        path: the list of directories to search; defaults to
+            :data:`sys.path`.
+    """
+    h = hashlib.sha1()
+    for dirname in (path if path is not None else sys.path):
+        try:
+            names = os.listdir(dirname or '.')
+        except (IOError, OSError):
+            continue
+        h.update(dirname.encode('utf-8', 'replace'))
+        for name in sorted(names):
+            if not name.endswith(METADATA_SUFFIXES):
+                continue
+            try:
+                mtime = os.stat(os.path.join(dirname or '.', name)).st_mtime
+            except (IOError, OSError):
+                continue
+            h.update('{0}:{1!r}'.format(name, mtime).encode('utf-8', 'replace'))
+    return h.hexdigest()
+
+
+def iter_entry_points(group):
+    """Yield (name, dotted path) tuples for all entry points in `group`."""
+    try:
+        from importlib import metadata
+    except ImportError: # pragma: no cover
+        import pkg_resources
+        for ep in pkg_resources.iter_entry_points(group):
+            yield ep.name, '.'.join([ep.module_name] + list(ep.attrs))
+        return
+
+    eps = metadata.entry_points()
+    eps = eps.select(group=group) if hasattr(eps, 'select')\
+        else eps.get(group, [])
+    for ep in eps:
+        yield ep.name, ep.value.replace(':', '.').strip()
+
+
+def get_help_text(kind, obj):
+    if kind == 'command':
+        return getattr(obj, 'help_text', None) or ''
+    return ((obj.__doc__ or '').strip().splitlines() or [''])[0]
+
+
+class PluginRegistry(object):
+    """Maintains the index of installed plugins.
+
+    Args:
+        index_path: the path of the index file; defaults to the value
+            returned by :func:`get_default_index_path`.
+    """
+
+    def __init__(self, index_path=None):
+        self._index_path = index_path
+        self._plugins = None
+        self._indexed = None
+
+    @property
+    def index_path(self):
+        return self._index_path or get_default_index_path()
+
+    def plugins(self, kind):
+        """Return a list of :class:`Plugin` tuples of the given `kind`."""
+        return [x for x in self._get_plugins() if x.kind == kind]
+
+    def get(self, kind, name):
+        """Return the :class:`Plugin` of the given `kind` and `name`, or
+        raise :exc:`LookupError`.
+        """
+        for plugin in self.plugins(kind):
+            if plugin.name == name:
+                return plugin
+        raise LookupError("No {0} plugin named {1!r}".format(kind, name))
+
+    def get_indexed(self, kind, name):
+        """Like :meth:`get`, but look up the plugins listed in the
+        existing index file first, without checking whether it is stale.
+        Only if the plugin is not listed is the index checked, and the
+        plugins discovered if it is stale; this happens at most once
+        per registry. Suitable for hot paths such as password checks.
+        """
+        plugins = self._plugins
+        if plugins is None:
+            if self._indexed is None:
+                self._indexed = self.read_index() or []
+            for plugin in self._indexed:
+                if plugin.kind == kind and plugin.name == name:
+                    return plugin
+        return self.get(kind, name)
+
+    def load(self, kind, name):
+        """Import and return the plugin of the given `kind` and `name`."""
+        return import_string(self.get(kind, name).path)
+
+    def refresh(self):
+        """Discover the installed plugins and rewrite the index."""
+        self._plugins = self.discover()
+        self._indexed = None
+        self.write_index(get_metadata_key(), self._plugins)
+        return self._plugins
+
+    def discover(self):
+        """Scan the entry points for plugins. This imports every plugin
+        in order to obtain its help text.
+        """
+        plugins = []
+        for kind, group in ENTRY_POINT_GROUPS.items():
+            for name, path in iter_entry_points(group):
+                try:
+                    help_text = get_help_text(kind, import_string(path))
+                except ImportError:
+                    logger.warning("Unable to import plugin {0}".format(path))
+                    help_text = ''
+                plugins.append(Plugin(name, kind, path, help_text))
+        return plugins
+
+    def read_index(self, key=None):
+        """Return the plugins in the index file, or ``None`` if the index
+        does not exist or is stale. Staleness is not checked if `key` is
+        ``None``.
+        """
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if index.get('version') != INDEX_VERSION\
+        or (key is not None and index.get('key') != key):
+            return None
+        return [Plugin(**x) for x in index['plugins']]
+
+    def write_index(self, key, plugins):
+        """Atomically write the index file. Failures are logged and
+        otherwise ignored.
+        """
+        index = {
+            'version': INDEX_VERSION,
+            'key': key,
+            'plugins': [dict(x._asdict()) for x in plugins]
+        }
+        dirname = os.path.dirname(self.index_path)
+        try:
+            os.makedirs(dirname, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=dirname, prefix='.plugins')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(index, f)
+                os.replace(tmp, self.index_path)
+            except Exception:
+                os.unlink(tmp)
+                raise
+        except (IOError, OSError) as e:
+            logger.debug("Unable to write plugin index: {0}".format(e))
+
+    def _get_plugins(self):
+        if self._plugins is None:
+            key = get_metadata_key()
+            self._plugins = self.read_index(key)
+            if self._plugins is None:
+                self._plugins = self.discover()
+                self.write_index(key, self._plugins)
+        return self._plugins
+
+
+registry = PluginRegistry()
@@ -1,2 +1,35 @@
 from libsousou.process.loop import BaseProcess
 from libsousou.process.utils import drop_privileges
+
+import importlib
+
+
+# Imported on first access, since they pull in asyncio, shared memory and
+# other modules that most processes do not need.
+_exports = {
+    'AsyncBaseProcess': 'libsousou.process.aio',
+    'Channel': 'libsousou.process.channel',
+    'LoopGroup': 'libsousou.process.cooperative',
+    'LoopPool': 'libsousou.process.cooperative',
+    'QueuedLogging': 'libsousou.process.logqueue',
+    'SelectorProcess': 'libsousou.process.selector',
+    'Listeners': 'libsousou.process.sockets',
+    'Supervisor': 'libsousou.process.supervisor',
+    'WorkQueueProcess': 'libsousou.process.workqueue',
+}
+
+__all__ = ['BaseProcess', 'drop_privileges'] + sorted(_exports)
+
+
+def __getattr__(name):
+    try:
+        module = _exports[name]
+    except KeyError:
+        raise AttributeError("module {0!r} has no attribute {1!r}".format(
+            __name__, name))
+    value = globals()[name] = getattr(importlib.import_module(module), name)
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,151 @@
+"""
+An :mod:`asyncio` counterpart of :class:`~libsousou.process.loop.BaseProcess`.
+"""
+import asyncio
+import inspect
+import threading
+
+from libsousou.process.loop import BaseProcess
+
+
+async def maybe_await(value):
+    """Await `value` if it is awaitable and return the result."""
+    if inspect.isawaitable(value):
+        return await value
+    return value
+
+
+class AsyncBaseProcess(BaseProcess):
+    """Runs the main event loop on an :mod:`asyncio` event loop. The
+    :meth:`main_event`, :meth:`setup`, :meth:`do_update`,
+    :meth:`do_cleanup` and :meth:`do_exit` hooks may be coroutine
+    functions. While a hook awaits, other tasks on the event loop (for
+    example connections accepted by a server started in :meth:`setup`)
+    keep running.
+
+    :meth:`start` creates and runs a new event loop, so :meth:`as_process`,
+    :meth:`as_thread`, :meth:`start_process` and :meth:`start_threaded`
+    work as for :class:`BaseProcess`. Use :meth:`start_async` to run the
+    process on an existing event loop. Signals are handled with
+    :meth:`asyncio.AbstractEventLoop.add_signal_handler`.
+
+    The main event loop yields to the event loop after every iteration,
+    so other tasks run even when iterations are always due. Without a
+    `framerate`, the default :data:`~libsousou.process.loop.ADAPTIVE`
+    schedule backs off while :meth:`main_event` returns ``False``.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(AsyncBaseProcess, self).__init__(*args, **kwargs)
+        self.loop = None
+        self._async_wakeup = None
+
+    def start(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(self.start_async())
+        finally:
+            try:
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            finally:
+                asyncio.set_event_loop(None)
+                loop.close()
+
+    async def start_async(self):
+        """Run the main event loop on the running event loop."""
+        self.loop = asyncio.get_running_loop()
+        self._async_wakeup = asyncio.Event()
+        try:
+            self._begin_setup()
+            await maybe_await(self.setup())
+            self._end_setup()
+        except Exception:
+            self.logger.exception("FATAL: Exception during setup.")
+            self.stop_log_queue()
+            return
+
+        self.register_signals()
+        self._enter_loop()
+        try:
+            while not self._evnt_exit.is_set():
+                if not await self._run_once_async():
+                    break
+        finally:
+            self.unregister_signals()
+            self._leave_loop()
+
+    async def _run_once_async(self):
+        if self._exiting():
+            await maybe_await(self.do_cleanup(True))
+            await maybe_await(self.do_exit())
+            return False
+
+        if self._needs_update:
+            started = self._begin_update()
+            if started is not None:
+                try:
+                    await maybe_await(self.do_update())
+                except Exception:
+                    self.logger.exception(
+                        "FATAL: Uncaught exception in do_update()!")
+                finally:
+                    self._end_update(started)
+
+        delay = self._time_to_tick()
+        if delay is not None:
+            if delay > 0:
+                await self.wait_async(delay)
+            else:
+                await asyncio.sleep(0)
+            return True
+
+        result = None
+        try:
+            result = await maybe_await(self.main_event())
+        except NotImplementedError:
+            raise
+        except Exception as exception:
+            self._abort_tick()
+            if self.exception_handler(exception):
+                await maybe_await(self.do_cleanup(False))
+                if self.must_exit():
+                    return False
+                raise
+        self._end_tick(result)
+        await asyncio.sleep(0)
+        return True
+
+    async def wait_async(self, timeout):
+        """Wait for at most `timeout` seconds, or until :meth:`stop` or
+        :meth:`update` is invoked, without blocking the event loop.
+        """
+        try:
+            await asyncio.wait_for(self._async_wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._async_wakeup.clear()
+
+    def wakeup(self):
+        super(AsyncBaseProcess, self).wakeup()
+        loop, event = self.loop, self._async_wakeup
+        if loop is None or event is None:
+            return
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError: # The event loop is closed.
+            pass
+
+    def register_signals(self):
+        """Binds signals to :meth:`signal_handler` through the event
+        loop.
+        """
+        if threading.current_thread() is threading.main_thread():
+            for signum in self.signals:
+                self.loop.add_signal_handler(signum, self.signal_handler,
+                    signum, None)
+
+    def unregister_signals(self):
+        if threading.current_thread() is threading.main_thread():
+            for signum in self.signals:
+                self.loop.remove_signal_handler(signum)
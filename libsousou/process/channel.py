@@ -0,0 +1,431 @@
+"""
+Ring buffers in :mod:`multiprocessing.shared_memory` for exchanging byte
+messages between processes without pickling or copying.
+
+A :class:`RingBuffer` has a single consumer and either a single producer
+or, with ``multi_producer=True``, several producers that serialize their
+writes with a lock. Received messages are :class:`memoryview` slices of
+the shared memory; they stay valid until the next :meth:`RingBuffer.recv`
+or :meth:`RingBuffer.release`. A consumer blocks on an ``eventfd`` (or a
+pipe where ``eventfd`` is not available), which producers only signal
+when the consumer has found the buffer empty, so a busy channel performs
+no system calls.
+
+A :class:`Channel` combines two ring buffers into a duplex connection
+between the process that created it and its children (for example a
+:class:`~libsousou.process.loop.BaseProcess` started with
+:meth:`~libsousou.process.loop.BaseProcess.start_process`); each side
+picks the ring buffers to send and receive on by process id. Both
+classes can be passed to children started with any
+:mod:`multiprocessing` start method.
+
+The buffers rely on the total store order of x86-64 processors: the
+consumer sees the stores of a producer in program order, so a message is
+written before the head that publishes it, and the space of a message is
+read before the tail that releases it, without memory barriers. Weakly
+ordered processors (ARM, POWER) would need barriers on both sides, which
+Python does not provide, so :class:`RingBuffer` raises
+:exc:`RuntimeError` on them; the lock of ``multi_producer=True`` only
+orders the producers with each other.
+"""
+import multiprocessing
+import os
+import platform
+import queue
+import select
+import threading
+import time
+from multiprocessing import reduction
+from multiprocessing import shared_memory
+
+
+# The header is accessed as an array of native 64-bit integers, which
+# are read and written with a single instruction, so that a process never
+# sees a partially written value (unlike struct.pack_into(), which clears
+# the destination first). The head (write position) and tail (read
+# position) live on separate cache lines; the consumer sets the waiting
+# flag before it blocks. The data follows the header.
+_HEAD = 0
+_TAIL = 8
+_WAITING = 9
+_DATA = 128
+
+# Marks the end of the data when a message does not fit before the end of
+# the buffer and continues at its start.
+_WRAP = 0xFFFFFFFF
+
+
+# Acquiring an uncontended lock executes an atomic instruction, which
+# orders the preceding stores before the following loads; this is the
+# only reordering that x86-64 allows.
+_fence = threading.Lock()
+
+# The processors with a total store order and atomic 64-bit stores.
+_SUPPORTED = platform.machine().lower() in ('x86_64', 'amd64')
+
+
+class RingBuffer(object):
+    """A circular buffer of length-prefixed byte messages in shared memory.
+
+    Args:
+        capacity: the size of the buffer in bytes; rounded up to a power
+            of two.
+        multi_producer: allow several processes to send concurrently.
+
+    Raises:
+        RuntimeError: if the processor is not an x86-64 processor; see
+            the module documentation.
+    """
+
+    #: The number of seconds a blocking :meth:`recv` polls the buffer
+    #: before it waits for a notification.
+    spin = 0.00005
+
+    def __init__(self, capacity=1 << 20, multi_producer=False):
+        if not _SUPPORTED:
+            raise RuntimeError("RingBuffer requires an x86-64 processor, "
+                "not {0}.".format(platform.machine()))
+        capacity = 1 << max(capacity - 1, 63).bit_length()
+        self._shm = shared_memory.SharedMemory(create=True,
+            size=_DATA + capacity)
+        self._owner = os.getpid()
+        self._lock = multiprocessing.Lock() if multi_producer else None
+        if hasattr(os, 'eventfd'):
+            fd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+            fds = (fd, fd)
+        else:
+            fds = os.pipe()
+            for fd in fds:
+                os.set_blocking(fd, False)
+        self._attach(capacity, fds)
+
+    def _attach(self, capacity, fds):
+        self.capacity = capacity
+        self._mask = capacity - 1
+        self._fds = fds
+        self._header = self._shm.buf[:_DATA].cast('Q')
+        self._data = self._shm.buf[_DATA:]
+        self._lengths = self._data.cast('I')
+        self._pending = 0
+
+        # Local copies of the positions. The producer (or the consumer)
+        # is the only writer of the head (or the tail), so its copy is
+        # exact; the other position is refreshed when needed.
+        self._head = self._header[_HEAD]
+        self._tail = self._header[_TAIL]
+
+    def __reduce__(self):
+        fds = [reduction.DupFd(self._fds[0])]
+        if self._fds[1] != self._fds[0]:
+            fds.append(reduction.DupFd(self._fds[1]))
+        return _rebuild_ring, (self._shm.name, self.capacity, self._owner,
+            self._lock, fds)
+
+    def fileno(self):
+        """Return the file descriptor that becomes readable when a message
+        is available, for use with :mod:`selectors`. The consumer must
+        receive messages until :meth:`recv` raises :exc:`queue.Empty`
+        before it waits for the file descriptor again.
+        """
+        return self._fds[0]
+
+    def send(self, data, block=True, timeout=None):
+        """Copy `data` (a bytes-like object) into the buffer. While the
+        buffer is full, the producer sleeps with an increasing interval.
+
+        Raises:
+            queue.Full: if the buffer is full and `block` is ``False``,
+                or if the buffer is still full after `timeout` seconds.
+            ValueError: if the message exceeds the capacity.
+        """
+        self.send_many((data,), block, timeout)
+
+    def send_many(self, messages, block=True, timeout=None):
+        """Like :meth:`send`, but copy all `messages` and make them
+        visible to the consumer at once, which is considerably faster
+        than sending them one by one. If an exception is raised, the
+        messages preceding the one that could not be sent have been
+        sent.
+        """
+        messages = iter(messages)
+        data = next(messages, None)
+        deadline = None
+        delay = 0.00005
+        while True:
+            if self._lock is None:
+                data = self._write(data, messages, self._head)
+            else:
+                with self._lock:
+                    data = self._write(data, messages, self._header[_HEAD])
+            if data is None:
+                return
+            if not block:
+                raise queue.Full
+            if deadline is None and timeout is not None:
+                deadline = time.monotonic() + timeout
+            if deadline is not None and time.monotonic() >= deadline:
+                raise queue.Full
+            time.sleep(delay)
+            delay = min(delay * 2, 0.01)
+
+    def _write(self, data, messages, head):
+        # Write data and the following messages starting at head, and
+        # return the first message that did not fit, or None.
+        header, lengths, mem = self._header, self._lengths, self._data
+        capacity, mask = self.capacity, self._mask
+        start = head
+        try:
+            while data is not None:
+                n = len(data)
+                size = (n + 11) & ~7
+                if size > capacity:
+                    raise ValueError(
+                        "Message of {0} bytes exceeds the capacity.".format(n))
+                pos = head & mask
+                contiguous = capacity - pos
+                needed = size if size <= contiguous else contiguous + size
+
+                # The tail is only read from the shared memory when the
+                # buffer appears to be full.
+                if head + needed - self._tail > capacity:
+                    self._tail = header[_TAIL]
+                    if head + needed - self._tail > capacity:
+                        break
+                if size > contiguous:
+                    lengths[pos >> 2] = _WRAP
+                    head += contiguous
+                    pos = 0
+                lengths[pos >> 2] = n
+                mem[pos + 4:pos + 4 + n] = data
+                head += size
+                data = next(messages, None)
+        finally:
+            if head != start:
+                self._publish(head)
+        return data
+
+    def _publish(self, head):
+        header = self._header
+        self._head = header[_HEAD] = head
+        with _fence:
+            pass
+        if header[_WAITING]:
+            header[_WAITING] = 0
+            try:
+                if self._fds[0] == self._fds[1]:
+                    os.eventfd_write(self._fds[1], 1)
+                else:
+                    os.write(self._fds[1], b'\0')
+            except BlockingIOError:
+                pass
+
+    def recv(self, block=True, timeout=None):
+        """Return the next message as a :class:`memoryview` of the shared
+        memory. The view must not be used after the next call to
+        :meth:`recv` or :meth:`release`.
+
+        Raises:
+            queue.Empty: if there is no message and `block` is ``False``,
+                or if no message arrived within `timeout` seconds.
+        """
+        self.release()
+        if not block:
+            view = self._next(True)
+            if view is None:
+                raise queue.Empty
+            return view
+
+        # Poll for a short while before asking for a notification, which
+        # costs the producer a system call.
+        now = time.monotonic()
+        spin_until = now + self.spin
+        deadline = None if timeout is None else now + timeout
+        while True:
+            view = self._next(False)
+            if view is not None:
+                return view
+            if time.monotonic() >= spin_until:
+                break
+        while True:
+            view = self._next(True)
+            if view is not None:
+                return view
+            remaining = None
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise queue.Empty
+            select.select([self._fds[0]], [], [], remaining)
+
+    def recv_many(self, limit=None, block=True, timeout=None):
+        """Like :meth:`recv`, but return a list of all messages in the
+        buffer, up to `limit`. The views must not be used after the next
+        call to :meth:`recv` or :meth:`release`.
+        """
+        views = [self.recv(block, timeout)]
+        if limit is None:
+            limit = self.capacity
+        lengths, mem = self._lengths, self._data
+        capacity, mask = self.capacity, self._mask
+        head = self._head = self._header[_HEAD]
+        position = self._tail + self._pending
+        append = views.append
+        for i in range(limit - 1):
+            if position == head:
+                break
+            pos = position & mask
+            n = lengths[pos >> 2]
+            if n == _WRAP:
+                position += capacity - pos
+                pos = 0
+                n = lengths[0]
+            append(mem[pos + 4:pos + 4 + n])
+            position += (n + 11) & ~7
+        self._pending = position - self._tail
+        return views
+
+    def recv_bytes(self, block=True, timeout=None):
+        """Like :meth:`recv`, but return a copy of the message."""
+        data = bytes(self.recv(block, timeout))
+        self.release()
+        return data
+
+    def release(self):
+        """Return the space of the received messages to the producers."""
+        if self._pending:
+            self._tail += self._pending
+            self._pending = 0
+            self._header[_TAIL] = self._tail
+
+    def _next(self, notify):
+        # Return the message following the received ones, or None.
+        header = self._header
+        tail = self._tail + self._pending
+
+        # The head is only read from the shared memory when the buffer
+        # appears to be empty.
+        if tail == self._head:
+            self._head = header[_HEAD]
+            if tail == self._head:
+                if not notify:
+                    return None
+
+                # Ask the producers for a notification, then check again
+                # in case a message arrived in the meantime.
+                self._drain()
+                header[_WAITING] = 1
+                with _fence:
+                    pass
+                self._head = header[_HEAD]
+                if tail == self._head:
+                    return None
+        pos = tail & self._mask
+        n = self._lengths[pos >> 2]
+        if n == _WRAP:
+            self._pending += self.capacity - pos
+            pos = 0
+            n = self._lengths[0]
+        self._pending += (n + 11) & ~7
+        return self._data[pos + 4:pos + 4 + n]
+
+    def _drain(self):
+        try:
+            if self._fds[0] == self._fds[1]:
+                os.eventfd_read(self._fds[0])
+            else:
+                while os.read(self._fds[0], 4096):
+                    pass
+        except BlockingIOError:
+            pass
+
+    def __del__(self):
+        # Release the views, so that the shared memory can be unmapped.
+        if getattr(self, '_header', None) is not None:
+            for view in (self._lengths, self._data, self._header):
+                view.release()
+
+    def close(self):
+        """Detach from the shared memory, and free it if this process
+        created the buffer. Views returned by :meth:`recv` must have been
+        released.
+        """
+        if self._shm is None:
+            return
+        for view in (self._lengths, self._data, self._header):
+            view.release()
+        self._header = self._data = self._lengths = None
+        self._shm.close()
+        if self._owner == os.getpid():
+            self._shm.unlink()
+        for fd in set(self._fds):
+            os.close(fd)
+        self._shm = None
+
+
+def _rebuild_ring(name, capacity, owner, lock, fds):
+    ring = RingBuffer.__new__(RingBuffer)
+    ring._shm = shared_memory.SharedMemory(name=name)
+    ring._owner = owner
+    ring._lock = lock
+    fds = [x.detach() for x in fds]
+    ring._attach(capacity, (fds[0], fds[-1]))
+    return ring
+
+
+class Channel(object):
+    """A duplex message channel between the process that creates it and
+    its children.
+
+    Args:
+        capacity: the capacity of each direction in bytes.
+        multi_producer: allow several children to send to the parent
+            concurrently. Messages from the parent must then be received
+            by a single child.
+    """
+
+    def __init__(self, capacity=1 << 20, multi_producer=False):
+        self._parent = os.getpid()
+        self._downstream = RingBuffer(capacity)
+        self._upstream = RingBuffer(capacity, multi_producer=multi_producer)
+
+    @property
+    def incoming(self):
+        """The :class:`RingBuffer` this process receives from."""
+        return self._upstream if os.getpid() == self._parent\
+            else self._downstream
+
+    @property
+    def outgoing(self):
+        """The :class:`RingBuffer` this process sends to."""
+        return self._downstream if os.getpid() == self._parent\
+            else self._upstream
+
+    def fileno(self):
+        return self.incoming.fileno()
+
+    def send(self, data, block=True, timeout=None):
+        """See :meth:`RingBuffer.send`."""
+        self.outgoing.send(data, block, timeout)
+
+    def send_many(self, messages, block=True, timeout=None):
+        """See :meth:`RingBuffer.send_many`."""
+        self.outgoing.send_many(messages, block, timeout)
+
+    def recv(self, block=True, timeout=None):
+        """See :meth:`RingBuffer.recv`."""
+        return self.incoming.recv(block, timeout)
+
+    def recv_many(self, limit=None, block=True, timeout=None):
+        """See :meth:`RingBuffer.recv_many`."""
+        return self.incoming.recv_many(limit, block, timeout)
+
+    def recv_bytes(self, block=True, timeout=None):
+        """See :meth:`RingBuffer.recv_bytes`."""
+        return self.incoming.recv_bytes(block, timeout)
+
+    def release(self):
+        self.incoming.release()
+
+    def close(self):
+        self._downstream.close()
+        self._upstream.close()
@@ -0,0 +1,289 @@
+"""
+Cooperative scheduling of many :class:`~libsousou.process.loop.BaseProcess`
+instances on one thread, or on a small pool of threads, instead of a
+thread per instance. A thread only wakes up when one of its processes is
+due, so the cost of an idle process is a heap entry rather than an
+operating system thread.
+"""
+import collections
+import heapq
+import itertools
+import logging
+import signal
+import threading
+import time
+
+from libsousou.process.loop import BaseProcess
+
+
+class _Waker(object):
+    # Replaces the wakeup event of a process in a LoopGroup, so that
+    # BaseProcess.wakeup(), and thus stop(), update() and drain(),
+    # reschedule the process in its group.
+    __slots__ = ['group', 'process']
+
+    def __init__(self, group, process):
+        self.group = group
+        self.process = process
+
+    def set(self):
+        self.group._wake(self.process)
+
+    def clear(self):
+        pass
+
+
+class LoopGroup(object):
+    """Runs the main event loops of :class:`~libsousou.process.loop.BaseProcess`
+    instances cooperatively in a single thread. Each process keeps its
+    own schedule (see :class:`~libsousou.process.loop.TickScheduler`);
+    the group runs an iteration or the timers of a process when they are
+    due and otherwise sleeps until the earliest ones are.
+    :meth:`~BaseProcess.stop`, :meth:`~BaseProcess.update` and
+    :meth:`~BaseProcess.drain` take effect immediately, as for a process
+    running in its own thread.
+
+    The group runs until :meth:`stop` or :meth:`join` is invoked, even
+    while it has no processes, so that processes may be added at any
+    time before that; processes can not be added to a stopped group.
+
+    An exception that escapes a process only terminates that process.
+    Since an iteration that blocks delays all other processes in the
+    group, :meth:`~BaseProcess.main_event` must not block. Processes that
+    override :meth:`~BaseProcess.start` or :meth:`~BaseProcess.wait`,
+    such as :class:`~libsousou.process.selector.SelectorProcess`, are not
+    supported, and :attr:`~BaseProcess.stall_budget` is ignored.
+    """
+    logger = logging.getLogger('libsousou.process.cooperative')
+
+    def __init__(self):
+        self.processes = set()
+        self.thread = None
+        self._heap = []
+        self._entries = {}
+        self._pending = collections.deque()
+        self._event = threading.Event()
+        self._sequence = itertools.count()
+        self._signals = set()
+        self._stopped = False
+
+    def __len__(self):
+        return len(self.processes)
+
+    def add(self, process):
+        """Add `process` to the group. It is set up by the thread running
+        the group, which may already be running.
+        """
+        if self._stopped:
+            raise RuntimeError("The group is stopped.")
+        cls = type(process)
+        if cls.start is not BaseProcess.start\
+        or cls.wait is not BaseProcess.wait:
+            raise TypeError(
+                "{0} overrides start() or wait() and can not be run in a "
+                "LoopGroup.".format(cls.__name__))
+        process._evnt_wakeup = _Waker(self, process)
+        process._group = self
+        self.processes.add(process)
+        self._wake(process)
+
+    def start_threaded(self, defer=False, daemon=False):
+        """Arrange for the group to run in a separate thread of control.
+
+        Args:
+            defer (bool): defer starting the thread.
+            daemon (bool): indicates that the thread is a daemon.
+
+        Returns:
+            threading.Thread
+        """
+        thread = threading.Thread(target=self.run, name='loop-group')
+        if daemon:
+            thread.daemon = True
+        if not defer:
+            thread.start()
+        self.thread = thread
+        return thread
+
+    def run(self):
+        """Run the processes in the current thread until the group is
+        stopped and all of them have exited.
+        """
+        heap, pending = self._heap, self._pending
+        clock = time.monotonic
+        try:
+            while True:
+                try:
+                    self._event.clear()
+                    while pending:
+                        process = pending.popleft()
+                        if process in self._entries:
+                            self._step(process)
+                        elif process in self.processes:
+                            self._enter(process)
+                    if self._stopped and not self._entries\
+                    and not pending:
+                        break
+
+                    now = clock()
+                    while heap and heap[0][0] <= now:
+                        due, sequence, process = heapq.heappop(heap)
+                        if self._entries.get(process) == (due, sequence):
+                            self._entries[process] = None
+                            self._step(process)
+
+                    if not pending:
+                        self._event.wait(heap[0][0] - clock()
+                            if heap else None)
+                except KeyboardInterrupt:
+                    self.stop()
+        finally:
+            for process in list(self._entries):
+                self._leave(process)
+
+    def stop(self):
+        """Stop all processes in the group and the group itself."""
+        self._stopped = True
+        for process in list(self.processes):
+            process.stop()
+        self._event.set()
+
+    def join(self):
+        """Stop all processes and wait until the group has exited."""
+        self.stop()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join()
+
+    def signal_handler(self, signum, frame):
+        """Invoke the signal handlers of the processes that handle
+        `signum`.
+        """
+        for process in list(self._entries):
+            if signum not in process.signals:
+                continue
+            try:
+                process.signal_handler(signum, frame)
+            except Exception:
+                self.logger.exception("Uncaught exception in the signal "
+                    "handler of {0!r}".format(process))
+
+    def _wake(self, process):
+        self._pending.append(process)
+        self._event.set()
+
+    def _enter(self, process):
+        try:
+            process._setup()
+        except Exception:
+            process.logger.exception("FATAL: Exception during setup.")
+            process.stop_log_queue()
+            self.processes.discard(process)
+            process._evnt_exit.set()
+            return
+        self._register_signals(process.signals)
+        process.logger.debug("Entering main event loop.")
+        process.start_metrics_dumper()
+        process.scheduler.reset()
+        self._step(process)
+
+    def _step(self, process):
+        if process._evnt_exit.is_set():
+            self._leave(process)
+            return
+        try:
+            alive = process._run_once(block=False)
+        except Exception:
+            process.logger.exception("Uncaught exception in the main event "
+                "loop; removing the process from its group.")
+            alive = False
+        if not alive:
+            self._leave(process)
+            return
+        # Keep the current heap entry of the process if it is still due
+        # at the same time. Otherwise the entry becomes stale and is
+        # skipped when popped; the heap is rebuilt once stale entries
+        # outnumber the live ones by two to one, so that a process that
+        # is woken often does not grow it without bound.
+        due = process.next_due()
+        entry = self._entries.get(process)
+        if entry is not None and entry[0] == due:
+            return
+        entry = self._entries[process] = (due, next(self._sequence))
+        heapq.heappush(self._heap, entry + (process,))
+        if len(self._heap) > 3 * len(self._entries):
+            self._heap[:] = [x + (p,) for p, x in self._entries.items()
+                if x is not None]
+            heapq.heapify(self._heap)
+
+    def _leave(self, process):
+        self._entries.pop(process, None)
+        self.processes.discard(process)
+        process._evnt_exit.set()
+        process.stop_metrics_dumper()
+        process.stop_log_queue()
+
+    def _register_signals(self, signals):
+        if threading.current_thread() is not threading.main_thread():
+            return
+        for signum in signals:
+            if signum not in self._signals:
+                signal.signal(signum, self.signal_handler)
+                self._signals.add(signum)
+
+
+class LoopPool(object):
+    """Distributes processes over `size` :class:`LoopGroup` instances,
+    each running in its own thread. A process is added to the group
+    with the fewest processes. If the pool is started from the main
+    thread, the signals of its processes are routed to all groups.
+
+    Args:
+        size: the number of threads.
+    """
+
+    def __init__(self, size=1):
+        self.groups = [LoopGroup() for i in range(size)]
+        self._started = False
+
+    def __len__(self):
+        return sum(len(x) for x in self.groups)
+
+    def add(self, process):
+        """Add `process` to the least loaded group and return the group.
+        Processes can not be added once the pool is stopped.
+        """
+        group = min(self.groups, key=len)
+        group.add(process)
+        if self._started:
+            self.register_signals(process.signals)
+        return group
+
+    def start(self, daemon=False):
+        """Start the groups in separate threads."""
+        self._started = True
+        for group in self.groups:
+            for process in list(group.processes):
+                self.register_signals(process.signals)
+            group.start_threaded(daemon=daemon)
+
+    def stop(self):
+        """Stop all processes in the pool."""
+        for group in self.groups:
+            group.stop()
+
+    def join(self):
+        """Stop all processes and wait until the groups have exited."""
+        for group in self.groups:
+            group.join()
+
+    def register_signals(self, signals):
+        """Bind `signals` to :meth:`signal_handler`, if invoked from the
+        main thread.
+        """
+        if threading.current_thread() is threading.main_thread():
+            for signum in signals:
+                signal.signal(signum, self.signal_handler)
+
+    def signal_handler(self, signum, frame):
+        for group in self.groups:
+            group.signal_handler(signum, frame)
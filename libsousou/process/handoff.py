@@ -0,0 +1,75 @@
+"""
+Handoff of listening sockets from a draining
+:class:`~libsousou.process.loop.BaseProcess` to its replacement, over a
+Unix domain socket. The replacement invokes :func:`receive_sockets`
+before the old process is signalled to drain; the old process sends its
+sockets with :func:`send_sockets` (see
+:attr:`~libsousou.process.loop.BaseProcess.handoff_path`) and only then
+stops accepting connections, so no connection is refused.
+"""
+import json
+import os
+import socket
+
+from libsousou import fdpass
+
+
+#: The maximum number of sockets in a handoff.
+MAX_SOCKETS = 64
+
+
+def send_sockets(path, sockets, timeout=5.0):
+    """Send `sockets` to the process listening on `path` and wait until
+    it has received them.
+
+    Args:
+        path: the path of the Unix domain socket.
+        sockets: a dictionary mapping names to sockets.
+        timeout: the number of seconds to wait for the receiver.
+    """
+    names = sorted(sockets)
+    payload = json.dumps({'pid': os.getpid(), 'names': names})
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.settimeout(timeout)
+        conn.connect(path)
+        fdpass.send_message(conn, payload.encode('utf-8'),
+            [sockets[x].fileno() for x in names])
+        if not conn.recv(1):
+            raise EOFError("The receiver closed the connection.")
+    finally:
+        conn.close()
+
+
+def receive_sockets(path, timeout=None):
+    """Wait for a process to send its sockets on `path`.
+
+    Args:
+        path: the path of the Unix domain socket.
+        timeout: the number of seconds to wait, or ``None``.
+
+    Returns:
+        dict: a dictionary mapping names to :class:`socket.socket`
+            instances.
+    """
+    if os.path.exists(path):
+        os.unlink(path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        listener.settimeout(timeout)
+        listener.bind(path)
+        listener.listen(1)
+        conn, _ = listener.accept()
+        try:
+            conn.settimeout(timeout)
+            payload, fds = fdpass.recv_message(conn, maxfds=MAX_SOCKETS)
+            names = json.loads(payload.decode('utf-8'))['names']
+            sockets = dict((name, socket.socket(fileno=fd))
+                for name, fd in zip(names, fds))
+            conn.sendall(b'\0')
+        finally:
+            conn.close()
+    finally:
+        listener.close()
+        os.unlink(path)
+    return sockets
@@ -0,0 +1,187 @@
+"""
+Non-blocking logging for the main event loop of
+:class:`~libsousou.process.loop.BaseProcess`. The handlers of a logger
+are moved behind a bounded queue, and a listener thread invokes them, so
+slow disks or syslog daemons do not stall the loop.
+"""
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+
+#: Drop records while the queue is full.
+DROP = 'drop'
+
+#: Block the logging thread while the queue is full.
+BLOCK = 'block'
+
+# The QueuedLogging instances that are started, by logger name.
+_started = {}
+_lock = threading.Lock()
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """A :class:`logging.handlers.QueueHandler` for a bounded queue that
+    applies `policy` when the queue is full: with :data:`DROP`, the
+    record is discarded and counted in :attr:`dropped`; with
+    :data:`BLOCK`, the emitting thread waits for at most `timeout`
+    seconds (indefinitely if ``None``) before the record is dropped.
+    """
+
+    def __init__(self, queue, policy=DROP, timeout=None):
+        super(BoundedQueueHandler, self).__init__(queue)
+        if policy not in (DROP, BLOCK):
+            raise ValueError("Unknown policy: {0}".format(policy))
+        self.policy = policy
+        self.timeout = timeout
+        self.dropped = 0
+
+    def emit(self, record):
+        # Do not format records that will be dropped.
+        if self.policy == DROP and self.queue.full():
+            self.dropped += 1
+            return
+        super(BoundedQueueHandler, self).emit(record)
+
+    def enqueue(self, record):
+        try:
+            if self.policy == BLOCK:
+                self.queue.put(record, timeout=self.timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _QueueListener(logging.handlers.QueueListener):
+
+    def enqueue_sentinel(self):
+        # Wait for room in a full queue instead of raising queue.Full.
+        self.queue.put(self._sentinel)
+
+
+class QueuedLogging(object):
+    """Moves the handlers of `logger` (the root logger by default) behind
+    a :class:`BoundedQueueHandler` and invokes them from a
+    :class:`logging.handlers.QueueListener` thread.
+
+    Instances are shared per logger; see :func:`start`. In a child
+    forked while the queue is in use, the queue and the listener are
+    replaced, since the listener thread does not survive the fork.
+
+    Args:
+        logger: a :class:`logging.Logger`.
+        queue_size: the maximum number of records in the queue.
+        policy: :data:`DROP` or :data:`BLOCK`.
+        timeout: the maximum blocking time with :data:`BLOCK`.
+    """
+    logger = logging.getLogger('libsousou.process.logqueue')
+
+    def __init__(self, logger=None, queue_size=10000, policy=DROP,
+        timeout=None):
+        self.target = logger or logging.getLogger()
+        self.queue_size = queue_size
+        self.handlers = []
+        self.handler = BoundedQueueHandler(queue.Queue(queue_size),
+            policy=policy, timeout=timeout)
+        self.listener = None
+        self.users = 0
+
+    @property
+    def dropped(self):
+        """The number of records that were dropped."""
+        return self.handler.dropped
+
+    def start(self):
+        """Start invoking the handlers of the logger from the listener
+        thread.
+        """
+        if self.listener is not None:
+            return
+        self.handlers = list(self.target.handlers)
+        for handler in self.handlers:
+            self.target.removeHandler(handler)
+        self.target.addHandler(self.handler)
+        self._start_listener()
+
+    def stop(self):
+        """Write the queued records, stop the listener thread and restore
+        the handlers of the logger.
+        """
+        listener, self.listener = self.listener, None
+        if listener is None:
+            return
+        listener.stop()
+        self.target.removeHandler(self.handler)
+        for handler in self.handlers:
+            self.target.addHandler(handler)
+            handler.flush()
+        if self.dropped:
+            self.logger.warning("Dropped {0} log records".format(
+                self.dropped))
+
+    def flush(self, timeout):
+        """Wait at most `timeout` seconds for the listener thread to take
+        the queued records. The lock of the queue is not acquired, so that
+        this method may be invoked from a signal handler.
+        """
+        deadline = time.monotonic() + timeout
+        while self.listener is not None and self.handler.queue.queue\
+        and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _start_listener(self):
+        self.listener = _QueueListener(self.handler.queue,
+            *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def _after_fork(self):
+        # The lock of the queue may have been held by the listener thread,
+        # the records in it are written by the parent, and so are the
+        # users released.
+        self.users = 0
+        if self.listener is not None:
+            self.handler.queue = queue.Queue(self.queue_size)
+            self._start_listener()
+
+
+def start(logger=None, queue_size=10000, policy=DROP, timeout=None):
+    """Start queued logging for `logger` (the root logger by default), or
+    share it if it was already started, and return the
+    :class:`QueuedLogging` instance. Each invocation must be paired with
+    an invocation of :func:`stop`.
+    """
+    logger = logger or logging.getLogger()
+    with _lock:
+        instance = _started.get(logger.name)
+        if instance is None:
+            instance = _started[logger.name] = QueuedLogging(logger,
+                queue_size=queue_size, policy=policy, timeout=timeout)
+            instance.start()
+        instance.users += 1
+    return instance
+
+
+def stop(instance):
+    """Stop `instance` when it is no longer shared."""
+    with _lock:
+        instance.users = max(instance.users - 1, 0)
+        if instance.users > 0:
+            return
+        if _started.get(instance.target.name) is instance:
+            del _started[instance.target.name]
+    instance.stop()
+
+
+def _after_fork_in_child():
+    global _lock
+    _lock = threading.Lock()
+    for instance in list(_started.values()):
+        instance._after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
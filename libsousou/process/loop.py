@@ -2,19 +2,149 @@ import atexit
 import contextlib
 import grp
 import logging
+import math
 import multiprocessing
 import os
 import pwd
+import random
 import signal
+import struct
 import sys
 import threading
 import time
 import warnings
 
+from libsousou.module_loading import get_preload_modules
+from libsousou.module_loading import preload as preload_paths
+from libsousou.process import logqueue
+from libsousou.process.handoff import receive_sockets
+from libsousou.process.handoff import send_sockets
+from libsousou.process.memory import MemoryProfiler
+from libsousou.process.metrics import FORMAT_JSON
+from libsousou.process.metrics import LoopMetrics
+from libsousou.process.metrics import MetricsDumper
+from libsousou.process.timers import TimingWheel
+from libsousou.process.utils import get_rss
+from libsousou.process.watchdog import StallWatchdog
+
 SIGNAL_MAP = dict((k, v) for v, k in reversed(sorted(signal.__dict__.items()))
      if v.startswith('SIG') and not v.startswith('SIG_'))
 
 
+FIXED_RATE = 'fixed-rate'
+BEST_EFFORT = 'best-effort'
+ADAPTIVE = 'adaptive'
+
+OVERRUN_SKIP = 'skip'
+OVERRUN_CATCH_UP = 'catch-up'
+OVERRUN_LOG = 'log'
+
+RELOAD_INLINE = 'inline'
+RELOAD_BACKGROUND = 'background'
+
+# The modules preloaded by the fork server of multiprocessing, which is
+# started once and shared by all processes using the forkserver start
+# method.
+_forkserver_preload = None
+
+
+class TickScheduler(object):
+    """Determines when the next iteration of the main event loop is
+    due. Supports three modes:
+
+    :data:`FIXED_RATE`
+        Iterations start every `interval` seconds. The start of the
+        next iteration is computed from the schedule, so the duration
+        of an iteration does not cause drift. If an iteration overruns
+        its slot, the `overrun` policy applies: :data:`OVERRUN_SKIP`
+        skips the missed slots, :data:`OVERRUN_CATCH_UP` runs them
+        back to back and :data:`OVERRUN_LOG` logs a warning and
+        restarts the schedule at the end of the iteration.
+    :data:`BEST_EFFORT`
+        The next iteration starts `interval` seconds after the previous
+        one finished.
+    :data:`ADAPTIVE`
+        Like :data:`BEST_EFFORT`, but when an iteration reports that
+        there was no work, the waiting period doubles, starting at
+        `min_backoff` and up to `max_backoff` seconds. It is reset as
+        soon as an iteration does work.
+
+    Args:
+        interval: the interval in seconds, or ``None``.
+        mode: the scheduling mode; defaults to :data:`FIXED_RATE` if an
+            `interval` is given and :data:`ADAPTIVE` otherwise.
+        overrun: the overrun policy in :data:`FIXED_RATE` mode.
+        min_backoff: the initial waiting period when idle.
+        max_backoff: the maximum waiting period when idle.
+        logger: the logger used by :data:`OVERRUN_LOG`.
+    """
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, interval=None, mode=None, overrun=OVERRUN_SKIP,
+        min_backoff=0.001, max_backoff=1.0, logger=None):
+        if mode is None:
+            mode = FIXED_RATE if interval else ADAPTIVE
+        if mode == FIXED_RATE and not interval:
+            raise ValueError("The fixed-rate mode requires an interval.")
+        if mode not in (FIXED_RATE, BEST_EFFORT, ADAPTIVE):
+            raise ValueError("Unknown scheduling mode: {0}".format(mode))
+        if overrun not in (OVERRUN_SKIP, OVERRUN_CATCH_UP, OVERRUN_LOG):
+            raise ValueError("Unknown overrun policy: {0}".format(overrun))
+        self.interval = interval or 0.0
+        self.mode = mode
+        self.overrun = overrun
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.logger = logger or logging.getLogger(__name__)
+        self.backoff = 0.0
+        self.next_tick = self.clock()
+
+    def reset(self):
+        """Start the schedule at the current time."""
+        self.next_tick = self.clock()
+        self.backoff = 0.0
+
+    def remaining(self):
+        """Return the number of seconds until the next iteration is due."""
+        return max(0.0, self.next_tick - self.clock())
+
+    def completed(self, ended, idle=False):
+        """Schedule the next iteration.
+
+        Args:
+            ended: the time at which the iteration finished, according
+                to :attr:`clock`.
+            idle: indicates that the iteration had no work to do.
+
+        Returns:
+            bool: ``True`` if the iteration overran its slot in the
+            :data:`FIXED_RATE` mode.
+        """
+        mode = self.mode
+        if mode == FIXED_RATE:
+            self.next_tick += self.interval
+            if self.next_tick >= ended:
+                return False
+            if self.overrun == OVERRUN_SKIP:
+                missed = math.floor((ended - self.next_tick) / self.interval)
+                self.next_tick += (missed + 1) * self.interval
+            elif self.overrun == OVERRUN_LOG:
+                self.logger.warning(
+                    "Main event loop overran its interval by {0:.3f}s".format(
+                        ended - self.next_tick))
+                self.next_tick = ended
+            return True
+
+        if mode == ADAPTIVE:
+            self.backoff = min(max(self.backoff * 2, self.min_backoff),
+                self.max_backoff) if idle else 0.0
+            if self.backoff > self.interval:
+                self.next_tick = ended + self.backoff
+                return False
+        self.next_tick = ended + self.interval
+        return False
+
+
 class BaseProcess(object):
     default_signals = [
         signal.SIGTERM,
@@ -24,6 +154,24 @@ class BaseProcess(object):
     signals = []
     logger_name = None
 
+    #: A list of dotted paths (see :func:`~libsousou.module_loading.import_string`)
+    #: that are imported in the parent before :meth:`start_process` forks,
+    #: so that the child shares them copy-on-write.
+    preload = []
+
+    #: The :mod:`multiprocessing` start method used by
+    #: :meth:`start_process`; ``'fork'``, ``'spawn'``, ``'forkserver'`` or
+    #: ``None`` for the default. With ``'forkserver'``, the modules in
+    #: :attr:`preload` are imported once by the fork server, so each child
+    #: is forked from a process that has them loaded without inheriting
+    #: the threads of the parent. Include the module that defines the
+    #: class in :attr:`preload`; the ``__main__`` module is imported
+    #: again by each child. The fork server is shared by all processes,
+    #: so only the :attr:`preload` of the first one started with
+    #: ``'forkserver'`` takes effect; a warning is logged for the modules
+    #: of later processes that it did not preload.
+    start_method = None
+
     @classmethod
     def as_process(cls, defer=True, args=None, kwargs=None):
         args, kwargs = args or [], kwargs or {}
@@ -36,6 +184,143 @@ class BaseProcess(object):
         p = cls(*args, **kwargs)
         return p.start_threaded(daemon=daemon, defer=defer)
 
+    #: The scheduling mode of the main event loop; see
+    #: :class:`TickScheduler`.
+    schedule = None
+
+    #: The policy if an iteration overruns its interval in the
+    #: :data:`FIXED_RATE` mode; see :class:`TickScheduler`.
+    overrun = OVERRUN_SKIP
+
+    #: The maximum waiting period, in seconds, in the :data:`ADAPTIVE`
+    #: mode.
+    max_idle_sleep = 1.0
+
+    #: Collect :class:`~libsousou.process.metrics.LoopMetrics` in
+    #: :attr:`metrics`. Collecting metrics adds to the cost of every
+    #: iteration of the main event loop, so it is disabled unless this
+    #: or :attr:`metrics_target` is set.
+    collect_metrics = False
+
+    #: Periodically write a snapshot of :attr:`metrics` to this path, or
+    #: to a Unix domain socket if it is of the form ``unix:<path>``.
+    metrics_target = None
+
+    #: The number of seconds between snapshots written to
+    #: :attr:`metrics_target`.
+    metrics_interval = 10.0
+
+    #: The format of the snapshots written to :attr:`metrics_target`;
+    #: ``'json'`` or ``'prometheus'``.
+    metrics_format = FORMAT_JSON
+
+    #: Reset :attr:`metrics` after each snapshot written to
+    #: :attr:`metrics_target`, so that each one covers a single interval.
+    #: Not supported with the ``'prometheus'`` format.
+    metrics_reset = False
+
+    #: How :meth:`update` refreshes the process state. With
+    #: :data:`RELOAD_INLINE`, :meth:`do_update` runs in the main event
+    #: loop. With :data:`RELOAD_BACKGROUND`, :meth:`build_config` runs
+    #: in a separate thread and its result replaces :attr:`config`
+    #: between two iterations of the main event loop, so a slow reload
+    #: does not stall it.
+    reload_mode = RELOAD_INLINE
+
+    #: The maximum number of seconds :meth:`drain` waits for
+    #: :meth:`is_drained` before the main event loop exits.
+    drain_timeout = 30.0
+
+    #: The path of a Unix domain socket on which a replacement process
+    #: waits (see :func:`~libsousou.process.handoff.receive_sockets`)
+    #: for the sockets returned by :meth:`listening_sockets` when the
+    #: process starts draining.
+    handoff_path = None
+
+    #: If an iteration of the main event loop runs for longer than this
+    #: number of seconds, sample the stack of the loop thread until it
+    #: ends and report the samples as folded stacks; see
+    #: :class:`~libsousou.process.watchdog.StallWatchdog`.
+    stall_budget = None
+
+    #: The number of stack samples per second during a stall.
+    stall_sample_rate = 100
+
+    #: Append stall reports to this file instead of logging them.
+    stall_report_path = None
+
+    #: The resolution, in seconds, of the timers scheduled with
+    #: :meth:`call_at`, :meth:`call_later` and :meth:`call_every`.
+    timer_resolution = 0.001
+
+    #: Recycle the process (see :meth:`recycle`) after this number of
+    #: calls to :meth:`main_event` that did not return ``False``, plus
+    #: a random number of calls up to :attr:`max_events_jitter`.
+    max_events = None
+    max_events_jitter = 0
+
+    #: Recycle the process after it ran for this number of seconds, plus
+    #: a random number of seconds up to :attr:`max_lifetime_jitter`, so
+    #: that processes started together are not recycled together.
+    max_lifetime = None
+    max_lifetime_jitter = 0.0
+
+    #: Recycle the process when its resident set size exceeds this
+    #: number of bytes. It is checked every :attr:`rss_check_interval`
+    #: seconds.
+    max_rss = None
+    rss_check_interval = 10.0
+
+    #: A file descriptor on which :meth:`recycle` asks a
+    #: :class:`~libsousou.process.supervisor.Supervisor` to start a
+    #: replacement; set by the supervisor.
+    supervisor_fd = None
+
+    #: The path of a Unix domain socket on which the process waits for
+    #: its listening sockets during setup (see :meth:`setup_sockets`),
+    #: for example sent by :meth:`~libsousou.process.sockets.Listeners.send`
+    #: or by a draining process with :attr:`handoff_path`.
+    sockets_path = None
+
+    #: Write log records to the handlers of the root logger from a
+    #: separate thread, through a queue of at most :attr:`log_queue_size`
+    #: records (see :class:`~libsousou.process.logqueue.QueuedLogging`),
+    #: so that slow handlers do not stall the main event loop. When the
+    #: queue is full, records are dropped with
+    #: :data:`~libsousou.process.logqueue.DROP`, or the logging thread
+    #: waits for at most :attr:`log_queue_timeout` seconds with
+    #: :data:`~libsousou.process.logqueue.BLOCK`.
+    queued_logging = False
+    log_queue_size = 10000
+    log_queue_policy = logqueue.DROP
+    log_queue_timeout = None
+
+    #: A signal, such as ``signal.SIGUSR1``, that starts tracing memory
+    #: allocations and takes a snapshot, or reports the allocations that
+    #: grew since that snapshot and stops tracing; see
+    #: :class:`~libsousou.process.memory.MemoryProfiler`. Snapshots are
+    #: taken in a separate thread, but the main event loop pauses while
+    #: one is taken; see the module documentation.
+    memory_signal = None
+
+    #: A directory in which memory snapshots and reports are written;
+    #: reports are logged if it is not set.
+    memory_report_path = None
+
+    #: The number of differences in a memory report, and how they are
+    #: grouped: by ``'filename'``, ``'lineno'`` or ``'traceback'`` of
+    #: :attr:`memory_frames` frames.
+    memory_report_limit = 25
+    memory_key_type = 'lineno'
+    memory_frames = 1
+
+    #: The attributes that are set to ``None`` when the process is
+    #: pickled for the spawn or forkserver start methods, such as threads.
+    #: Each class lists its own attributes, and recreates them in
+    #: ``__setstate__()`` if the child needs them.
+    _transient = ('_group', '_reload_thread', '_metrics_dumper', '_watchdog',
+        '_log_queue', '_memory_profiler', 'thread', 'process')
+
     def __init__(self, suppress_exceptions=False, framerate=None):
         """Initialize a new :class:`BaseProcess` instance.
 
@@ -43,44 +328,199 @@ class BaseProcess(object):
             suppress_exceptions (bool): indicates if exceptions are to be
                 suppressed. Default is False, meaning that exceptions will
                 be raised after cleaning up.
-            framerate: specifies a waiting period after finished one
-                event loop.
+            framerate: specifies the interval, in seconds, between
+                iterations of the main event loop. Its exact meaning
+                depends on :attr:`schedule`.
         """
         self._needs_update = True
         self._must_exit = False
         self._suppress_exceptions = suppress_exceptions
         self._framerate = framerate
         self._evnt_exit = threading.Event()
+        self._evnt_wakeup = threading.Event()
+        self.scheduler = TickScheduler(framerate, mode=self.schedule,
+            overrun=self.overrun, max_backoff=self.max_idle_sleep)
         self.signals = tuple(
             set(list(self.signals) + list(self.default_signals)))
+        if self.memory_signal is not None:
+            self.signals = tuple(set(self.signals + (self.memory_signal,)))
 
         # The execution time of the last event loop.
         self.previous_execution_time = 1
+        self.metrics = None
+        self._metrics_dumper = None
+
+        # The configuration built by build_config(), and the state of
+        # reloading it in the background.
+        self.config = None
+        self._reload_lock = threading.Lock()
+        self._reload_thread = None
+        self._reload_again = False
+        self._next_config = None
+        self._drain_deadline = None
+        self._accepting = True
+        self._tick_started = None
+        self._watchdog = None
+        self._spawned = None
+
+        # The LoopGroup hosting the process, if any; see
+        # libsousou.process.cooperative.
+        self._group = None
+        self.timers = TimingWheel(self.timer_resolution,
+            clock=self.scheduler.clock)
+        self._events_left = None
+        self._recycling = False
+        self._log_queue = None
+        self._memory_profiler = None
+
+        # A dictionary mapping names to listening sockets.
+        self.sockets = None
         self.pid = os.getpid()
         self.thread = None
         self.process = None
 
     def _setup(self):
+        self._begin_setup()
+        self.setup()
+        self._end_setup()
+
+    def _begin_setup(self):
+        # The steps of _setup() before and after the setup() hook, shared
+        # with AsyncBaseProcess.
+        # CLOCK_MONOTONIC is system-wide, so the time at which the
+        # parent started the process can be compared in the child.
+        self._init_metrics()
+        if self._spawned is not None and self.pid != os.getpid() \
+                and self.metrics is not None:
+            self.metrics.record_spawn(time.monotonic() - self._spawned)
         self.logger = logging.getLogger(self.logger_name or '__main__')
         self.setup_logging()
+        self.start_log_queue()
         self.logger.debug("Initializing main event loop.")
-        self.setup()
+        self.setup_sockets()
+
+    def _init_metrics(self):
+        # Metrics are created once the process starts, so that
+        # collect_metrics and metrics_target may be set on the instance.
+        if self.metrics is None \
+                and (self.collect_metrics or self.metrics_target):
+            self.metrics = LoopMetrics()
+
+    def _end_setup(self):
+        self.config = self.build_config()
         self._needs_update = False
+        self.setup_recycling()
         self.logger.debug("Initialization completed.")
 
     def setup(self):
         """Hook to set up the process state."""
         pass
 
+    def setup_sockets(self):
+        """Hook invoked before :meth:`setup` that provides :attr:`sockets`.
+        Unless they were already provided, for example by a
+        :class:`~libsousou.process.supervisor.Supervisor`, the default
+        implementation receives them on :attr:`sockets_path`.
+        """
+        if self.sockets_path and self.sockets is None:
+            self.logger.info("Waiting for sockets on {0}".format(
+                self.sockets_path))
+            self.sockets = receive_sockets(self.sockets_path)
+
+    def build_config(self):
+        """Hook that returns the configuration of the process, which is
+        available as :attr:`config`. Invoked after :meth:`setup` and, if
+        :attr:`reload_mode` is :data:`RELOAD_BACKGROUND`, in a separate
+        thread when :meth:`update` is invoked. The returned object is
+        shared between threads and must not be modified; use for example
+        a :func:`~collections.namedtuple` or a
+        :class:`types.MappingProxyType`.
+        """
+        return None
+
+    def config_changed(self, previous):
+        """Hook invoked from the main event loop after :attr:`config`
+        was replaced by a configuration built in the background.
+
+        Args:
+            previous: the previous configuration.
+        """
+        pass
+
+    def setup_recycling(self):
+        """Arm the recycling policies configured by :attr:`max_events`,
+        :attr:`max_lifetime` and :attr:`max_rss`.
+        """
+        if self.max_events:
+            self._events_left = self.max_events\
+                + random.randint(0, self.max_events_jitter)
+        if self.max_lifetime:
+            self.call_later(self.max_lifetime
+                + random.uniform(0, self.max_lifetime_jitter),
+                self.recycle, "maximum lifetime reached")
+        if self.max_rss:
+            self.call_every(self.rss_check_interval, self.check_rss)
+
+    def check_rss(self):
+        """Recycle the process if its resident set size exceeds
+        :attr:`max_rss`.
+        """
+        rss = get_rss()
+        if rss is not None and rss > self.max_rss:
+            self.recycle("resident set size of {0} bytes exceeds {1}"\
+                .format(rss, self.max_rss))
+
+    def recycle(self, reason):
+        """Exit gracefully so that a new process replaces this one. If
+        the process is supervised (see :attr:`supervisor_fd`), ask the
+        supervisor to start a replacement, which then signals this
+        process to drain; otherwise, or if the supervisor does not
+        respond within :attr:`drain_timeout` seconds, drain immediately.
+        """
+        if self._recycling:
+            return
+        self._recycling = True
+        self.logger.info("Recycling: {0}".format(reason))
+        if self.supervisor_fd is None:
+            self.drain()
+            return
+        try:
+            os.write(self.supervisor_fd, struct.pack('=I', os.getpid()))
+        except OSError as e:
+            self.logger.warning("Unable to notify the supervisor: {0}"\
+                .format(e))
+            self.drain()
+        else:
+            self.call_later(self.drain_timeout, self.drain)
+
     def setup_logging(self):
         """Hook to setup logging."""
         pass
 
+    def start_log_queue(self):
+        """Start writing log records from a separate thread if
+        :attr:`queued_logging` is set. Invoked after :meth:`setup_logging`.
+        """
+        if self.queued_logging and self._log_queue is None:
+            self._log_queue = logqueue.start(
+                queue_size=self.log_queue_size,
+                policy=self.log_queue_policy,
+                timeout=self.log_queue_timeout)
+
+    def stop_log_queue(self):
+        """Write the queued log records and stop the logging thread."""
+        log_queue, self._log_queue = self._log_queue, None
+        if log_queue is not None:
+            logqueue.stop(log_queue)
+
     def register_signals(self):
         """Binds signals to the :meth:`BaseProcess.signal_handler`
-        method.
+        method, if invoked from the main thread. In a child forked from
+        another thread, such as a worker of a
+        :class:`~libsousou.process.supervisor.Supervisor` running in a
+        thread, the forking thread is the main thread.
         """
-        if isinstance(threading.current_thread(), threading._MainThread):
+        if threading.current_thread() is threading.main_thread():
             for signum in self.signals:
                 signal.signal(signum, self.signal_handler)
 
@@ -112,7 +552,7 @@ class BaseProcess(object):
 
     def start_process(self, defer=False):
         """Arrange for the main event loop to be started in a separate
-        process.
+        process, using :attr:`start_method`.
 
         Args:
             defer (boolean): defer starting the main event loop.
@@ -120,12 +560,62 @@ class BaseProcess(object):
         Returns:
             multiprocessing.Process
         """
-        process = multiprocessing.Process(target=self.start)
+        context = multiprocessing.get_context(self.start_method)
+        method = context.get_start_method()
+        if method == 'forkserver':
+            self._set_forkserver_preload(context)
+        elif method == 'fork':
+            self.preload_modules()
+        process = context.Process(target=self.start)
         if not defer:
+            # The child records the time until it starts its setup, and
+            # the parent the time it spent starting the child.
+            self._init_metrics()
+            self._spawned = time.monotonic()
             process.start()
+            if self.metrics is not None:
+                self.metrics.record_spawn(time.monotonic() - self._spawned)
         self.pid = process.pid
         return process
 
+    def _set_forkserver_preload(self, context):
+        global _forkserver_preload
+        modules = get_preload_modules(self.preload)
+        if _forkserver_preload is None:
+            _forkserver_preload = modules
+            context.set_forkserver_preload(modules)
+            return
+        missing = [x for x in modules if x not in _forkserver_preload]
+        if missing:
+            logging.getLogger(self.logger_name or '__main__').warning(
+                "The fork server is already running; not preloaded: "
+                "{0}".format(', '.join(missing)))
+
+    def preload_modules(self):
+        """Import the dotted paths specified by :attr:`preload`."""
+        failed = preload_paths(self.preload)
+        if failed:
+            logging.getLogger(self.logger_name or '__main__').warning(
+                "Unable to preload: {0}".format(', '.join(failed)))
+
+    def __getstate__(self):
+        # Invoked when the process is started with the spawn or
+        # forkserver start method. Synchronization primitives and threads
+        # can not be pickled; the child creates its own.
+        state = self.__dict__.copy()
+        for name in ('_evnt_exit', '_evnt_wakeup', '_reload_lock'):
+            del state[name]
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('_transient', ()):
+                state[name] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._evnt_exit = threading.Event()
+        self._evnt_wakeup = threading.Event()
+        self._reload_lock = threading.Lock()
+
     def start(self):
         """Enter the process main loop and execute the
         :func:`BaseProcess.main_event`.
@@ -135,6 +625,7 @@ class BaseProcess(object):
             self._setup()
         except Exception as e:
             self.logger.exception("FATAL: Exception during setup.")
+            self.stop_log_queue()
             return
         logger = self.logger
 
@@ -142,50 +633,232 @@ class BaseProcess(object):
         # register_signals().
         self.register_signals()
 
-        exception = None
-        self.logger.debug("Entering main event loop.")
-        while True:
-            if self._evnt_exit.is_set():
-                break
-
-            started = time.time()
-            try:
-                # Check if we need to exit and if so bail out
-                # immediately.
-                if self.must_exit():
-                    logger.debug("Cleaning up and exiting")
-                    self.do_cleanup(True)
-                    self.do_exit()
+        self._enter_loop()
+        try:
+            while True:
+                if self._evnt_exit.is_set():
                     break
 
-                # if the update() method has been called,
-                # refresh the state of the process.
-                if self._needs_update:
-                    self._do_update()
-
                 try:
-                    started = time.time()
-                    self.main_event()
-                    ended = time.time()
-                    self.previous_execution_time = ended - started
-                except NotImplementedError:
+                    if not self._run_once():
+                        break
+                except KeyboardInterrupt:
+                    self._evnt_exit.set()
+                    self.join()
+                except Exception:
+                    self._evnt_exit.set()
                     raise
-                except Exception as exception:
-                    if self.exception_handler(exception):
-                        self.do_cleanup(False)
-                        if self.must_exit(): # Don't raise if we must exit.
-                            break
-                        raise
-            except KeyboardInterrupt:
-                self._evnt_exit.set()
-                self.join()
-            except Exception:
-                self._evnt_exit.set()
-                raise
+        finally:
+            self._leave_loop()
 
+    def _enter_loop(self):
+        self.logger.debug("Entering main event loop.")
+        self.start_metrics_dumper()
+        self.start_watchdog()
+        self.scheduler.reset()
+
+    def _leave_loop(self):
         self._evnt_exit.set()
+        self.stop_metrics_dumper()
+        self.stop_watchdog()
+        self.stop_log_queue()
+
+    def toggle_memory_profiler(self):
+        """Start tracing memory allocations or write a report of the
+        allocations that grew since tracing started; see
+        :attr:`memory_signal`.
+
+        Returns:
+            threading.Thread: the thread taking the snapshot.
+        """
+        if self._memory_profiler is None:
+            self._memory_profiler = MemoryProfiler(
+                path=self.memory_report_path,
+                limit=self.memory_report_limit,
+                key_type=self.memory_key_type,
+                frames=self.memory_frames)
+        return self._memory_profiler.toggle()
+
+    def start_metrics_dumper(self):
+        """Start writing snapshots of :attr:`metrics` to
+        :attr:`metrics_target`, if it is set.
+        """
+        if self.metrics_target and self.metrics is not None \
+                and self._metrics_dumper is None:
+            self._metrics_dumper = MetricsDumper(self.metrics,
+                self.metrics_target, interval=self.metrics_interval,
+                format=self.metrics_format, reset=self.metrics_reset)
+            self._metrics_dumper.start()
+
+    def stop_metrics_dumper(self):
+        dumper, self._metrics_dumper = self._metrics_dumper, None
+        if dumper is not None:
+            dumper.stop()
+
+    def start_watchdog(self):
+        """Start watching the main event loop, running in the current
+        thread, for stalls if :attr:`stall_budget` is set.
+        """
+        if self.stall_budget and self._watchdog is None:
+            self._watchdog = StallWatchdog(self, threading.get_ident(),
+                self.stall_budget, rate=self.stall_sample_rate,
+                path=self.stall_report_path)
+            self._watchdog.start()
+
+    def stop_watchdog(self):
+        watchdog, self._watchdog = self._watchdog, None
+        if watchdog is not None:
+            watchdog.stop()
+
+    def _run_once(self, block=True):
+        # Returns False if the main event loop must exit. If `block` is
+        # False and no iteration is due, return instead of waiting for
+        # it, so that a LoopGroup can run other processes meanwhile.
+        if self._exiting():
+            self.do_cleanup(True)
+            self.do_exit()
+            return False
+
+        # if the update() method has been called, refresh the state of
+        # the process.
+        if self._needs_update:
+            self._do_update()
+
+        # Wait until the next timer or iteration is due, or until stop()
+        # or update() is invoked.
+        delay = self._time_to_tick()
+        if delay is not None:
+            if block and delay > 0:
+                self.wait(delay)
+            return True
+
+        result = None
+        try:
+            result = self.main_event()
+        except NotImplementedError:
+            raise
+        except Exception as exception:
+            self._abort_tick()
+            if self.exception_handler(exception):
+                self.do_cleanup(False)
+                if self.must_exit(): # Don't raise if we must exit.
+                    return False
+                raise
+        self._end_tick(result)
+        return True
+
+    # The steps of an iteration of the main event loop around the hooks,
+    # shared with AsyncBaseProcess.
+
+    def _exiting(self):
+        # Return True if the main event loop must exit.
+        if self._drain_deadline is not None:
+            self._check_drain()
+        if not self.must_exit():
+            return False
+        self.logger.debug("Cleaning up and exiting")
+        return True
+
+    def _time_to_tick(self):
+        # Swap in a configuration reloaded in the background and fire the
+        # timers that are due. If an iteration is due, start it and return
+        # None, or else return the number of seconds until it or the next
+        # timer is due.
+        if self._next_config is not None:
+            self._swap_config()
+        timers = self.timers
+        if timers.count:
+            timers.run()
+        now = self.scheduler.clock()
+        remaining = self.scheduler.next_tick - now
+        if remaining <= 0:
+            self._tick_started = now
+            return None
+        if timers.count:
+            remaining = min(remaining, timers.next_due() - now)
+        if self._drain_deadline is not None:
+            remaining = min(remaining, self._drain_deadline - now)
+        return remaining
+
+    def _abort_tick(self):
+        self._tick_started = None
+        if self.metrics is not None:
+            self.metrics.exceptions += 1
+
+    def _end_tick(self, result):
+        # _tick_started may have been moved forward by the time spent
+        # waiting within the iteration; see SelectorProcess.poll().
+        started, self._tick_started = self._tick_started, None
+        scheduler = self.scheduler
+        ended = scheduler.clock()
+        duration = self.previous_execution_time = ended - started
+        overrun = scheduler.completed(ended, result is False)
+        if self.metrics is not None:
+            self.metrics.record_tick(duration, overrun)
+        if self._events_left is not None and result is not False:
+            self._events_left -= 1
+            if self._events_left <= 0:
+                self._events_left = None
+                self.recycle("maximum number of events reached")
+
+    def call_at(self, when, callback, *args):
+        """Invoke ``callback(*args)`` from the main event loop at `when`,
+        according to ``scheduler.clock``. Timers must be scheduled and
+        cancelled from the thread running the main event loop.
+
+        Returns:
+            Timer: a handle that may be used to cancel the call.
+        """
+        return self.timers.call_at(when, callback, *args)
+
+    def call_later(self, delay, callback, *args):
+        """Invoke ``callback(*args)`` from the main event loop after
+        `delay` seconds; see :meth:`call_at`.
+        """
+        return self.timers.call_later(delay, callback, *args)
+
+    def call_every(self, interval, callback, *args):
+        """Invoke ``callback(*args)`` from the main event loop every
+        `interval` seconds until the timer is cancelled; see
+        :meth:`call_at`.
+        """
+        return self.timers.call_every(interval, callback, *args)
+
+    def cancel(self, timer):
+        """Cancel a timer returned by :meth:`call_at`, :meth:`call_later`
+        or :meth:`call_every`.
+        """
+        timer.cancel()
+
+    def next_due(self):
+        """Return the time, according to ``scheduler.clock``, at which
+        the next iteration of the main event loop or the next timer is
+        due.
+        """
+        due = self.scheduler.next_tick
+        if self.timers.count:
+            due = min(due, self.timers.next_due())
+        if self._drain_deadline is not None:
+            due = min(due, self._drain_deadline)
+        return due
+
+    def wait(self, timeout):
+        """Block for at most `timeout` seconds, or until :meth:`stop`
+        or :meth:`update` is invoked.
+        """
+        self._evnt_wakeup.wait(timeout)
+        self._evnt_wakeup.clear()
+
+    def wakeup(self):
+        """Interrupt :meth:`wait`."""
+        self._evnt_wakeup.set()
 
     def main_event(self):
+        """Hook that executes one iteration of the main event loop. May
+        return ``False`` to indicate that there was no work to do, which
+        causes the loop to back off in the :data:`ADAPTIVE` scheduling
+        mode.
+        """
         raise NotImplementedError
 
     def must_exit(self):
@@ -198,29 +871,155 @@ class BaseProcess(object):
         """Indicates that :meth:`BaseProcess.do_update`
         should be called."""
         self._needs_update = True
+        self.wakeup()
 
     def stop(self):
         self._must_exit = True
+        self.wakeup()
 
     def join(self):
         """Gracefully exits the process."""
         self.logger.info("Gracefully exiting main event loop")
         self.stop()
-        if self.thread:
+        if self.thread and self.thread is not threading.current_thread():
             self.thread.join()
 
+    @property
+    def draining(self):
+        """Indicates that :meth:`drain` was invoked."""
+        return self._drain_deadline is not None
+
+    def drain(self, timeout=None):
+        """Stop accepting new work and exit the main event loop once
+        the work in progress is finished, or after `timeout` seconds
+        (:attr:`drain_timeout` by default). Does not block, so it may be
+        invoked from a signal handler or another thread.
+        """
+        if self._drain_deadline is None:
+            if timeout is None:
+                timeout = self.drain_timeout
+            self._drain_deadline = self.scheduler.clock() + timeout
+        self.wakeup()
+
+    def _check_drain(self):
+        if self._accepting:
+            self._accepting = False
+            self.logger.info("Draining; waiting at most {0:.1f}s".format(
+                self._drain_deadline - self.scheduler.clock()))
+            if self.handoff_path:
+                self._handoff()
+            self.stop_accepting()
+        if self.is_drained():
+            self.stop()
+        elif self.scheduler.clock() >= self._drain_deadline:
+            self.logger.warning("Drain deadline exceeded; exiting")
+            self.stop()
+
+    def _handoff(self):
+        sockets = self.listening_sockets()
+        if not sockets:
+            return
+        try:
+            send_sockets(self.handoff_path, sockets)
+        except (IOError, OSError, EOFError) as e:
+            self.logger.warning("Unable to hand off sockets to {0}: {1}"\
+                .format(self.handoff_path, e))
+        else:
+            self.logger.info("Handed off {0} socket(s) to {1}".format(
+                len(sockets), self.handoff_path))
+
+    def listening_sockets(self):
+        """Hook that returns a dictionary mapping names to the listening
+        sockets to hand off to a replacement process; see
+        :attr:`handoff_path`. Defaults to :attr:`sockets`.
+        """
+        return dict(self.sockets or {})
+
+    def stop_accepting(self):
+        """Hook invoked from the main event loop when the process starts
+        draining. Should stop accepting new work, for example by closing
+        listening sockets, while the main event loop keeps running.
+        """
+        pass
+
+    def is_drained(self):
+        """Hook invoked on every iteration of the main event loop while
+        draining. Returns a boolean indicating that all work in progress
+        is finished.
+        """
+        return True
+
     def _do_update(self):
+        started = self._begin_update()
+        if started is None:
+            return
         try:
             self.do_update()
         except Exception as e:
             self.logger.exception("FATAL: Uncaught exception in do_update()!")
         finally:
+            self._end_update(started)
+
+    def _begin_update(self):
+        # Return the time at which an inline update started, or None if
+        # the configuration is reloaded in the background.
+        if self.reload_mode == RELOAD_BACKGROUND:
             self._needs_update = False
+            self._start_reload()
+            return None
+        return self.scheduler.clock()
+
+    def _end_update(self, started):
+        self._needs_update = False
+        if self.metrics is not None:
+            self.metrics.record_update(self.scheduler.clock() - started)
 
     def do_update(self):
         """Hook to update the program state."""
         pass
 
+    def _start_reload(self):
+        with self._reload_lock:
+            if self._reload_thread is not None:
+                # Reload again when the running reload completes, since
+                # it may have missed the changes.
+                self._reload_again = True
+                return
+            self._reload_thread = threading.Thread(target=self._reload,
+                name='config-reload')
+            self._reload_thread.daemon = True
+            self._reload_thread.start()
+
+    def _reload(self):
+        while True:
+            started = self.scheduler.clock()
+            try:
+                config = self.build_config()
+                failed = False
+            except Exception:
+                self.logger.exception(
+                    "Reloading the configuration failed; keeping the "
+                    "current configuration.")
+                failed = True
+            if self.metrics is not None:
+                self.metrics.record_reload(self.scheduler.clock() - started,
+                    failed=failed)
+            if not failed:
+                with self._reload_lock:
+                    self._next_config = (config,)
+                self.wakeup()
+            with self._reload_lock:
+                if not self._reload_again:
+                    self._reload_thread = None
+                    return
+                self._reload_again = False
+
+    def _swap_config(self):
+        with self._reload_lock:
+            next_config, self._next_config = self._next_config, None
+        previous, self.config = self.config, next_config[0]
+        self.config_changed(previous)
+
     def do_exit(self):
         """Gracefully exit the process. May perform any cleanup
         tasks needed by the process."""
@@ -244,8 +1043,23 @@ class BaseProcess(object):
         self.logger.debug("Interrupted by {0}".format(signame))
         if signum == signal.SIGHUP:
             self.update()
+        if signum == self.memory_signal:
+            self.toggle_memory_profiler()
         if signum in (signal.SIGTERM, signal.SIGINT):
-            self.join()
+            if self.draining and self._group is not None:
+                # Other loops share the OS process; only stop this one.
+                self.logger.warning("Received {0} while draining; stopping "
+                    "immediately".format(signame))
+                self.stop()
+                return
+            if self.draining:
+                self.logger.warning("Received {0} while draining; exiting "
+                    "immediately".format(signame))
+                if self._log_queue is not None:
+                    self._log_queue.flush(1.0)
+                os._exit(1)
+            self.logger.info("Gracefully exiting main event loop")
+            self.drain()
 
     def exception_handler(self, exception):
         """Hook to handle a fatal exception in the main event loop.
@@ -0,0 +1,304 @@
+"""
+Instrumentation of the main event loop of
+:class:`~libsousou.process.loop.BaseProcess`: a fixed-memory histogram of
+iteration durations, counters and a thread that periodically dumps
+snapshots as JSON or in the Prometheus text format.
+"""
+import json
+import logging
+import math
+import os
+import socket
+import tempfile
+import threading
+
+
+FORMAT_JSON = 'json'
+FORMAT_PROMETHEUS = 'prometheus'
+
+
+class LatencyHistogram(object):
+    """Counts durations in buckets whose upper bounds are powers of two,
+    from ``2 ** min_exponent`` to ``2 ** max_exponent`` seconds. Values
+    below the lowest bound are counted in the first bucket and values
+    above the highest bound in the last, so memory use is fixed.
+
+    Args:
+        min_exponent: the exponent of the upper bound of the first
+            bucket; the default is about a microsecond.
+        max_exponent: the exponent of the upper bound of the last
+            finite bucket; the default is 64 seconds.
+    """
+    __slots__ = ['min_exponent', 'max_exponent', 'counts', 'count', 'sum',
+        'max']
+
+    def __init__(self, min_exponent=-20, max_exponent=6):
+        self.min_exponent = min_exponent
+        self.max_exponent = max_exponent
+        self.counts = [0] * (max_exponent - min_exponent + 2)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        """Add a duration of `value` seconds."""
+        # frexp() returns e such that 2 ** (e - 1) <= value < 2 ** e.
+        counts = self.counts
+        index = math.frexp(value)[1] - self.min_exponent
+        if value <= 0 or index < 0:
+            index = 0
+        elif index >= len(counts):
+            index = len(counts) - 1
+        counts[index] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def bounds(self):
+        """Return the upper bounds of the buckets; the last bucket is
+        unbounded.
+        """
+        return [2.0 ** x for x in range(self.min_exponent, self.max_exponent + 1)]\
+            + [float('inf')]
+
+    def quantile(self, q):
+        """Return the upper bound of the bucket that contains quantile `q`
+        (between 0 and 1), or ``None`` if the histogram is empty. The
+        last bucket reports the largest recorded value.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds(), self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'buckets': [[bound, count]
+                for bound, count in zip(self.bounds(), self.counts)]
+        }
+
+
+class LoopMetrics(object):
+    """Collects the metrics of a main event loop.
+
+    Counters are updated from the loop thread without locking; a
+    snapshot taken from another thread with `reset` may therefore miss
+    iterations that complete while it is being taken.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Reset all metrics."""
+        self.histogram = LatencyHistogram()
+        self.ticks = 0
+        self.exceptions = 0
+        self.overruns = 0
+        self.updates = 0
+        self.update_time = 0.0
+        self.reloads = 0
+        self.reload_failures = 0
+        self.reload_time = 0.0
+        self.spawn_latency = None
+
+    def record_tick(self, duration, overrun=False):
+        """Record an iteration of the main event loop that took
+        `duration` seconds. `overrun` indicates that it overran its
+        slot; see :meth:`~libsousou.process.loop.TickScheduler.completed`.
+        """
+        self.ticks += 1
+        self.histogram.record(duration)
+        if overrun:
+            self.overruns += 1
+
+    def record_update(self, duration):
+        """Record an invocation of ``do_update()`` that took `duration`
+        seconds.
+        """
+        self.updates += 1
+        self.update_time += duration
+
+    def record_reload(self, duration, failed=False):
+        """Record a configuration reload in the background that took
+        `duration` seconds.
+        """
+        self.reloads += 1
+        self.reload_time += duration
+        if failed:
+            self.reload_failures += 1
+
+    def record_spawn(self, duration):
+        """Record that the process started `duration` seconds after its
+        parent invoked :meth:`~libsousou.process.loop.BaseProcess.start_process`.
+        In the parent, `duration` is the time spent starting the child.
+        """
+        self.spawn_latency = duration
+
+    def snapshot(self, reset=False):
+        """Return the metrics as a dictionary.
+
+        Args:
+            reset: reset the metrics after reading them.
+
+        Returns:
+            dict
+        """
+        histogram = self.histogram
+        if reset:
+            self.histogram = LatencyHistogram(histogram.min_exponent,
+                histogram.max_exponent)
+        snapshot = {
+            'ticks': self.ticks,
+            'exceptions': self.exceptions,
+            'overruns': self.overruns,
+            'updates': self.updates,
+            'update_time': self.update_time,
+            'reloads': self.reloads,
+            'reload_failures': self.reload_failures,
+            'reload_time': self.reload_time,
+            'spawn_latency': self.spawn_latency,
+            'tick_time': histogram.as_dict()
+        }
+        if reset:
+            self.ticks = self.exceptions = self.overruns = self.updates = 0
+            self.reloads = self.reload_failures = 0
+            self.update_time = self.reload_time = 0.0
+        return snapshot
+
+
+def format_json(snapshot):
+    return json.dumps(snapshot, sort_keys=True) + '\n'
+
+
+def format_prometheus(snapshot, prefix='libsousou_process'):
+    """Format `snapshot` in the Prometheus text exposition format. Every
+    bucket of the histogram is written, including empty ones, so that the
+    series are the same in each scrape.
+    """
+    lines = []
+    for name, kind, value in [
+            ('ticks_total', 'counter', snapshot['ticks']),
+            ('exceptions_total', 'counter', snapshot['exceptions']),
+            ('overruns_total', 'counter', snapshot['overruns']),
+            ('updates_total', 'counter', snapshot['updates']),
+            ('update_seconds_total', 'counter', snapshot['update_time']),
+            ('reloads_total', 'counter', snapshot['reloads']),
+            ('reload_failures_total', 'counter', snapshot['reload_failures']),
+            ('reload_seconds_total', 'counter', snapshot['reload_time'])]:
+        lines.append('# TYPE {0}_{1} {2}'.format(prefix, name, kind))
+        lines.append('{0}_{1} {2}'.format(prefix, name, value))
+    if snapshot.get('spawn_latency') is not None:
+        lines.append('# TYPE {0}_spawn_seconds gauge'.format(prefix))
+        lines.append('{0}_spawn_seconds {1!r}'.format(prefix,
+            snapshot['spawn_latency']))
+
+    histogram = snapshot['tick_time']
+    name = '{0}_tick_seconds'.format(prefix)
+    lines.append('# TYPE {0} histogram'.format(name))
+    cumulative = 0
+    for bound, count in histogram['buckets']:
+        cumulative += count
+        if bound == float('inf'):
+            continue
+        lines.append('{0}_bucket{{le="{1!r}"}} {2}'.format(
+            name, bound, cumulative))
+    lines.append('{0}_bucket{{le="+Inf"}} {1}'.format(
+        name, histogram['count']))
+    lines.append('{0}_sum {1!r}'.format(name, histogram['sum']))
+    lines.append('{0}_count {1}'.format(name, histogram['count']))
+    return '\n'.join(lines) + '\n'
+
+
+FORMATTERS = {
+    FORMAT_JSON: format_json,
+    FORMAT_PROMETHEUS: format_prometheus,
+}
+
+
+class MetricsDumper(threading.Thread):
+    """Periodically writes a snapshot of `metrics` to `target`. If
+    `target` starts with ``unix:``, the snapshot is sent to the Unix
+    domain socket at the remaining path; otherwise the file at `target`
+    is atomically replaced.
+
+    Args:
+        metrics: a :class:`LoopMetrics` instance.
+        target: a file path or ``unix:<path>``.
+        interval: the number of seconds between dumps.
+        format: :data:`FORMAT_JSON` or :data:`FORMAT_PROMETHEUS`.
+        reset: reset the metrics after each dump. Not supported with
+            :data:`FORMAT_PROMETHEUS`, since Prometheus counters must
+            not decrease.
+    """
+    logger = logging.getLogger('libsousou.process.metrics')
+
+    def __init__(self, metrics, target, interval=10.0, format=FORMAT_JSON,
+        reset=False):
+        super(MetricsDumper, self).__init__(name='metrics-dumper')
+        if format not in FORMATTERS:
+            raise ValueError("Unknown metrics format: {0}".format(format))
+        if reset and format == FORMAT_PROMETHEUS:
+            raise ValueError(
+                "Prometheus counters can not be reset after each dump.")
+        self.daemon = True
+        self.metrics = metrics
+        self.target = target
+        self.interval = interval
+        self.format = format
+        self.reset = reset
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            self.dump()
+
+    def stop(self):
+        """Stop the thread after writing a final snapshot."""
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
+        self.dump()
+
+    def dump(self):
+        data = FORMATTERS[self.format](self.metrics.snapshot(reset=self.reset))
+        try:
+            if self.target.startswith('unix:'):
+                self.send(self.target[5:], data.encode('utf-8'))
+            else:
+                self.write(self.target, data)
+        except (IOError, OSError) as e:
+            self.logger.debug("Unable to dump metrics to {0}: {1}".format(
+                self.target, e))
+
+    def send(self, path, data):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.interval)
+            sock.connect(path)
+            sock.sendall(data)
+        finally:
+            sock.close()
+
+    def write(self, path, data):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.',
+            prefix='.metrics')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except Exception:
+            os.unlink(tmp)
+            raise
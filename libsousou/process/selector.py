@@ -0,0 +1,144 @@
+"""
+A :class:`~libsousou.process.loop.BaseProcess` variant whose main event
+loop blocks in :mod:`selectors` until a registered file descriptor is
+ready, a timer is due or the loop is woken up by :meth:`stop`,
+:meth:`update` or a signal.
+"""
+import os
+import selectors
+
+from libsousou.process.loop import BEST_EFFORT
+from libsousou.process.loop import BaseProcess
+
+
+class SelectorProcess(BaseProcess):
+    """Main event loop driven by I/O readiness. Subclasses register file
+    descriptors (or objects with a ``fileno()`` method) with
+    :meth:`add_reader` and :meth:`add_writer`, usually in
+    :meth:`setup`, and the callbacks are invoked from the loop thread
+    when the file descriptor is ready. The loop uses no CPU while
+    nothing is ready.
+
+    The default :meth:`main_event` implementation waits for and
+    dispatches I/O events; subclasses that override it must invoke
+    :meth:`poll`.
+    """
+    schedule = BEST_EFFORT
+
+    def __init__(self, *args, **kwargs):
+        super(SelectorProcess, self).__init__(*args, **kwargs)
+        self._selector = None
+        self._wakeup_fds = None
+
+    def _setup(self):
+        self._selector = selectors.DefaultSelector()
+        r, w = os.pipe()
+        os.set_blocking(r, False)
+        os.set_blocking(w, False)
+        self._wakeup_fds = (r, w)
+        self._selector.register(r, selectors.EVENT_READ, None)
+        super(SelectorProcess, self)._setup()
+
+    def start(self):
+        try:
+            super(SelectorProcess, self).start()
+        finally:
+            self._close_selector()
+
+    def _close_selector(self):
+        if self._selector is not None:
+            self._selector.close()
+            self._selector = None
+        fds, self._wakeup_fds = self._wakeup_fds, None
+        if fds is not None:
+            for fd in fds:
+                os.close(fd)
+
+    def add_reader(self, fileobj, callback, *args):
+        """Invoke ``callback(*args)`` when `fileobj` is readable."""
+        self._modify(fileobj, selectors.EVENT_READ, (callback, args))
+
+    def add_writer(self, fileobj, callback, *args):
+        """Invoke ``callback(*args)`` when `fileobj` is writable."""
+        self._modify(fileobj, selectors.EVENT_WRITE, (callback, args))
+
+    def remove_reader(self, fileobj):
+        """Stop watching `fileobj` for readability."""
+        self._modify(fileobj, selectors.EVENT_READ, None)
+
+    def remove_writer(self, fileobj):
+        """Stop watching `fileobj` for writability."""
+        self._modify(fileobj, selectors.EVENT_WRITE, None)
+
+    def _modify(self, fileobj, event, handler):
+        try:
+            key = self._selector.get_key(fileobj)
+        except KeyError:
+            if handler is None:
+                return
+            handlers = {event: handler}
+            self._selector.register(fileobj, event, handlers)
+            return
+        handlers = dict(key.data)
+        if handler is None:
+            handlers.pop(event, None)
+        else:
+            handlers[event] = handler
+        events = 0
+        for x in handlers:
+            events |= x
+        if events:
+            self._selector.modify(fileobj, events, handlers)
+        else:
+            self._selector.unregister(fileobj)
+
+    def main_event(self):
+        self.poll()
+
+    def poll(self, timeout=None):
+        """Wait for at most `timeout` seconds (indefinitely if `timeout`
+        is ``None``) until a file descriptor is ready, a timer is due or
+        the loop is woken up, and invoke the callbacks.
+        """
+        for due in (self.timers.next_due() if self.timers.count else None,
+                self._drain_deadline):
+            if due is not None:
+                due = max(0.0, due - self.scheduler.clock())
+                timeout = due if timeout is None else min(timeout, due)
+        # The time spent waiting is not part of the iteration, neither for
+        # the stall watchdog nor for the tick metrics.
+        started, self._tick_started = self._tick_started, None
+        if started is not None:
+            waited = self.scheduler.clock()
+        events = self._selector.select(timeout)
+        if started is not None:
+            self._tick_started = started + self.scheduler.clock() - waited
+        wakeup_fd = self._wakeup_fds[0]
+        for key, mask in events:
+            if key.fd == wakeup_fd:
+                self._drain_wakeup()
+                continue
+            for event, (callback, args) in list(key.data.items()):
+                if mask & event:
+                    callback(*args)
+        if self.timers.count:
+            self.timers.run()
+
+    def _drain_wakeup(self):
+        try:
+            while os.read(self._wakeup_fds[0], 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def wait(self, timeout):
+        self.poll(timeout)
+
+    def wakeup(self):
+        super(SelectorProcess, self).wakeup()
+        fds = self._wakeup_fds
+        if fds is not None:
+            try:
+                os.write(fds[1], b'\0')
+            except (BlockingIOError, OSError):
+                pass
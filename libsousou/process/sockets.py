@@ -0,0 +1,171 @@
+"""
+Listening sockets that are bound before a process drops its privileges
+(see :func:`~libsousou.process.utils.drop_privileges`) and shared with
+:class:`~libsousou.process.loop.BaseProcess` workers, either inherited
+through :func:`os.fork` (see :class:`~libsousou.process.supervisor.Supervisor`)
+or passed over a Unix domain socket with ``SCM_RIGHTS`` (see
+:meth:`Listeners.send` and
+:attr:`~libsousou.process.loop.BaseProcess.sockets_path`).
+
+Addresses are strings of the form ``host:port``, ``[ipv6]:port``,
+``:port`` (all interfaces) or ``unix:<path>``, or ``(host, port)``
+tuples.
+"""
+import os
+import socket
+import stat
+
+from libsousou.process.handoff import send_sockets
+
+
+def parse_address(address):
+    """Return the address family and the address to bind for `address`.
+
+    Returns:
+        tuple
+    """
+    if isinstance(address, tuple):
+        host, port = address
+    elif address.startswith('unix:'):
+        return socket.AF_UNIX, address[5:]
+    else:
+        host, sep, port = address.rpartition(':')
+        if not sep:
+            raise ValueError("Invalid address: {0}".format(address))
+        host = host[1:-1] if host.startswith('[') else host
+    info = socket.getaddrinfo(host or None, int(port), socket.AF_UNSPEC,
+        socket.SOCK_STREAM, 0, socket.AI_PASSIVE)
+    return info[0][0], info[0][4]
+
+
+def bind_socket(address, backlog=128, reuse_port=False, mode=None):
+    """Bind a listening socket to `address`.
+
+    Args:
+        address: the address; see the module documentation.
+        backlog: the maximum number of pending connections.
+        reuse_port: set ``SO_REUSEPORT``, so that other sockets with
+            this option can bind the same address and the kernel
+            distributes connections among them. Ignored for Unix domain
+            sockets.
+        mode: the permissions of a Unix domain socket.
+
+    Returns:
+        socket.socket
+    """
+    family, addr = parse_address(address)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        if family == socket.AF_UNIX:
+            if os.path.exists(addr) and stat.S_ISSOCK(os.stat(addr).st_mode):
+                os.unlink(addr)
+            if mode is None:
+                sock.bind(addr)
+            else:
+                # Create the socket with no more than `mode`, so that it
+                # is never accessible with wider permissions.
+                umask = os.umask(0o777 & ~mode)
+                try:
+                    sock.bind(addr)
+                finally:
+                    os.umask(umask)
+                os.chmod(addr, mode)
+        else:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if reuse_port:
+                if not hasattr(socket, 'SO_REUSEPORT'):
+                    raise ValueError("SO_REUSEPORT is not supported.")
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            sock.bind(addr)
+        sock.listen(backlog)
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+
+class Listeners(object):
+    """A set of named listening sockets for a pool of workers. Bind them
+    with :meth:`bind` while the process is privileged; each worker then
+    gets its sockets from :meth:`for_worker`.
+
+    With `reuse_port`, `shards` sockets with ``SO_REUSEPORT`` are bound
+    to each TCP address, and worker `i` accepts on shard ``i % shards``,
+    so that each worker has its own accept queue and the kernel balances
+    connections across them. Connections queued on the shard of a
+    worker that exits wait for its replacement. Otherwise all workers
+    share one socket per address.
+
+    Args:
+        addresses: a dictionary mapping names to addresses.
+        backlog: the maximum number of pending connections per socket.
+        reuse_port: bind a shard per worker with ``SO_REUSEPORT``.
+        shards: the number of shards per address.
+        mode: the permissions of Unix domain sockets.
+    """
+
+    def __init__(self, addresses, backlog=128, reuse_port=False, shards=1,
+        mode=None):
+        self.addresses = dict(addresses)
+        self.backlog = backlog
+        self.reuse_port = reuse_port
+        self.shards = shards if reuse_port else 1
+        self.mode = mode
+        self.sockets = {}
+
+    def bind(self, inherited=None):
+        """Bind all addresses. Sockets in `inherited`, a dictionary as
+        returned by :meth:`get_sockets` (for example received from a
+        previous process), are used instead of binding new ones.
+        """
+        inherited = dict(inherited or {})
+        for name, address in sorted(self.addresses.items()):
+            if name in self.sockets:
+                continue
+            unix = not isinstance(address, tuple)\
+                and address.startswith('unix:')
+            shards = []
+            for i in range(1 if unix else self.shards):
+                key = self.get_key(name, i)
+                if key in inherited:
+                    shards.append(inherited.pop(key))
+                    continue
+                if shards:
+                    # Bind the shards to the port that was assigned to
+                    # the first one, in case port 0 was requested.
+                    address = shards[0].getsockname()[:2]
+                shards.append(bind_socket(address, self.backlog,
+                    reuse_port=self.reuse_port, mode=self.mode))
+            self.sockets[name] = shards
+        for sock in inherited.values():
+            sock.close()
+
+    def get_key(self, name, shard):
+        return name if shard == 0 else '{0}:{1}'.format(name, shard)
+
+    def get_sockets(self):
+        """Return a dictionary mapping a key for each shard to its
+        socket, e.g. for :meth:`~libsousou.process.loop.BaseProcess.listening_sockets`.
+        """
+        return dict((self.get_key(name, i), sock)
+            for name, shards in self.sockets.items()
+            for i, sock in enumerate(shards))
+
+    def for_worker(self, index):
+        """Return a dictionary mapping names to the sockets on which
+        worker `index` accepts connections.
+        """
+        return dict((name, shards[index % len(shards)])
+            for name, shards in self.sockets.items())
+
+    def send(self, path, index=0, timeout=5.0):
+        """Pass the sockets of worker `index` to the process waiting on
+        the Unix domain socket `path`, using ``SCM_RIGHTS``.
+        """
+        send_sockets(path, self.for_worker(index), timeout=timeout)
+
+    def close(self):
+        for shards in self.sockets.values():
+            for sock in shards:
+                sock.close()
+        self.sockets = {}
@@ -0,0 +1,316 @@
+"""
+Pre-forking supervisor that runs a pool of
+:class:`~libsousou.process.loop.BaseProcess` workers.
+"""
+import os
+import signal
+import struct
+import time
+
+from libsousou.process.loop import BEST_EFFORT
+from libsousou.process.loop import BaseProcess
+from libsousou.process.utils import drop_privileges
+
+
+class WorkerSlot(object):
+    """Holds the state of a position in the worker pool."""
+
+    def __init__(self, index):
+        self.index = index
+        self.pid = None
+        self.started = None
+        self.failures = 0
+        self.next_start = 0.0
+
+    @property
+    def running(self):
+        return self.pid is not None
+
+
+class Supervisor(BaseProcess):
+    """Forks `workers` instances of `process_class` and keeps them running.
+    A worker that exits while the supervisor is running is restarted;
+    if it keeps exiting within `stable_after` seconds, restarts are
+    delayed with an exponential backoff.
+
+    The supervisor handles the following signals:
+
+    ``SIGHUP``
+        Forwarded to all workers, causing them to invoke
+        :meth:`~libsousou.process.loop.BaseProcess.update`.
+    ``SIGTTIN``, ``SIGTTOU``
+        Increase or decrease the number of workers by one.
+    ``SIGTERM``, ``SIGINT``
+        Drain: forward ``SIGTERM`` to the workers and wait at most
+        :attr:`~libsousou.process.loop.BaseProcess.drain_timeout`
+        seconds for them to exit. Workers that are still running are
+        terminated, and killed if they do not exit within
+        `shutdown_timeout` seconds.
+
+    A worker that recycles itself (see
+    :meth:`~libsousou.process.loop.BaseProcess.recycle`) asks the
+    supervisor to replace it through a pipe. The supervisor starts the
+    replacement first and then signals the worker with ``SIGTERM``, so
+    that it drains while the replacement takes over.
+
+    Args:
+        process_class: a :class:`~libsousou.process.loop.BaseProcess`
+            subclass.
+        workers: the number of workers; defaults to the number of CPUs
+            available to the process.
+        args: positional arguments for `process_class`.
+        kwargs: keyword arguments for `process_class`.
+        cpu_affinity: pin each worker to a single CPU.
+        min_backoff: the initial restart delay, in seconds.
+        max_backoff: the maximum restart delay, in seconds.
+        stable_after: the number of seconds after which a running
+            worker is considered healthy, resetting its backoff.
+        shutdown_timeout: the number of seconds to wait for the workers
+            to exit gracefully.
+        listeners: a :class:`~libsousou.process.sockets.Listeners`
+            instance, bound before privileges are dropped. Each worker
+            gets its sockets as :attr:`~libsousou.process.loop.BaseProcess.sockets`.
+        user: drop privileges to this user after binding `listeners`.
+        group: drop privileges to this group; defaults to `user`.
+    """
+    logger_name = 'libsousou.process.supervisor'
+    schedule = BEST_EFFORT
+    signals = [signal.SIGCHLD, signal.SIGTTIN, signal.SIGTTOU]
+
+    def __init__(self, process_class, workers=None, args=None, kwargs=None,
+        cpu_affinity=False, min_backoff=0.1, max_backoff=30.0,
+        stable_after=10.0, shutdown_timeout=10.0, listeners=None, user=None,
+        group=None, framerate=0.5, **options):
+        super(Supervisor, self).__init__(framerate=framerate, **options)
+        self.process_class = process_class
+        self.args = args or []
+        self.kwargs = kwargs or {}
+        self.workers = workers or len(get_cpus())
+        self.cpu_affinity = cpu_affinity
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        self.shutdown_timeout = shutdown_timeout
+        self.listeners = listeners
+        self.user = user
+        self.group = group
+        self.slots = []
+
+        # Workers that are draining after being replaced or scaled down,
+        # by pid, and the pipe on which workers ask to be replaced.
+        self.retiring = {}
+        self._recycle_fds = None
+
+    def _setup(self):
+        r, w = os.pipe()
+        os.set_blocking(r, False)
+        self._recycle_fds = (r, w)
+        super(Supervisor, self)._setup()
+
+    def setup_sockets(self):
+        # Bind the listeners, reusing the sockets received from a previous
+        # supervisor, while still privileged.
+        super(Supervisor, self).setup_sockets()
+        if self.listeners is not None:
+            self.listeners.bind(inherited=self.sockets)
+            self.sockets = self.listeners.get_sockets()
+        if self.user is not None:
+            self.logger.info("Dropping privileges to {0}".format(self.user))
+            drop_privileges(self.user, self.group)
+
+    def main_event(self):
+        self.reap_workers()
+        if self.draining:
+            return False
+        self.scale()
+        self.replace_workers()
+        now = time.monotonic()
+        for slot in self.slots:
+            if not slot.running and slot.next_start <= now:
+                self.spawn(slot)
+
+    def scale(self):
+        """Adjust the number of slots to :attr:`workers`."""
+        while len(self.slots) < self.workers:
+            self.slots.append(WorkerSlot(len(self.slots)))
+        while len(self.slots) > self.workers:
+            slot = self.slots.pop()
+            if slot.running:
+                self.logger.info("Stopping worker {0} (pid {1})".format(
+                    slot.index, slot.pid))
+                self.retiring[slot.pid] = slot.index
+                self.kill(slot.pid, signal.SIGTERM)
+
+    def spawn(self, slot):
+        """Fork a worker for `slot`."""
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                self.run_worker(slot)
+                status = 0
+            except BaseException:
+                self.logger.exception("Worker {0} crashed".format(slot.index))
+            finally:
+                os._exit(status)
+        slot.pid = pid
+        slot.started = time.monotonic()
+        self.logger.info("Started worker {0} (pid {1})".format(slot.index, pid))
+
+    def run_worker(self, slot):
+        """Run the worker process for `slot`. Invoked in the child."""
+        for signum in self.signals:
+            signal.signal(signum, signal.SIG_DFL)
+        if self.cpu_affinity:
+            cpus = get_cpus()
+            os.sched_setaffinity(0, [cpus[slot.index % len(cpus)]])
+        process = self.process_class(*self.args, **self.kwargs)
+        if self.listeners is not None:
+            process.sockets = self.listeners.for_worker(slot.index)
+        if self._recycle_fds is not None:
+            os.close(self._recycle_fds[0])
+            process.supervisor_fd = self._recycle_fds[1]
+        process.start()
+
+    def replace_workers(self):
+        """Start a replacement for each worker that asked to be recycled,
+        then signal the worker to drain.
+        """
+        for pid in self.read_recycle_requests():
+            for slot in self.slots:
+                if slot.pid == pid:
+                    break
+            else:
+                continue
+            self.logger.info("Replacing worker {0} (pid {1})".format(
+                slot.index, pid))
+            self.retiring[pid] = slot.index
+            self.spawn(slot)
+            self.kill(pid, signal.SIGTERM)
+
+    def read_recycle_requests(self):
+        """Return the pids of the workers that asked to be recycled."""
+        if self._recycle_fds is None:
+            return []
+        data = b''
+        while True:
+            try:
+                chunk = os.read(self._recycle_fds[0], 4096)
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            data += chunk
+        return [x[0] for x in struct.iter_unpack('=I', data)]
+
+    def reap_workers(self):
+        """Collect exited workers and schedule their restart."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.retiring:
+                self.logger.info("Retired worker {0} (pid {1}) exited "
+                    "with status {2}".format(self.retiring.pop(pid), pid,
+                        status))
+                continue
+            for slot in self.slots:
+                if slot.pid == pid:
+                    self.on_worker_exit(slot, status)
+                    break
+
+    def stop_accepting(self):
+        self.broadcast(signal.SIGTERM)
+
+    def is_drained(self):
+        self.reap_workers()
+        return not self.retiring and not any(x.running for x in self.slots)
+
+    def on_worker_exit(self, slot, status):
+        if self.draining:
+            self.logger.info("Worker {0} (pid {1}) exited with status {2}"\
+                .format(slot.index, slot.pid, status))
+            slot.pid = None
+            return
+        now = time.monotonic()
+        if now - slot.started >= self.stable_after:
+            slot.failures = 0
+        slot.failures += 1
+        delay = min(self.min_backoff * 2 ** (slot.failures - 1),
+            self.max_backoff)
+        slot.next_start = now + delay
+        self.logger.warning(
+            "Worker {0} (pid {1}) exited with status {2}, restarting in "
+            "{3:.1f}s".format(slot.index, slot.pid, status, delay))
+        slot.pid = None
+
+    def signal_handler(self, signum, frame):
+        if signum == signal.SIGCHLD:
+            self.wakeup()
+            return
+        if signum == signal.SIGTTIN:
+            self.workers += 1
+            self.wakeup()
+        elif signum == signal.SIGTTOU:
+            self.workers = max(self.workers - 1, 1)
+            self.wakeup()
+        elif signum == signal.SIGHUP:
+            self.broadcast(signal.SIGHUP)
+        super(Supervisor, self).signal_handler(signum, frame)
+
+    def broadcast(self, signum):
+        """Send `signum` to all running workers."""
+        for slot in self.slots:
+            if slot.running:
+                self.kill(slot.pid, signum)
+
+    def kill(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def do_cleanup(self, graceful):
+        """Stop the workers, and kill them if they do not exit within
+        :attr:`shutdown_timeout` seconds.
+        """
+        pids = set(x.pid for x in self.slots if x.running)
+        for pid in pids:
+            self.kill(pid, signal.SIGTERM)
+
+        # Retired workers are already draining; a second SIGTERM would
+        # make them exit immediately.
+        pids.update(self.retiring)
+        deadline = time.monotonic() + self.shutdown_timeout
+        while pids and time.monotonic() < deadline:
+            for pid in list(pids):
+                try:
+                    if os.waitpid(pid, os.WNOHANG)[0]:
+                        pids.discard(pid)
+                except ChildProcessError:
+                    pids.discard(pid)
+            time.sleep(0.05)
+        for pid in pids:
+            self.logger.warning("Killing worker (pid {0})".format(pid))
+            self.kill(pid, signal.SIGKILL)
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        for slot in self.slots:
+            slot.pid = None
+        self.retiring.clear()
+        fds, self._recycle_fds = self._recycle_fds, None
+        if fds is not None:
+            for fd in fds:
+                os.close(fd)
+
+
+def get_cpus():
+    """Return a sorted list of the CPUs available to the process."""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
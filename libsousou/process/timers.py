@@ -0,0 +1,247 @@
+"""
+Timers for the main event loop of
+:class:`~libsousou.process.loop.BaseProcess`, kept in a hierarchical
+timing wheel: adding and cancelling a timer takes constant time
+regardless of the number of pending timers, and finding the next due
+timer takes time proportional to the number of levels.
+"""
+import logging
+import math
+import time
+
+
+def _lowest_bit(value):
+    return (value & -value).bit_length() - 1
+
+
+class Timer(object):
+    """A callback scheduled with :meth:`TimingWheel.call_at`,
+    :meth:`TimingWheel.call_later` or :meth:`TimingWheel.call_every`.
+    """
+    __slots__ = ['when', 'callback', 'args', 'interval', 'cancelled',
+        '_wheel', '_expires', '_position']
+
+    def __init__(self, when, callback, args, interval=None):
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.interval = interval
+        self.cancelled = False
+        self._wheel = None
+        self._expires = None
+        self._position = None
+
+    def cancel(self):
+        """Cancel the timer; a periodic timer is not rescheduled."""
+        self.cancelled = True
+        if self._position is not None:
+            self._wheel.remove(self)
+
+
+class TimingWheel(object):
+    """Schedules timers in `levels` wheels of ``2 ** bits`` slots each.
+    A slot of the first wheel holds the timers that expire during one
+    tick of `resolution` seconds; a slot of each next wheel spans a
+    whole rotation of the previous one, and its timers are moved to the
+    lower wheels (cascaded) when that rotation starts. With the defaults,
+    the wheels span 0.256s, 65s, 4.6 hours and 50 days; timers beyond
+    that are cascaded again until they are due.
+
+    Timers fire at most `resolution` seconds late, plus the time until
+    :meth:`run` is next invoked. The wheel is not thread-safe.
+
+    Args:
+        resolution: the duration of a tick, in seconds.
+        bits: the base 2 logarithm of the number of slots per wheel.
+        levels: the number of wheels.
+        clock: a function returning the current time in seconds.
+    """
+    logger = logging.getLogger('libsousou.process.timers')
+
+    def __init__(self, resolution=0.001, bits=8, levels=4,
+        clock=time.monotonic):
+        self.resolution = resolution
+        self.bits = bits
+        self.levels = levels
+        self.clock = clock
+        self.count = 0
+        self._slots = 1 << bits
+        self._mask = self._slots - 1
+        self._wheels = [{} for i in range(levels)]
+        self._occupied = [0] * levels
+
+        # The next tick to process.
+        self._tick = self._to_tick(clock())
+
+    def __len__(self):
+        return self.count
+
+    def call_at(self, when, callback, *args):
+        """Invoke ``callback(*args)`` at `when`, according to :attr:`clock`.
+
+        Returns:
+            Timer: a handle that may be used to cancel the call.
+        """
+        return self.add(Timer(when, callback, args))
+
+    def call_later(self, delay, callback, *args):
+        """Invoke ``callback(*args)`` after `delay` seconds.
+
+        Returns:
+            Timer: a handle that may be used to cancel the call.
+        """
+        return self.add(Timer(self.clock() + delay, callback, args))
+
+    def call_every(self, interval, callback, *args):
+        """Invoke ``callback(*args)`` every `interval` seconds, starting
+        `interval` seconds from now, until the timer is cancelled. Calls
+        that would be late by a whole interval or more are skipped.
+
+        Returns:
+            Timer: a handle that may be used to cancel the calls.
+        """
+        if interval <= 0:
+            raise ValueError("The interval must be positive.")
+        return self.add(Timer(self.clock() + interval, callback, args,
+            interval=interval))
+
+    def add(self, timer):
+        """Schedule `timer` and return it."""
+        timer._wheel = self
+        timer._expires = self._to_tick(timer.when)
+        self._insert(timer)
+        self.count += 1
+        return timer
+
+    def remove(self, timer):
+        """Unschedule `timer`."""
+        level, index = timer._position
+        slot = self._wheels[level][index]
+        del slot[timer]
+        if not slot:
+            del self._wheels[level][index]
+            self._occupied[level] &= ~(1 << index)
+        timer._position = None
+        self.count -= 1
+
+    def next_due(self):
+        """Return the time, according to :attr:`clock`, at which
+        :meth:`run` must next be invoked, or ``None`` if there are no
+        timers.
+        """
+        tick = self._next_event()
+        if tick is None:
+            return None
+        when = tick * self.resolution
+        while self._to_tick(when, math.floor) < tick:
+            when = math.nextafter(when, math.inf)
+        return when
+
+    def run(self, now=None):
+        """Invoke the callbacks of the timers that are due at `now`
+        (the current time by default). Exceptions raised by a callback
+        are logged.
+
+        Returns:
+            int: the number of callbacks invoked.
+        """
+        if now is None:
+            now = self.clock()
+        fired = 0
+        for timer in self._advance(self._to_tick(now, math.floor)):
+            if timer.cancelled:
+                continue
+            fired += 1
+            try:
+                timer.callback(*timer.args)
+            except Exception:
+                self.logger.exception(
+                    "Uncaught exception in timer {0!r}".format(
+                        timer.callback))
+            if timer.interval is not None and not timer.cancelled\
+            and timer._position is None:
+                timer.when += timer.interval
+                if timer.when <= now:
+                    missed = math.floor((now - timer.when) / timer.interval)
+                    timer.when += (missed + 1) * timer.interval
+                self.add(timer)
+        return fired
+
+    def _to_tick(self, when, rounding=math.ceil):
+        return int(rounding(when / self.resolution))
+
+    def _insert(self, timer):
+        expires = max(timer._expires, self._tick)
+        delta = expires - self._tick
+        for level in range(self.levels):
+            if delta < 1 << (self.bits * (level + 1)):
+                break
+        else:
+            # Beyond the span of the wheels: put the timer in the last
+            # slot that is cascaded, so that it is inserted again.
+            expires = self._tick + (1 << (self.bits * self.levels)) - 1
+        index = (expires >> (self.bits * level)) & self._mask
+        wheel = self._wheels[level]
+        slot = wheel.get(index)
+        if slot is None:
+            slot = wheel[index] = {}
+            self._occupied[level] |= 1 << index
+        slot[timer] = None
+        timer._position = (level, index)
+
+    def _next_event(self):
+        # Return the next tick at which a slot of the first wheel fires
+        # or a non-empty slot of another wheel is cascaded.
+        if not self.count:
+            return None
+        best = None
+        for level in range(self.levels):
+            occupied = self._occupied[level]
+            if not occupied:
+                continue
+            shift = self.bits * level
+            base = -(-self._tick >> shift) << shift
+            index = (base >> shift) & self._mask
+            bits = occupied >> index
+            if bits:
+                offset = _lowest_bit(bits)
+            else:
+                offset = self._slots - index + _lowest_bit(occupied)
+            tick = base + (offset << shift)
+            if best is None or tick < best:
+                best = tick
+        return best
+
+    def _advance(self, target):
+        # Process all ticks up to and including `target`, skipping those
+        # at which nothing happens, and return the timers that are due.
+        due = []
+        while True:
+            tick = self._next_event()
+            if tick is None or tick > target:
+                break
+            self._tick = tick
+            index = tick & self._mask
+            if index == 0:
+                self._cascade(tick)
+            slot = self._wheels[0].pop(index, None)
+            if slot:
+                self._occupied[0] &= ~(1 << index)
+                self.count -= len(slot)
+                for timer in slot:
+                    timer._position = None
+                due.extend(slot)
+            self._tick = tick + 1
+        self._tick = max(self._tick, target + 1)
+        return due
+
+    def _cascade(self, tick):
+        for level in range(1, self.levels):
+            index = (tick >> (self.bits * level)) & self._mask
+            slot = self._wheels[level].pop(index, None)
+            if slot:
+                self._occupied[level] &= ~(1 << index)
+                for timer in slot:
+                    self._insert(timer)
+            if index:
+                break
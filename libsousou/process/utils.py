@@ -91,3 +91,15 @@ def drop_privileges(user, group=None):
         user = pwd.getpwnam(user).pw_uid
     os.setgid(group)
     os.setuid(user)
+
+
+def get_rss():
+    """Return the resident set size of the current process in bytes, as
+    reported by ``/proc/self/statm``, or ``None`` if it is not available.
+    """
+    try:
+        with open('/proc/self/statm', 'rb') as f:
+            pages = int(f.read().split()[1])
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE')
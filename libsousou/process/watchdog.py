@@ -0,0 +1,113 @@
+"""
+Detection of stalls in the main event loop of
+:class:`~libsousou.process.loop.BaseProcess`. While an iteration runs for
+longer than its budget, a watchdog thread samples the stack of the loop
+thread and reports the samples in the folded format understood by
+flamegraph tools (one line per unique stack, frames separated by
+semicolons and followed by the number of samples).
+"""
+import collections
+import logging
+import sys
+import threading
+import time
+
+
+def fold(frame):
+    """Return the stack of `frame` in the folded format, outermost frame
+    first.
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('{0} ({1}:{2})'.format(code.co_name, code.co_filename,
+            frame.f_lineno))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def format_folded(samples):
+    """Format a mapping of folded stacks to sample counts."""
+    return ''.join('{0} {1}\n'.format(stack, count)
+        for stack, count in sorted(samples.items()))
+
+
+class StallWatchdog(threading.Thread):
+    """Watches the iterations of the main event loop of `process`, which
+    runs in the thread identified by `ident`. Until an iteration exceeds
+    `budget` seconds, the watchdog only wakes up every `budget / 2`
+    seconds to compare two numbers. Then it samples the stack of the
+    loop thread `rate` times per second until the iteration ends, or
+    until it has `max_samples` samples, and reports them.
+
+    Args:
+        process: a :class:`~libsousou.process.loop.BaseProcess`.
+        ident: the identifier of the thread running the main event loop.
+        budget: the number of seconds an iteration may run.
+        rate: the number of samples per second.
+        path: append reports to this file instead of logging them.
+        max_samples: the maximum number of samples in a report.
+    """
+    logger = logging.getLogger('libsousou.process.watchdog')
+
+    def __init__(self, process, ident, budget, rate=100, path=None,
+        max_samples=6000):
+        super(StallWatchdog, self).__init__(name='stall-watchdog')
+        self.daemon = True
+        self.process = process
+        self.target_ident = ident
+        self.budget = budget
+        self.rate = rate
+        self.path = path
+        self.max_samples = max_samples
+        self.stalls = 0
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+        if self.is_alive():
+            self.join()
+
+    def run(self):
+        clock, wait = time.monotonic, self._stopped.wait
+        while not wait(self.budget / 2):
+            started = self.process._tick_started
+            if started is not None and clock() - started >= self.budget:
+                self.sample(started)
+
+    def sample(self, started):
+        """Sample the loop thread while the iteration that started at
+        `started` is running and report the samples.
+        """
+        samples = collections.Counter()
+        interval = 1.0 / self.rate
+        count = 0
+        while self.process._tick_started == started\
+        and count < self.max_samples:
+            frame = sys._current_frames().get(self.target_ident)
+            if frame is None:
+                break
+            samples[fold(frame)] += 1
+            del frame
+            count += 1
+            if self._stopped.wait(interval):
+                break
+        self.stalls += 1
+        self.report(time.monotonic() - started, count, samples)
+
+    def report(self, duration, count, samples):
+        summary = "Main event loop stalled for {0:.3f}s ({1} samples)"\
+            .format(duration, count)
+        if not self.path:
+            self.logger.warning("{0}:\n{1}".format(summary,
+                format_folded(samples)))
+            return
+        try:
+            with open(self.path, 'a') as f:
+                f.write(format_folded(samples))
+        except (IOError, OSError) as e:
+            self.logger.warning("Unable to write stall report to {0}: {1}"\
+                .format(self.path, e))
+        else:
+            self.logger.warning("{0}; report written to {1}".format(
+                summary, self.path))
@@ -0,0 +1,186 @@
+"""
+A producer/consumer variant of :class:`~libsousou.process.loop.BaseProcess`.
+The main event loop produces items into a bounded queue, from which a pool
+of worker threads consumes them in batches.
+"""
+import queue
+import threading
+import time
+
+from libsousou.process.loop import BaseProcess
+
+
+# Sentinel that instructs a worker thread to exit.
+_STOP = object()
+
+
+class WorkQueueProcess(BaseProcess):
+    """Runs :meth:`produce` on the main event loop and :meth:`consume`
+    on :attr:`workers` threads. A worker collects items until it has
+    :attr:`batch_size` of them, or until :attr:`batch_age` seconds have
+    passed since it received the first one, and then consumes them as a
+    batch.
+
+    The queue holds at most :attr:`queue_size` items; when it is full,
+    :meth:`put` blocks, so the producer cannot outrun the workers. When
+    the process exits, through :meth:`stop`, :meth:`drain`, :meth:`join`
+    or a signal, production stops and the workers consume the items
+    remaining in the queue before :meth:`do_cleanup` is invoked.
+    """
+
+    #: The number of worker threads.
+    workers = 4
+
+    #: The maximum number of items in a batch.
+    batch_size = 100
+
+    #: The maximum number of seconds a worker waits for a batch to fill
+    #: up after receiving its first item.
+    batch_age = 0.1
+
+    #: The maximum number of items in the queue.
+    queue_size = 1000
+
+    _transient = ('_queue', '_threads', '_lock')
+
+    def __init__(self, *args, **kwargs):
+        super(WorkQueueProcess, self).__init__(*args, **kwargs)
+        self._queue = queue.Queue(self.queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._started = None
+        self._produced = 0
+        self._consumed = 0
+        self._batches = 0
+        self._failed = 0
+        self._blocked_time = 0.0
+        self._max_depth = 0
+
+    def __setstate__(self, state):
+        super(WorkQueueProcess, self).__setstate__(state)
+        self._queue = queue.Queue(self.queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def _setup(self):
+        super(WorkQueueProcess, self)._setup()
+        self._started = time.monotonic()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker,
+                name='{0}-worker-{1}'.format(type(self).__name__, i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def start(self):
+        try:
+            super(WorkQueueProcess, self).start()
+        finally:
+            self.stop_workers()
+
+    def _run_once(self, block=True):
+        if self.must_exit():
+            self.stop_workers()
+        return super(WorkQueueProcess, self)._run_once(block=block)
+
+    def main_event(self):
+        if self.draining:
+            return False
+        produced = False
+        for item in self.produce() or ():
+            self.put(item)
+            produced = True
+        return produced
+
+    def produce(self):
+        """Hook that returns an iterable of items to consume. Returning
+        an empty iterable or ``None`` indicates that there was no work,
+        causing the main event loop to back off.
+        """
+        raise NotImplementedError
+
+    def consume(self, batch):
+        """Hook that processes a list of items. Invoked from a worker
+        thread.
+        """
+        raise NotImplementedError
+
+    def put(self, item):
+        """Add `item` to the queue, blocking while the queue is full."""
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            started = time.monotonic()
+            self._queue.put(item)
+            self._blocked_time += time.monotonic() - started
+        self._produced += 1
+        depth = self._queue.qsize()
+        if depth > self._max_depth:
+            self._max_depth = depth
+
+    def stop_workers(self):
+        """Stop the worker threads after they have consumed all items in
+        the queue.
+        """
+        threads, self._threads = self._threads, []
+        for thread in threads:
+            self._queue.put(_STOP)
+        for thread in threads:
+            thread.join()
+
+    def queue_stats(self):
+        """Return the throughput and queue statistics as a dictionary."""
+        elapsed = time.monotonic() - self._started if self._started else 0
+        with self._lock:
+            consumed = self._consumed
+            stats = {
+                'produced': self._produced,
+                'consumed': consumed,
+                'batches': self._batches,
+                'failed_batches': self._failed,
+            }
+        stats.update({
+            'depth': self._queue.qsize(),
+            'max_depth': self._max_depth,
+            'blocked_time': self._blocked_time,
+            'throughput': consumed / elapsed if elapsed else 0.0,
+        })
+        return stats
+
+    def _worker(self):
+        get, clock = self._queue.get, time.monotonic
+        while True:
+            item = get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = clock() + self.batch_age
+            stopping = False
+            while len(batch) < self.batch_size:
+                timeout = deadline - clock()
+                try:
+                    item = get(timeout=timeout) if timeout > 0\
+                        else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._consume(batch)
+            if stopping:
+                return
+
+    def _consume(self, batch):
+        failed = 0
+        try:
+            self.consume(batch)
+        except Exception:
+            failed = 1
+            self.logger.exception(
+                "Uncaught exception consuming a batch of {0} items".format(
+                    len(batch)))
+        with self._lock:
+            self._consumed += len(batch)
+            self._batches += 1
+            self._failed += failed
@@ -1,4 +1,7 @@
-import uuid
+import contextvars
+import inspect
+import itertools
+import types
 
 from libsousou.web.exc import Conflict
 from libsousou.web.exc import Forbidden
@@ -14,6 +17,85 @@ from libsousou.web.exc import UnprocessableEntity
 from libsousou.web.exc import UnsupportedMediaType
 
 
+#: The HTTP methods that are dispatched to the method of the same name, in
+#: lowercase, of a :class:`RequestController`.
+HTTP_METHODS = ('GET', 'POST', 'PUT', 'DELETE', 'PATCH', 'HEAD', 'OPTIONS',
+    'TRACE')
+
+#: Create a controller for each request.
+PER_REQUEST = 'per_request'
+
+#: Dispatch all requests to a single controller.
+SHARED = 'shared'
+
+#: Reuse the controllers of completed requests.
+POOLED = 'pooled'
+
+_view_names = itertools.count()
+_context = contextvars.ContextVar('libsousou.web.context')
+
+
+def _requires_authentication(disable_authentication, method):
+    return not disable_authentication \
+        if isinstance(disable_authentication, bool)\
+        else (method.upper() not in disable_authentication)
+
+
+class RequestContext(object):
+    """Holds the state of the request that is dispatched by a
+    :class:`RequestController`; see :attr:`RequestController.context`.
+    Handlers may set arbitrary attributes.
+    """
+
+    def __init__(self, request, args, kwargs):
+        self.request = request
+        self.args = args
+        self.kwargs = kwargs
+
+
+class DispatchTable(object):
+    """The handlers, ``Allow`` header and authentication requirements of
+    a :class:`RequestController` subclass, computed from its attributes
+    when it dispatches its first request. If `instance` is given, its own
+    attributes take precedence over those of the class.
+    """
+
+    def __init__(self, cls, instance=None):
+        source = cls if instance is None else instance
+        attrs = {} if instance is None else instance.__dict__
+        self.cls = cls
+        self.handlers = {}
+        for method in source.http_methods:
+            name = method.lower()
+            if name in attrs:
+                self.handlers[method] = self._get_bound_handler(name)
+                continue
+            attr = inspect.getattr_static(cls, name, None)
+            if attr is None:
+                continue
+            self.handlers[method] = attr\
+                if isinstance(attr, types.FunctionType)\
+                else self._get_bound_handler(name)
+        self.allowed_methods = [x for x in source.http_methods
+            if x in self.handlers]
+        self.allow = ', '.join(self.allowed_methods)
+        self.authenticate = dict(
+            (x, _requires_authentication(source.disable_authentication, x))
+            for x in source.http_methods)
+
+        #: The attributes from which the table is computed; a controller
+        #: that sets any of them on itself gets a table of its own.
+        self.names = frozenset(['http_methods', 'disable_authentication']
+            + [x.lower() for x in HTTP_METHODS + tuple(source.http_methods)])
+
+    def _get_bound_handler(self, name):
+        # Static methods, class methods and other descriptors are
+        # resolved on the instance.
+        def handler(self, *args, **kwargs):
+            return getattr(self, name)(*args, **kwargs)
+        return handler
+
+
 class RequestController(object):
     # Errors are attributes so subclasses don't have to import.
     Forbidden = Forbidden
@@ -74,16 +156,67 @@ class RequestController(object):
     #: The default HTTP status code returned by the endpoint.
     default_status = 200
 
+    #: The HTTP methods that may be dispatched to the controller.
+    http_methods = HTTP_METHODS
+
+    #: Specifies how the view returned by :meth:`as_view` obtains a
+    #: controller for each request: :data:`PER_REQUEST` creates one,
+    #: :data:`SHARED` dispatches all requests, possibly concurrently, to
+    #: a single controller, and :data:`POOLED` reuses the controllers of
+    #: completed requests, keeping at most :attr:`pool_size` of them.
+    #: With :data:`SHARED` and :data:`POOLED`, per-request state must be
+    #: kept in :attr:`context` instead of on the controller.
+    instance_mode = PER_REQUEST
+    pool_size = 16
+
+    # The DispatchTable of the class; see get_dispatch_table().
+    _dispatch_table = None
+
     @property
     def allowed_methods(self):
-        return list(map(str.upper, filter(bool, [getattr(self, x, None)
-            for x in ('GET','POST','PUT','DELETE','PATCH','HEAD','OPTIONS','TRACE')])))
+        return list(self._get_dispatch_table().allowed_methods)
+
+    @property
+    def context(self):
+        """The :class:`RequestContext` of the request being dispatched
+        in the current thread or task. Not available with
+        :data:`PER_REQUEST`, where that state may be kept on the
+        controller itself.
+        """
+        return _context.get()
+
+    @classmethod
+    def get_dispatch_table(cls):
+        """Return the :class:`DispatchTable` of the class. It is computed
+        once, so handlers and :attr:`disable_authentication` must not be
+        changed on the class afterwards. Controllers that set them on
+        themselves are dispatched with a table computed for each request.
+        """
+        table = cls._dispatch_table
+        if table is None or table.cls is not cls:
+            table = cls._dispatch_table = DispatchTable(cls)
+        return table
 
     @classmethod
     def as_view(cls, *args, **kwargs):
-        def f(*a, **k):
+        if cls.instance_mode == SHARED:
             instance = cls()
-            return instance.dispatch(*a, **k)
+            def f(*a, **k):
+                return instance.dispatch(*a, **k)
+        elif cls.instance_mode == POOLED:
+            pool = []
+            def f(*a, **k):
+                try:
+                    instance = pool.pop()
+                except IndexError:
+                    instance = cls()
+                response = instance.dispatch(*a, **k)
+                if len(pool) < cls.pool_size:
+                    pool.append(instance)
+                return response
+        else:
+            def f(*a, **k):
+                return cls().dispatch(*a, **k)
 
         #: Indicated that the :meth:`dispatch()` method expects a request
         #: object. This attribute is used for very obscure purposes, and
@@ -92,15 +225,15 @@ class RequestController(object):
 
         # Flask maps the view functions by their __name__ attribute (wtf?)
         # so we assign a unique name.
-        f.__name__ = ''.join([cls.__name__, '_', uuid.uuid1().hex])
+        f.__name__ = '{0}_{1}'.format(cls.__name__, next(_view_names))
         return f
 
     def authenticate(self, request, *args, **kwargs):
         """Authenticate the request or raise a :class:`~libsousou.web.exc.NotAuthorized`
         exception, causing the controller to return a ``401`` response.
         """
-        if not self.is_authenticated(request, *args, **kwargs)\
-        and self._must_authenticate(request.get_request_method()):
+        if self._must_authenticate(request.get_request_method())\
+        and not self.is_authenticated(request, *args, **kwargs):
             headers = {}
             if self.enable_www_auth:
                 headers['WWW-Authenticate'] = \
@@ -157,13 +290,22 @@ class RequestController(object):
             libsousou.web.exc.MethodNotAllowed: the method specified
                 in the request was not allowed.
         """
+        if self.instance_mode == PER_REQUEST:
+            return self._dispatch(request, args, kwargs)
+        token = _context.set(RequestContext(request, args, kwargs))
+        try:
+            return self._dispatch(request, args, kwargs)
+        finally:
+            _context.reset(token)
+
+    def _dispatch(self, request, args, kwargs):
         method = request.get_request_method()
         try:
             self.authenticate(request, *args, **kwargs)
             handler = self._get_request_handler(method)
             if self.strict:
                 self._validate_request(request)
-            response = handler(request, *args, **kwargs)
+            response = handler(self, request, *args, **kwargs)
         except HttpException as e:
             response = e.render_to_response(self.render_to_response, request)
         except Exception as e:
@@ -205,15 +347,28 @@ class RequestController(object):
                     .format(', '.join(self.allowed_content_types))
             })
 
+    def _get_dispatch_table(self):
+        table = self._dispatch_table
+        if table is None or table.cls is not type(self):
+            table = self.get_dispatch_table()
+        if self.__dict__ and not table.names.isdisjoint(self.__dict__):
+            table = DispatchTable(type(self), self)
+        return table
+
     def _get_request_handler(self, method):
-        try:
-            return getattr(self, method.lower())
-        except AttributeError:
-            raise MethodNotAllowed(
-                headers={'Allow': ', '.join(self.allowed_methods)}
-            )
+        # Return the function handling `method`, which is invoked with the
+        # controller as its first argument.
+        table = self._get_dispatch_table()
+        handler = table.handlers.get(method)\
+            or table.handlers.get(method.upper())
+        if handler is None:
+            raise MethodNotAllowed(headers={'Allow': table.allow})
+        return handler
 
     def _must_authenticate(self, method):
-        return not self.disable_authentication \
-            if isinstance(self.disable_authentication, bool)\
-            else (method.upper() not in self.disable_authentication)
+        table = self._get_dispatch_table()
+        must_authenticate = table.authenticate.get(method)
+        if must_authenticate is None:
+            must_authenticate = _requires_authentication(
+                self.disable_authentication, method)
+        return must_authenticate
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Measure the overhead of dispatching requests through the views returned
+by :meth:`libsousou.web.RequestController.as_view`.
+"""
+from os.path import dirname
+from os.path import join
+import sys
+import timeit
+
+sys.path.insert(0, join(dirname(__file__), '..'))
+
+from libsousou.web import RequestController
+
+
+class Request(object):
+    content_type = 'application/json'
+
+    def __init__(self, method):
+        self.method = method
+
+    def get_request_method(self):
+        return self.method
+
+    def accepts_content_type(self, content_type):
+        return True
+
+
+class Controller(RequestController):
+    disable_authentication = True
+
+    def render(self, context):
+        return context
+
+    def response_factory(self, content, *args, **kwargs):
+        return content
+
+    def get(self, request, *args, **kwargs):
+        return 'ok'
+
+
+def benchmark(name, view, request, number=200000, repeat=5):
+    best = min(timeit.repeat(lambda: view(request), number=number,
+        repeat=repeat))
+    print("{0:<24} {1:8.0f} ns/request".format(name, best / number * 1e9))
+
+
+def main():
+    modes = [('per request', None)]
+    for mode in ('shared', 'pooled'):
+        if hasattr(RequestController, 'instance_mode'):
+            modes.append((mode, mode))
+    for name, mode in modes:
+        cls = type('Controller', (Controller,), {})
+        if mode is not None:
+            cls.instance_mode = mode
+        view = cls.as_view()
+        benchmark('GET ({0})'.format(name), view, Request('GET'))
+        benchmark('DELETE ({0})'.format(name), view, Request('DELETE'))
+    benchmark('as_view()', lambda request: Controller.as_view(), None,
+        number=20000)
+
+
+if __name__ == '__main__':
+    main()
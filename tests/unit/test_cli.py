@@ -1,5 +1,22 @@
+import contextlib
+import io
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
 import unittest
+from unittest import mock
 
+from libsousou.cli import BaseCommand
+from libsousou.cli import client
+from libsousou.cli import importtime
+from libsousou.cli import manifest
+from libsousou.cli.parallel import ParallelCommand
+from libsousou.cli.server import CommandServer
 from libsousou.cli.baseparser import BaseParser
 from libsousou.cli.test import Command as TestCommand
 
@@ -37,6 +54,325 @@ class CommandLineInterfaceTestCase(unittest.TestCase):
             ['.'.join([TestCommand.__module__])]
         )
 
+    def test_command_modules_are_recorded(self):
+        self.assertEqual(self.parser.command_modules, [TestCommand.__module__])
+
+    def test_parser_does_not_import_plugins(self):
+        output = subprocess.check_output([sys.executable, '-c',
+            'import sys, libsousou.cli.baseparser; print(sorted(sys.modules))'])
+        for name in ('libsousou.plugins', 'libsousou.cli.manifest'):
+            self.assertNotIn(repr(name), output.decode('ascii'))
+
+
+class ProfilingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = BaseParser(exit=lambda x, *a, **kw: x)
+        self.parser.add_command(TestCommand)
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def run_command(self, *args):
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            exitcode = self.parser.run_from_command_line(
+                list(args) + ['testcommand', 'foo'])
+        self.assertEqual(exitcode, 0)
+        return stderr.getvalue()
+
+    def test_timings(self):
+        output = self.run_command('--timings')
+        for phase in BaseParser.PHASES:
+            self.assertIn(phase, output)
+
+    def test_profile_summary(self):
+        # --profile without a file must not consume the subcommand.
+        self.assertIn('function calls', self.run_command('--profile'))
+
+    def test_profile_formats(self):
+        for output_format in ('pstats', 'callgrind-text', 'json'):
+            filename = os.path.join(self.tempdir, output_format)
+            self.run_command('--profile-format', output_format,
+                '--profile=' + filename)
+            self.assertTrue(os.path.getsize(filename) > 0)
+
+
+class LazyRegistrationTestCase(unittest.TestCase):
+    command_list = [TestCommand.__module__]
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.manifest_path = os.path.join(self.tempdir, 'manifest.json')
+        self.parser = BaseParser(exit=lambda x, *a, **kw: x)
+        self.parser.register_commands(self.command_list, lazy=True,
+            manifest_path=self.manifest_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_manifest_is_cached(self):
+        self.assertEqual(
+            manifest.read(self.manifest_path, self.command_list)[0]['name'],
+            TestCommand.command_name)
+
+    def test_help_equals_eager_registration(self):
+        parser = BaseParser(exit=lambda x, *a, **kw: x)
+        parser.register_commands(self.command_list)
+        self.assertEqual(self.parser._parser.format_help(),
+            parser._parser.format_help())
+
+    def test_selected_command_is_loaded(self):
+        TestCommand.executed = False
+        exitcode = self.parser.run_from_command_line(
+            ['testcommand', 'foo', '--named', 'bar'])
+        self.assertEqual(exitcode, 0)
+        self.assertTrue(TestCommand.executed)
+        self.assertNotIn('testcommand', self.parser._lazy_commands)
+
+    def test_stale_manifest_is_ignored(self):
+        self.assertIsNone(manifest.read(self.manifest_path, ['foo']))
+
+    def test_failed_write_removes_temporary_file(self):
+        os.unlink(self.manifest_path)
+        with mock.patch('os.replace', side_effect=OSError):
+            self.assertFalse(manifest.write(self.manifest_path,
+                self.command_list, []))
+        self.assertEqual(os.listdir(self.tempdir), [])
+
+
+class ManifestTestCase(unittest.TestCase):
+    # Command modules in a package created for each test.
+    modules = {
+        '__init__.py': '',
+        'util.py': 'NAME = "dynamic"\n',
+        'static.py': '\n'.join([
+            'from libsousou.cli import BaseCommand',
+            'from manifestpkg import util',
+            'class Command(BaseCommand):',
+            '    command_name = "static"',
+            '    def handle(self, args): pass',
+        ]),
+        'dynamic.py': '\n'.join([
+            'from libsousou.cli import BaseCommand',
+            'from manifestpkg import util',
+            'class Command(BaseCommand):',
+            '    @property',
+            '    def command_name(self): return util.NAME',
+            '    def handle(self, args): pass',
+        ]),
+    }
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        package = os.path.join(self.tempdir, 'manifestpkg')
+        os.mkdir(package)
+        for name, source in self.modules.items():
+            with open(os.path.join(package, name), 'w') as f:
+                f.write(source)
+        sys.path.insert(0, self.tempdir)
+        self.addCleanup(sys.path.remove, self.tempdir)
+        self.addCleanup(self.unload)
+        self.manifest_path = os.path.join(self.tempdir, 'manifest.json')
+
+    def unload(self):
+        for name in list(sys.modules):
+            if name.split('.')[0] == 'manifestpkg':
+                del sys.modules[name]
+
+    def test_property_command_name(self):
+        entries = manifest.load(['manifestpkg.dynamic'], self.manifest_path)
+        self.assertEqual(entries[0]['name'], 'dynamic')
+        self.assertIsNotNone(
+            manifest.read(self.manifest_path, ['manifestpkg.dynamic']))
+
+    def test_dependency_change_invalidates_manifest(self):
+        manifest.load(['manifestpkg.static'], self.manifest_path)
+        self.assertIsNotNone(
+            manifest.read(self.manifest_path, ['manifestpkg.static']))
+        filename = os.path.join(self.tempdir, 'manifestpkg', 'util.py')
+        mtime = os.stat(filename).st_mtime
+        os.utime(filename, (mtime + 10, mtime + 10))
+        self.assertIsNone(
+            manifest.read(self.manifest_path, ['manifestpkg.static']))
+
+
+class SquareCommand(ParallelCommand):
+    command_name = 'square'
+
+    def handle_item(self, item):
+        return int(item) ** 2
+
+
+class ParallelCommandTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = BaseParser(exit=lambda x, *a, **kw: x)
+        self.parser.add_command(SquareCommand)
+        fd, self.input = tempfile.mkstemp()
+        with os.fdopen(fd, 'w') as f:
+            f.write('\n'.join(map(str, range(100))) + '\n')
+
+    def tearDown(self):
+        os.unlink(self.input)
+
+    def run_command(self, *args):
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout):
+            exitcode = self.parser.run_from_command_line(
+                ['square', '--input', self.input, '--progress', '0']
+                + list(args))
+        self.assertEqual(exitcode, 0)
+        return [int(x) for x in stdout.getvalue().split()]
+
+    def test_serial(self):
+        self.assertEqual(self.run_command(), [x ** 2 for x in range(100)])
+
+    def test_parallel_ordered(self):
+        results = self.run_command('--jobs', '2', '--chunk-size', '3',
+            '--ordered')
+        self.assertEqual(results, [x ** 2 for x in range(100)])
+
+    def test_parallel_unordered(self):
+        results = self.run_command('--jobs', '2', '--chunk-size', '1')
+        self.assertEqual(sorted(results), [x ** 2 for x in range(100)])
+
+
+class SlowFileHandler(logging.FileHandler):
+
+    def emit(self, record):
+        time.sleep(0.1)
+        super(SlowFileHandler, self).emit(record)
+
+
+class LoggingCommand(BaseCommand):
+    command_name = 'logcommand'
+
+    def handle(self, args):
+        logging.getLogger('tests.cli').warning("logged by the command")
+
+
+class CommandServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.tempdir, 'cli.sock')
+        self.log_path = os.path.join(self.tempdir, 'log')
+        self.handler = SlowFileHandler(self.log_path)
+        logging.getLogger().addHandler(self.handler)
+        self.addCleanup(logging.getLogger().removeHandler, self.handler)
+        self.addCleanup(self.handler.close)
+        parser = BaseParser(exit=lambda x, *a, **kw: x)
+        parser.register_commands([TestCommand.__module__])
+        parser.add_command(LoggingCommand)
+        self.server = CommandServer(parser, self.socket_path)
+        self.server.queued_logging = True
+        self.thread = self.server.start_threaded()
+        while not os.path.exists(self.socket_path):
+            self.thread.join(0.01)
+
+    def tearDown(self):
+        self.server.stop()
+        self.thread.join()
+        shutil.rmtree(self.tempdir)
+
+    def test_invoke(self):
+        # Run a command on the server with the stdout of the child
+        # redirected to a pipe.
+        r, w = os.pipe()
+        with client.connect(self.socket_path) as sock:
+            status = client.invoke(sock, ['testcommand', 'foo'],
+                fds=(0, w, 2))
+        os.close(w)
+        os.close(r)
+        self.assertEqual(status, 0)
+
+    def test_invoke_reports_exit_status(self):
+        # An unknown command exits with status 2.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        with client.connect(self.socket_path) as sock:
+            status = client.invoke(sock, ['foo'], fds=(0, 1, devnull))
+        os.close(devnull)
+        self.assertEqual(status, 2)
+
+    def test_child_writes_queued_log_records(self):
+        with client.connect(self.socket_path) as sock:
+            status = client.invoke(sock, ['logcommand'])
+        self.assertEqual(status, 0)
+        with open(self.log_path) as f:
+            self.assertIn("logged by the command", f.read())
+
+    def test_socket_is_private(self):
+        self.assertEqual(os.stat(self.socket_path).st_mode & 0o777, 0o600)
+
+    def test_rejects_other_users(self):
+        if not hasattr(socket, 'SO_PEERCRED'):
+            self.skipTest("SO_PEERCRED is not available")
+        self.server.uid = os.getuid() + 1
+        with self.assertLogs(self.server.logger, 'WARNING'):
+            with client.connect(self.socket_path) as sock:
+                sock.settimeout(5)
+                self.assertEqual(sock.recv(4), b'')
+        self.assertEqual(self.server.children, set())
+
+    def test_stop_interrupts_wait(self):
+        started = time.time()
+        self.server.stop()
+        self.thread.join(5)
+        self.assertLess(time.time() - started, 0.5)
+
+    def test_client_does_not_import_parser(self):
+        output = subprocess.check_output([sys.executable, '-c',
+            'import sys, libsousou.cli.client; print(sorted(sys.modules))'])
+        for name in ('argparse', 'logging', 'libsousou.cli.baseparser',
+                'libsousou.plugins'):
+            self.assertNotIn(repr(name), output.decode('ascii'))
+
+    def test_run_falls_back_to_in_process(self):
+        parser = BaseParser(exit=lambda x, *a, **kw: x)
+        parser.add_command(TestCommand)
+        status = client.run(lambda: parser,
+            os.path.join(self.tempdir, 'missing.sock'), ['testcommand', 'foo'])
+        self.assertEqual(status, 0)
+
+
+class ImportTimeTestCase(unittest.TestCase):
+    output = '\n'.join([
+        'import time: self [us] | cumulative | imported package',
+        'import time:        10 |         10 |   _io',
+        importtime.MARKER,
+        'import time:       100 |        100 |     c',
+        'import time:        50 |        150 |   b',
+        'import time:        20 |        170 | a',
+        'import time:        30 |         30 | d',
+    ])
+
+    def test_parse_builds_tree(self):
+        # Modules imported before the marker are ignored; children are
+        # printed before their parent.
+        nodes = importtime.parse(self.output)
+        self.assertEqual([x.name for x in nodes], ['a', 'd'])
+        self.assertEqual(nodes[0].children[0].name, 'b')
+        self.assertEqual(nodes[0].children[0].children[0].name, 'c')
+        self.assertEqual(importtime.total(nodes), 200)
+
+    def test_compare_detects_regression(self):
+        nodes = importtime.parse(self.output)
+        baseline = {'total_us': 100, 'modules': [
+            {'module': 'a', 'cumulative_us': 70}]}
+        regressed, slower = importtime.compare(nodes, baseline, 10)
+        self.assertTrue(regressed)
+        self.assertEqual(slower, [('a', 70, 170)])
+
+    def test_command_measures_imports(self):
+        parser = BaseParser(exit=lambda x, *a, **kw: x)
+        parser.add_command(importtime.Command)
+        exitcode = parser.run_from_command_line(
+            ['importtime', 'libsousou.cli.test', '--format', 'json'])
+        self.assertEqual(exitcode, 0)
+
 
 if __name__ == '__main__':
     unittest.main()
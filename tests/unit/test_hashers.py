@@ -1,6 +1,12 @@
+import os
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 
-
+from libsousou import plugins
+from libsousou.hashers.base import get_hasher
+from libsousou.hashers.base import get_plugin_hasher
 from libsousou.hashers.pbkdf2 import PBKDF2PasswordHasherSHA256
 from libsousou.hashers.pbkdf2 import PBKDF2PasswordHasherSHA512
 from libsousou.hashers.base import check_password
@@ -9,6 +15,22 @@ from libsousou.hashers.base import make_password
 from libsousou.hashers.base import is_password_usable
 
 
+def setUpModule():
+    # Never read or write the plugin index of the user.
+    global tempdir, environ
+    tempdir = tempfile.mkdtemp()
+    environ = mock.patch.dict(os.environ, {
+        'LIBSOUSOU_PLUGIN_INDEX': os.path.join(tempdir, 'plugins.json')})
+    environ.start()
+    plugins.registry._indexed = plugins.registry._plugins = None
+
+
+def tearDownModule():
+    environ.stop()
+    shutil.rmtree(tempdir)
+    plugins.registry._indexed = plugins.registry._plugins = None
+
+
 class PBKDF2PasswordHasherSHA256TestCase(unittest.TestCase):
     password = 'foo'
     salt = 'bar'
@@ -73,5 +95,59 @@ class PublicApiTestCase(unittest.TestCase):
         self.assertFalse(constant_time_compare('f','ff'))
 
 
+class PluginHasherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        registry = plugins.registry
+        registry._indexed = registry._plugins = None
+        if os.path.exists(registry.index_path):
+            os.unlink(registry.index_path)
+        self.addCleanup(setattr, registry, '_indexed', None)
+        self.addCleanup(setattr, registry, '_plugins', None)
+
+    def write_index(self, name, path):
+        plugins.registry.write_index('key',
+            [plugins.Plugin(name, 'hasher', path, '')])
+
+    def test_indexed_plugin_does_not_discover(self):
+        self.write_index('pbkdf2_sha256',
+            'libsousou.hashers.PBKDF2PasswordHasherSHA256')
+        registry = plugins.registry
+        with mock.patch.object(registry, 'discover') as discover,\
+        mock.patch.object(plugins, 'get_metadata_key') as get_metadata_key:
+            get_plugin_hasher('pbkdf2_sha256')
+        self.assertFalse(discover.called)
+        self.assertFalse(get_metadata_key.called)
+
+    def test_unknown_algorithm_discovers_once(self):
+        registry = plugins.registry
+        with mock.patch.object(registry, 'discover', return_value=[])\
+        as discover, mock.patch.object(registry, 'write_index'):
+            self.assertFalse(is_password_usable('foo$bar'))
+            self.assertRaises(ValueError, get_hasher, 'foo')
+        self.assertEqual(discover.call_count, 1)
+
+    def test_stale_index_is_refreshed(self):
+        self.write_index('foo', 'libsousou.hashers.PBKDF2PasswordHasherSHA256')
+        plugin = plugins.Plugin('pbkdf2_sha256', 'hasher',
+            'libsousou.hashers.PBKDF2PasswordHasherSHA256', '')
+        registry = plugins.registry
+        with mock.patch.object(registry, 'discover', return_value=[plugin]):
+            hasher = get_plugin_hasher('pbkdf2_sha256')
+        self.assertIsInstance(hasher, PBKDF2PasswordHasherSHA256)
+        self.assertEqual(registry.read_index(), [plugin])
+
+    def test_indexed_plugin(self):
+        self.write_index('pbkdf2_sha256',
+            'libsousou.hashers.PBKDF2PasswordHasherSHA256')
+        hasher = get_plugin_hasher('pbkdf2_sha256')
+        self.assertIsInstance(hasher, PBKDF2PasswordHasherSHA256)
+
+    def test_algorithm_mismatch_raises_valueerror(self):
+        self.write_index('foo', 'libsousou.hashers.PBKDF2PasswordHasherSHA256')
+        self.assertRaises(ValueError, get_plugin_hasher, 'foo')
+        self.assertRaises(ValueError, get_hasher, 'foo')
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,3 +1,5 @@
+import importlib
+import sys
 import unittest
 
 from libsousou import module_loading
@@ -13,6 +15,55 @@ class ModuleLoadingTestCase(unittest.TestCase):
         # Provide a non existent module path to import_string().
         self.assertRaises(ImportError, module_loading.import_string, 'os.foo')
 
+    def test_import_string_caches_result(self):
+        # Resolve the same path twice and assert that the cached
+        # object is returned.
+        obj = module_loading.import_string('os.path.join')
+        self.assertIn('os.path.join', module_loading.resolver._resolved)
+        self.assertIs(module_loading.import_string('os.path.join'), obj)
+
+    def test_import_string_caches_failure(self):
+        # A failed lookup is cached and raises ImportError again.
+        self.assertRaises(ImportError, module_loading.import_string, 'os.bar')
+        self.assertIn('os.bar', module_loading.resolver._failed)
+        self.assertRaises(ImportError, module_loading.import_string, 'os.bar')
+
+    def test_cached_failure_keeps_type_and_message(self):
+        with self.assertRaises(ModuleNotFoundError) as first:
+            module_loading.import_string('libsousou_missing.foo')
+        with self.assertRaises(ModuleNotFoundError) as second:
+            module_loading.import_string('libsousou_missing.foo')
+        self.assertIsNot(second.exception, first.exception)
+        self.assertEqual(str(second.exception), str(first.exception))
+        self.assertEqual(second.exception.name, 'libsousou_missing')
+        # The cache must not keep the exception, and thus its traceback.
+        for value in module_loading.resolver._failed['libsousou_missing.foo']:
+            self.assertNotIsInstance(value, BaseException)
+
+    def test_install_hook_is_idempotent(self):
+        module_loading._install_hook(module_loading.resolver)
+        module_loading._install_hook(module_loading.resolver)
+        hooks = [x for x in sys.meta_path
+            if type(x).__name__ == '_InvalidationHook']
+        self.assertEqual(len(hooks), 1)
+        self.assertIs(hooks[0].resolver, module_loading.resolver)
+
+    def test_invalidate_caches_clears_resolver(self):
+        # importlib.invalidate_caches() must also clear the resolver.
+        module_loading.import_string('os.path.join')
+        importlib.invalidate_caches()
+        self.assertNotIn('os.path.join', module_loading.resolver._resolved)
+
+    def test_preload_returns_failed_paths(self):
+        failed = module_loading.preload(['os.path.join', 'os.baz'])
+        self.assertEqual(failed, ['os.baz'])
+
+    def test_get_preload_modules(self):
+        modules = module_loading.get_preload_modules(
+            ['os.path.join', 'os.path.exists', 'json'])
+        self.assertEqual(modules,
+            ['os.path', 'os.path.join', 'os.path.exists', 'json'])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,76 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from libsousou import plugins
+from libsousou.cli.baseparser import BaseParser
+from libsousou.cli.test import Command as TestCommand
+
+
+ENTRY_POINTS = {
+    'libsousou.hashers': [
+        ('pbkdf2_sha256', 'libsousou.hashers.PBKDF2PasswordHasherSHA256')
+    ],
+    'libsousou.commands': [
+        ('testcommand', 'libsousou.cli.test.Command')
+    ]
+}
+
+
+def iter_entry_points(group):
+    return iter(ENTRY_POINTS.get(group, []))
+
+
+@mock.patch('libsousou.plugins.iter_entry_points', iter_entry_points)
+class PluginRegistryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.index_path = os.path.join(self.tempdir, 'plugins.json')
+        self.registry = plugins.PluginRegistry(self.index_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_discovery_writes_index(self):
+        # Listing the plugins must write the index file.
+        commands = self.registry.plugins('command')
+        self.assertEqual(commands[0].help, TestCommand.help_text)
+        self.assertTrue(os.path.exists(self.index_path))
+
+    def test_warm_index_does_not_discover(self):
+        # A second registry reads the index without scanning the entry
+        # points.
+        self.registry.plugins('hasher')
+        registry = plugins.PluginRegistry(self.index_path)
+        with mock.patch.object(registry, 'discover') as discover:
+            hashers = registry.plugins('hasher')
+        self.assertFalse(discover.called)
+        self.assertEqual(hashers[0].name, 'pbkdf2_sha256')
+
+    def test_stale_index_is_ignored(self):
+        self.registry.plugins('hasher')
+        self.assertIsNone(self.registry.read_index('foo'))
+
+    def test_failed_write_removes_temporary_file(self):
+        with mock.patch('os.replace', side_effect=OSError):
+            self.registry.write_index('key', [])
+        self.assertEqual(os.listdir(self.tempdir), [])
+
+    def test_get_raises_lookuperror(self):
+        self.assertRaises(LookupError, self.registry.get, 'command', 'foo')
+
+    def test_load(self):
+        self.assertIs(self.registry.load('command', 'testcommand'), TestCommand)
+
+    def test_register_plugins(self):
+        parser = BaseParser(exit=lambda x, *a, **kw: x)
+        parser.register_plugins(self.registry)
+        self.assertEqual(
+            parser.run_from_command_line(['testcommand', 'foo']), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
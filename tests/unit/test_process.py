@@ -0,0 +1,1467 @@
+import asyncio
+import json
+import logging
+import multiprocessing
+import operator
+import os
+import pickle
+import queue
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import textwrap
+import threading
+import time
+import tracemalloc
+import unittest
+
+from libsousou.process import logqueue
+from libsousou.process import loop
+from libsousou.process.aio import AsyncBaseProcess
+from libsousou.process.channel import Channel
+from libsousou.process.channel import RingBuffer
+from libsousou.process.cooperative import LoopGroup
+from libsousou.process.cooperative import LoopPool
+from libsousou.process.handoff import receive_sockets
+from libsousou.process.loop import BaseProcess
+from libsousou.process.loop import TickScheduler
+from libsousou.process.memory import MemoryProfiler
+from libsousou.process.metrics import FORMAT_PROMETHEUS
+from libsousou.process.metrics import LatencyHistogram
+from libsousou.process.metrics import LoopMetrics
+from libsousou.process.metrics import MetricsDumper
+from libsousou.process.metrics import format_prometheus
+from libsousou.process.selector import SelectorProcess
+from libsousou.process.sockets import Listeners
+from libsousou.process.sockets import bind_socket
+from libsousou.process.sockets import parse_address
+from libsousou.process.supervisor import Supervisor
+from libsousou.process.timers import TimingWheel
+from libsousou.process.supervisor import WorkerSlot
+from libsousou.process.workqueue import WorkQueueProcess
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class CountingProcess(BaseProcess):
+
+    def setup(self):
+        self.count = 0
+
+    def main_event(self):
+        self.count += 1
+        return False
+
+
+class TickSchedulerTestCase(unittest.TestCase):
+
+    def get_scheduler(self, *args, **kwargs):
+        scheduler = TickScheduler(*args, **kwargs)
+        scheduler.clock = FakeClock()
+        scheduler.reset()
+        return scheduler
+
+    def test_fixed_rate_does_not_drift(self):
+        # The next tick is computed from the schedule, not from the
+        # time the iteration ended.
+        scheduler = self.get_scheduler(1.0)
+        scheduler.clock.now = 100.3
+        scheduler.completed(100.3)
+        self.assertEqual(scheduler.next_tick, 101.0)
+        self.assertAlmostEqual(scheduler.remaining(), 0.7)
+
+    def test_fixed_rate_overrun_skip(self):
+        scheduler = self.get_scheduler(1.0, overrun=loop.OVERRUN_SKIP)
+        self.assertTrue(scheduler.completed(102.5))
+        self.assertEqual(scheduler.next_tick, 103.0)
+        self.assertFalse(scheduler.completed(103.5))
+        self.assertEqual(scheduler.next_tick, 104.0)
+
+    def test_fixed_rate_overrun_catch_up(self):
+        scheduler = self.get_scheduler(1.0, overrun=loop.OVERRUN_CATCH_UP)
+        scheduler.completed(102.5)
+        self.assertEqual(scheduler.next_tick, 101.0)
+
+    def test_fixed_rate_overrun_log(self):
+        scheduler = self.get_scheduler(1.0, overrun=loop.OVERRUN_LOG)
+        with self.assertLogs(scheduler.logger, 'WARNING'):
+            scheduler.completed(102.5)
+        self.assertEqual(scheduler.next_tick, 102.5)
+
+    def test_adaptive_backoff(self):
+        scheduler = self.get_scheduler(min_backoff=0.1, max_backoff=0.3)
+        for expected in (0.1, 0.2, 0.3, 0.3):
+            scheduler.completed(100.0, idle=True)
+            self.assertAlmostEqual(scheduler.next_tick, 100.0 + expected)
+        scheduler.completed(100.0)
+        self.assertEqual(scheduler.next_tick, 100.0)
+
+    def test_fixed_rate_requires_interval(self):
+        self.assertRaises(ValueError, TickScheduler, mode=loop.FIXED_RATE)
+
+
+class BaseProcessTestCase(unittest.TestCase):
+
+    def test_idle_loop_backs_off(self):
+        p = CountingProcess()
+        p.start_threaded()
+        time.sleep(0.2)
+        p.stop()
+        p.thread.join()
+        self.assertLess(p.count, 50)
+
+    def test_metrics_are_opt_in(self):
+        p = CountingProcess()
+        p.start_threaded()
+        time.sleep(0.05)
+        p.stop()
+        p.thread.join(5)
+        self.assertGreater(p.count, 0)
+        self.assertIsNone(p.metrics)
+
+    def test_stop_interrupts_wait(self):
+        # A process with a long interval must exit immediately when
+        # stopped.
+        p = CountingProcess(framerate=60)
+        p.start_threaded()
+        time.sleep(0.05)
+        started = time.time()
+        p.stop()
+        p.thread.join()
+        self.assertLess(time.time() - started, 1)
+        self.assertEqual(p.count, 1)
+
+    def test_metrics_dump(self):
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        p = CountingProcess(framerate=0.01)
+        p.metrics_target = os.path.join(tempdir, 'metrics.json')
+        p.metrics_interval = 0.05
+        p.start_threaded()
+        time.sleep(0.2)
+        p.stop()
+        p.thread.join(5)
+        with open(p.metrics_target) as f:
+            snapshot = json.load(f)
+        self.assertEqual(snapshot['ticks'], p.count)
+        self.assertEqual(snapshot['tick_time']['count'], p.count)
+
+    def test_metrics_reset(self):
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        p = CountingProcess(framerate=0.01)
+        p.metrics_target = os.path.join(tempdir, 'metrics.json')
+        p.metrics_interval = 0.05
+        p.metrics_reset = True
+        p.start_threaded()
+        time.sleep(0.2)
+        p.stop()
+        p.thread.join(5)
+        with open(p.metrics_target) as f:
+            snapshot = json.load(f)
+        self.assertLess(snapshot['ticks'], p.count)
+        self.assertEqual(p.metrics.ticks, 0)
+
+
+class ForkserverProcess(CountingProcess):
+    start_method = 'forkserver'
+    preload = ['libsousou.hashers.base.get_hasher']
+
+    def main_event(self):
+        self.stop()
+
+
+class StartMethodTestCase(unittest.TestCase):
+
+    def test_forkserver(self):
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        p = ForkserverProcess()
+        p.metrics_target = os.path.join(tempdir, 'metrics.json')
+        p.metrics_interval = 60
+        process = p.start_process()
+        self.assertGreater(p.metrics.spawn_latency, 0)
+        process.join(30)
+        self.assertEqual(process.exitcode, 0)
+        with open(p.metrics_target) as f:
+            snapshot = json.load(f)
+        self.assertGreater(snapshot['spawn_latency'], 0)
+        self.assertEqual(snapshot['ticks'], 1)
+
+    def test_forkserver_preload_is_shared(self):
+        ForkserverProcess().start_process().join(30)
+        p = ForkserverProcess()
+        p.preload = ['libsousou.web.base.RequestController']
+        with self.assertLogs('__main__', 'WARNING') as logs:
+            process = p.start_process()
+        process.join(30)
+        self.assertEqual(process.exitcode, 0)
+        self.assertIn('libsousou.web.base', logs.output[0])
+
+    def test_pickle_recreates_events(self):
+        p = pickle.loads(pickle.dumps(CountingProcess(framerate=0.01)))
+        self.assertFalse(p._evnt_exit.is_set())
+        self.assertIsNone(p.thread)
+
+
+class DrainingProcess(CountingProcess):
+
+    def setup(self):
+        super(DrainingProcess, self).setup()
+        self.in_flight = 3
+        self.accepting = True
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(1)
+
+    def main_event(self):
+        self.count += 1
+        if not self.accepting and self.in_flight:
+            self.in_flight -= 1
+
+    def listening_sockets(self):
+        return {'http': self.listener}
+
+    def stop_accepting(self):
+        self.accepting = False
+        self.listener.close()
+
+    def is_drained(self):
+        return self.in_flight == 0
+
+
+class DrainTestCase(unittest.TestCase):
+
+    def test_drain_finishes_work(self):
+        p = DrainingProcess(framerate=0.01)
+        p.start_threaded()
+        time.sleep(0.05)
+        p.drain()
+        p.thread.join(5)
+        self.assertFalse(p.thread.is_alive())
+        self.assertFalse(p.accepting)
+        self.assertEqual(p.in_flight, 0)
+
+    def test_drain_deadline(self):
+        p = DrainingProcess(framerate=0.01)
+        p.is_drained = lambda: False
+        p.start_threaded()
+        time.sleep(0.05)
+        started = time.time()
+        with self.assertLogs('__main__', 'WARNING'):
+            p.drain(timeout=0.1)
+            p.thread.join(5)
+        self.assertFalse(p.thread.is_alive())
+        self.assertLess(time.time() - started, 1)
+
+    def test_drain_deadline_with_slow_framerate(self):
+        p = DrainingProcess(framerate=3.0)
+        p.is_drained = lambda: False
+        p.start_threaded()
+        time.sleep(0.05)
+        started = time.time()
+        with self.assertLogs('__main__', 'WARNING'):
+            p.drain(timeout=0.3)
+            p.thread.join(5)
+        self.assertFalse(p.thread.is_alive())
+        self.assertLess(time.time() - started, 0.6)
+
+    def test_handoff(self):
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        received = {}
+
+        def receive():
+            received.update(receive_sockets(path, timeout=5))
+
+        path = os.path.join(tempdir, 'handoff.sock')
+        receiver = threading.Thread(target=receive)
+        receiver.start()
+        while not os.path.exists(path):
+            time.sleep(0.01)
+        p = DrainingProcess(framerate=0.01)
+        p.handoff_path = path
+        p.start_threaded()
+        time.sleep(0.05)
+        address = p.listener.getsockname()
+        p.drain()
+        p.thread.join(5)
+        receiver.join(5)
+        self.assertEqual(received['http'].getsockname(), address)
+        received['http'].close()
+
+    def test_second_signal_forces_exit(self):
+        script = textwrap.dedent("""
+            import sys
+            from libsousou.process.loop import BaseProcess
+
+            class Process(BaseProcess):
+                def main_event(self):
+                    # Signal handlers are registered after setup().
+                    sys.stdout.write('ready\\n')
+                    sys.stdout.flush()
+                    return False
+                def is_drained(self):
+                    return False
+
+            Process().start()
+        """)
+        child = subprocess.Popen([sys.executable, '-c', script],
+            stdout=subprocess.PIPE, cwd=os.path.dirname(os.path.dirname(
+                os.path.dirname(os.path.abspath(__file__)))))
+        self.assertEqual(child.stdout.readline(), b'ready\n')
+        child.send_signal(signal.SIGTERM)
+        time.sleep(0.2)
+        self.assertIsNone(child.poll())
+        child.send_signal(signal.SIGTERM)
+        self.assertEqual(child.wait(5), 1)
+        child.stdout.close()
+
+
+class StallingProcess(CountingProcess):
+    stall_budget = 0.05
+    stall_sample_rate = 200
+
+    def main_event(self):
+        self.count += 1
+        if self.count == 2:
+            self.stall()
+
+    def stall(self):
+        time.sleep(0.3)
+
+
+class StallWatchdogTestCase(unittest.TestCase):
+
+    def test_stall_report(self):
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        p = StallingProcess(framerate=0.01)
+        p.stall_report_path = os.path.join(tempdir, 'stalls.folded')
+        with self.assertLogs('libsousou.process.watchdog', 'WARNING'):
+            p.start_threaded()
+            time.sleep(0.5)
+            p.stop()
+            p.thread.join(5)
+        with open(p.stall_report_path) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertIn(';stall (', stack)
+            self.assertGreater(int(count), 0)
+
+
+class TickingProcess(CountingProcess):
+
+    def setup(self):
+        super(TickingProcess, self).setup()
+        self.updates = 0
+
+    def main_event(self):
+        self.count += 1
+
+    def do_update(self):
+        self.updates += 1
+
+
+class FailingProcess(CountingProcess):
+
+    def main_event(self):
+        raise ValueError("failed")
+
+
+class ReschedulingProcess(TickingProcess):
+
+    def do_update(self):
+        super(ReschedulingProcess, self).do_update()
+        self.scheduler.next_tick += 1
+
+
+class LoopGroupTestCase(unittest.TestCase):
+
+    def test_runs_processes_at_their_framerate(self):
+        group = LoopGroup()
+        fast = [TickingProcess(framerate=0.01) for i in range(50)]
+        slow = [TickingProcess(framerate=0.1) for i in range(50)]
+        for p in fast + slow:
+            group.add(p)
+        threads = threading.active_count()
+        group.start_threaded()
+        time.sleep(0.35)
+        self.assertEqual(threading.active_count(), threads + 1)
+        group.join()
+        for p in fast:
+            self.assertGreater(p.count, 20)
+        for p in slow:
+            self.assertIn(p.count, range(3, 6))
+        self.assertEqual(len(group), 0)
+
+    def test_update_and_stop_take_effect_immediately(self):
+        group = LoopGroup()
+        p = TickingProcess(framerate=60)
+        group.add(p)
+        group.start_threaded()
+        time.sleep(0.05)
+        p.update()
+        time.sleep(0.05)
+        self.assertEqual(p.updates, 1)
+        started = time.time()
+        p.stop()
+        self.assertTrue(p._evnt_exit.wait(5))
+        self.assertLess(time.time() - started, 1)
+        self.assertEqual(p.count, 1)
+        self.assertTrue(group.thread.is_alive())
+        group.join()
+
+    def test_wakeups_do_not_grow_the_heap(self):
+        # Every update moves the next iteration further ahead, which
+        # leaves the previous heap entry of the process stale.
+        group = LoopGroup()
+        p = ReschedulingProcess(framerate=60)
+        group.add(p)
+        group.start_threaded()
+        for i in range(200):
+            p.update()
+            time.sleep(0.001)
+        group.join()
+        self.assertGreater(p.updates, 10)
+        self.assertLessEqual(len(group._heap), 3)
+
+    def test_exceptions_are_isolated(self):
+        group = LoopGroup()
+        failing, ticking = FailingProcess(), TickingProcess(framerate=0.01)
+        group.add(failing)
+        group.add(ticking)
+        group.start_threaded()
+        time.sleep(0.1)
+        self.assertNotIn(failing, group.processes)
+        self.assertIn(ticking, group.processes)
+        group.join()
+        self.assertGreater(ticking.count, 1)
+
+    def test_signals_are_routed(self):
+        group = LoopGroup()
+        processes = [TickingProcess(framerate=60) for i in range(3)]
+        for p in processes:
+            group.add(p)
+        group.start_threaded()
+        time.sleep(0.05)
+        group.signal_handler(signal.SIGHUP, None)
+        time.sleep(0.05)
+        group.join()
+        self.assertEqual([p.updates for p in processes], [1, 1, 1])
+
+    def test_second_signal_stops_only_the_draining_process(self):
+        group = LoopGroup()
+        draining, other = TickingProcess(framerate=0.01), \
+            TickingProcess(framerate=0.01)
+        draining.is_drained = other.is_drained = lambda: False
+        group.add(draining)
+        group.add(other)
+        group.start_threaded()
+        time.sleep(0.05)
+        draining.drain(timeout=60)
+        time.sleep(0.05)
+        with self.assertLogs(draining.logger, 'WARNING'):
+            group.signal_handler(signal.SIGTERM, None)
+        self.assertTrue(draining._evnt_exit.wait(5))
+        self.assertTrue(other.draining)
+        self.assertIn(other, group.processes)
+        group.join()
+
+    def test_rejects_blocking_processes(self):
+        self.assertRaises(TypeError, LoopGroup().add, EchoProcess())
+
+    def test_pool(self):
+        pool = LoopPool(2)
+        processes = [TickingProcess(framerate=0.01) for i in range(10)]
+        for p in processes:
+            pool.add(p)
+        self.assertEqual([len(x) for x in pool.groups], [5, 5])
+        pool.start()
+        time.sleep(0.1)
+        pool.join()
+        self.assertTrue(all(p.count > 1 for p in processes))
+
+    def test_add_to_started_pool(self):
+        pool = LoopPool(2)
+        pool.start()
+        time.sleep(0.05)
+        p = TickingProcess(framerate=0.01)
+        pool.add(p)
+        time.sleep(0.1)
+        self.assertTrue(all(x.thread.is_alive() for x in pool.groups))
+        pool.join()
+        self.assertGreater(p.count, 1)
+        self.assertFalse(any(x.thread.is_alive() for x in pool.groups))
+        self.assertRaises(RuntimeError, pool.add, TickingProcess())
+
+
+class TimingWheelTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.wheel = TimingWheel(resolution=0.01, clock=self.clock)
+        self.fired = []
+
+    def advance(self, seconds, step=0.01):
+        end = self.clock.now + seconds
+        while self.clock.now < end:
+            self.clock.now = min(end, self.clock.now + step)
+            self.wheel.run()
+
+    def test_fires_in_order_and_never_early(self):
+        rnd = random.Random(0)
+        delays = [rnd.uniform(0, 1000) for i in range(2000)]
+        for delay in delays:
+            self.wheel.call_later(delay, self.fired.append,
+                (self.clock.now + delay, delay))
+        while self.wheel.count:
+            self.clock.now = self.wheel.next_due()
+            self.wheel.run()
+            for when, delay in self.fired:
+                self.assertGreaterEqual(self.clock.now, when)
+                self.assertLess(self.clock.now - when, 0.01)
+            del self.fired[:]
+
+    def test_cancel(self):
+        timers = [self.wheel.call_later(x, self.fired.append, x)
+            for x in (0.5, 1.0, 100.0)]
+        timers[1].cancel()
+        timers[2].cancel()
+        self.assertEqual(len(self.wheel), 1)
+        self.advance(200, step=0.1)
+        self.assertEqual(self.fired, [0.5])
+        self.assertIsNone(self.wheel.next_due())
+
+    def test_call_every(self):
+        timer = self.wheel.call_every(1.0, self.fired.append, True)
+        self.advance(3.5)
+        self.assertEqual(len(self.fired), 3)
+        # Missed calls are skipped.
+        self.clock.now += 10
+        self.wheel.run()
+        self.assertEqual(len(self.fired), 4)
+        timer.cancel()
+        self.advance(5)
+        self.assertEqual(len(self.fired), 4)
+
+    def test_timers_beyond_the_last_wheel(self):
+        wheel = TimingWheel(resolution=0.01, bits=4, levels=2,
+            clock=self.clock)
+        wheel.call_later(10.0, self.fired.append, True)
+        self.clock.now += 9.99
+        wheel.run()
+        self.assertEqual(self.fired, [])
+        self.clock.now += 0.01
+        wheel.run()
+        self.assertEqual(self.fired, [True])
+
+    def test_exceptions_are_logged(self):
+        self.wheel.call_later(0, operator.truediv, 1, 0)
+        self.wheel.call_later(0, self.fired.append, True)
+        with self.assertLogs(self.wheel.logger, 'ERROR'):
+            self.wheel.run()
+        self.assertEqual(self.fired, [True])
+
+
+class TimerProcess(CountingProcess):
+
+    def setup(self):
+        super(TimerProcess, self).setup()
+        self.fired = []
+        self.call_later(0.05, self.fired.append, 'later')
+        self.call_later(0.05, self.fired.append, 'cancelled').cancel()
+        self.ticker = self.call_every(0.02, self.fired.append, 'every')
+
+
+class TimerProcessTestCase(unittest.TestCase):
+
+    def test_timers_wake_up_the_loop(self):
+        p = TimerProcess(framerate=60)
+        p.start_threaded()
+        time.sleep(0.15)
+        p.stop()
+        p.thread.join(5)
+        self.assertEqual(p.count, 1)
+        self.assertEqual(p.fired.count('later'), 1)
+        self.assertNotIn('cancelled', p.fired)
+        self.assertGreaterEqual(p.fired.count('every'), 5)
+
+    def test_loop_group(self):
+        group = LoopGroup()
+        p = TimerProcess(framerate=60)
+        group.add(p)
+        group.start_threaded()
+        time.sleep(0.15)
+        group.join()
+        self.assertEqual(p.fired.count('later'), 1)
+        self.assertGreaterEqual(p.fired.count('every'), 5)
+
+
+class ReloadingProcess(CountingProcess):
+    reload_mode = loop.RELOAD_BACKGROUND
+    collect_metrics = True
+
+    def setup(self):
+        super(ReloadingProcess, self).setup()
+        self.version = 0
+        self.changes = []
+
+    def build_config(self):
+        if self.version:
+            time.sleep(0.1)
+        if self.version < 0:
+            raise ValueError
+        return self.version
+
+    def config_changed(self, previous):
+        self.changes.append((previous, self.config))
+
+
+class ConfigReloadTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.process = ReloadingProcess(framerate=0.005)
+        self.process.start_threaded()
+        time.sleep(0.05)
+
+    def tearDown(self):
+        self.process.stop()
+        self.process.thread.join(5)
+
+    def test_reload_does_not_stall_loop(self):
+        p = self.process
+        self.assertEqual(p.config, 0)
+        p.version = 1
+        p.update()
+        time.sleep(0.05)
+        count = p.count
+        self.assertEqual(p.config, 0)
+        time.sleep(0.15)
+        self.assertEqual(p.config, 1)
+        self.assertEqual(p.changes, [(0, 1)])
+        self.assertGreater(p.count, count)
+        self.assertEqual(p.metrics.reloads, 1)
+
+    def test_failed_reload_keeps_config(self):
+        p = self.process
+        p.version = -1
+        with self.assertLogs(p.logger, 'ERROR'):
+            p.update()
+            time.sleep(0.2)
+        self.assertEqual(p.config, 0)
+        self.assertEqual(p.metrics.reload_failures, 1)
+
+
+class LatencyHistogramTestCase(unittest.TestCase):
+
+    def test_buckets(self):
+        histogram = LatencyHistogram()
+        for value in (0, 0.0003, 0.0003, 0.75, 1000):
+            histogram.record(value)
+        buckets = histogram.as_dict()['buckets']
+        self.assertEqual([x[0] for x in buckets], histogram.bounds())
+        self.assertEqual([x for x in buckets if x[1]], [
+            [2.0 ** -20, 1],
+            [2.0 ** -11, 2],
+            [1.0, 1],
+            [float('inf'), 1]
+        ])
+        self.assertEqual(histogram.max, 1000)
+
+    def test_quantile(self):
+        histogram = LatencyHistogram()
+        self.assertEqual(histogram.quantile(0.5), None)
+        for i in range(99):
+            histogram.record(0.001)
+        histogram.record(0.5)
+        self.assertEqual(histogram.quantile(0.5), 2.0 ** -9)
+        self.assertEqual(histogram.quantile(1), 0.5)
+
+
+class LoopMetricsTestCase(unittest.TestCase):
+
+    def test_snapshot_reset(self):
+        metrics = LoopMetrics()
+        metrics.record_tick(0.001)
+        metrics.record_tick(0.1, overrun=True)
+        metrics.record_update(0.5)
+        snapshot = metrics.snapshot(reset=True)
+        self.assertEqual(snapshot['ticks'], 2)
+        self.assertEqual(snapshot['overruns'], 1)
+        self.assertEqual(snapshot['updates'], 1)
+        self.assertEqual(snapshot['tick_time']['count'], 2)
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['ticks'], 0)
+        self.assertEqual(snapshot['tick_time']['count'], 0)
+
+    def test_prometheus_counters_are_not_reset(self):
+        with self.assertRaises(ValueError):
+            MetricsDumper(LoopMetrics(), 'metrics', format=FORMAT_PROMETHEUS,
+                reset=True)
+
+    def test_format_prometheus(self):
+        metrics = LoopMetrics()
+        metrics.record_tick(0.001)
+        metrics.record_tick(0.1)
+        text = format_prometheus(metrics.snapshot(), prefix='test')
+        self.assertIn('test_ticks_total 2\n', text)
+        self.assertIn('test_tick_seconds_bucket{le="0.125"} 2\n', text)
+        self.assertIn('test_tick_seconds_bucket{le="9.5367431640625e-07"} 0\n',
+            text)
+        self.assertIn('test_tick_seconds_bucket{le="64.0"} 2\n', text)
+        self.assertEqual(text.count('test_tick_seconds_bucket'), 28)
+        self.assertIn('test_tick_seconds_bucket{le="+Inf"} 2\n', text)
+        self.assertIn('test_tick_seconds_count 2\n', text)
+
+
+class EchoProcess(SelectorProcess):
+
+    def setup(self):
+        self.server, self.client = socket.socketpair()
+        self.received = []
+        self.fired = []
+        self.add_reader(self.server, self.on_readable)
+        self.call_later(0.01, self.fired.append, True)
+        self.call_later(0.01, self.fired.append, False).cancel()
+
+    def on_readable(self):
+        self.received.append(self.server.recv(1024))
+
+    def do_cleanup(self, graceful):
+        self.server.close()
+        self.client.close()
+
+
+class SelectorProcessTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.process = EchoProcess()
+        self.process.start_threaded()
+        while not hasattr(self.process, 'client'):
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.process.stop()
+        self.process.thread.join(5)
+
+    def test_reader_callback(self):
+        self.process.client.send(b'foo')
+        time.sleep(0.1)
+        self.assertEqual(self.process.received, [b'foo'])
+
+    def test_timers(self):
+        time.sleep(0.1)
+        self.assertEqual(self.process.fired, [True])
+
+    def test_stop_interrupts_select(self):
+        started = time.time()
+        self.process.stop()
+        self.process.thread.join(5)
+        self.assertFalse(self.process.thread.is_alive())
+        self.assertLess(time.time() - started, 1)
+
+
+class WatchedEchoProcess(EchoProcess):
+    stall_budget = 0.05
+    collect_metrics = True
+
+
+class SelectorWatchdogTestCase(unittest.TestCase):
+
+    def test_waiting_is_not_a_stall(self):
+        p = WatchedEchoProcess(framerate=0.05)
+        with self.assertNoLogs('libsousou.process.watchdog', 'WARNING'):
+            p.start_threaded()
+            time.sleep(0.3)
+            p.client.send(b'foo')
+            time.sleep(0.05)
+            p.stop()
+            p.thread.join(5)
+        self.assertEqual(p.received, [b'foo'])
+        self.assertGreater(p.metrics.ticks, 0)
+        self.assertLess(p.metrics.histogram.max, 0.05)
+        self.assertEqual(p.metrics.overruns, 0)
+
+
+class AsyncCountingProcess(AsyncBaseProcess):
+
+    async def setup(self):
+        self.count = 0
+        self.ticks = 0
+        self.task = asyncio.ensure_future(self.ticker())
+
+    async def ticker(self):
+        while True:
+            self.ticks += 1
+            await asyncio.sleep(0.01)
+
+    async def main_event(self):
+        self.count += 1
+        await asyncio.sleep(0.01)
+
+    async def do_cleanup(self, graceful):
+        self.task.cancel()
+
+
+class BusyAsyncProcess(AsyncBaseProcess):
+    # An iteration is always due and never awaits.
+
+    async def setup(self):
+        self.count = 0
+        self.ticks = 0
+        self.task = asyncio.ensure_future(self.ticker())
+
+    async def ticker(self):
+        while True:
+            self.ticks += 1
+            await asyncio.sleep(0)
+
+    def main_event(self):
+        self.count += 1
+
+    def do_cleanup(self, graceful):
+        self.task.cancel()
+
+
+class IdleAsyncProcess(BusyAsyncProcess):
+
+    def main_event(self):
+        self.count += 1
+        return False
+
+
+class AsyncBaseProcessTestCase(unittest.TestCase):
+
+    def test_other_tasks_make_progress(self):
+        p = BusyAsyncProcess()
+        p.start_threaded()
+        time.sleep(0.2)
+        p.stop()
+        p.thread.join(5)
+        self.assertGreater(p.count, 100)
+        self.assertGreater(p.ticks, p.count // 2)
+
+    def test_idle_loop_backs_off(self):
+        p = IdleAsyncProcess()
+        p.start_threaded()
+        time.sleep(0.2)
+        p.stop()
+        p.thread.join(5)
+        self.assertLess(p.count, 50)
+
+    def test_coroutine_hooks(self):
+        # The main event and a task started in setup() run concurrently
+        # on the same event loop.
+        p = AsyncCountingProcess()
+        p.start_threaded()
+        time.sleep(0.2)
+        p.stop()
+        p.thread.join(5)
+        self.assertFalse(p.thread.is_alive())
+        self.assertGreater(p.count, 1)
+        self.assertGreater(p.ticks, 1)
+        self.assertTrue(p.task.cancelled())
+
+    def test_stop_interrupts_wait(self):
+        p = AsyncCountingProcess(framerate=60)
+        p.start_threaded()
+        time.sleep(0.05)
+        started = time.time()
+        p.stop()
+        p.thread.join(5)
+        self.assertLess(time.time() - started, 1)
+
+
+class SleepingProcess(BaseProcess):
+
+    def main_event(self):
+        return False
+
+
+class SupervisorTestCase(unittest.TestCase):
+
+    def wait_for(self, predicate, timeout=5):
+        deadline = time.time() + timeout
+        while not predicate():
+            if time.time() > deadline:
+                self.fail("Timed out")
+            time.sleep(0.01)
+
+    def running(self, supervisor):
+        return [x.pid for x in supervisor.slots if x.running]
+
+    def test_restart_scale_and_stop(self):
+        supervisor = Supervisor(SleepingProcess, workers=2, min_backoff=0,
+            framerate=0.05)
+        supervisor.start_threaded()
+        try:
+            self.wait_for(lambda: len(self.running(supervisor)) == 2)
+            pids = self.running(supervisor)
+
+            # A crashed worker is replaced.
+            os.kill(pids[0], signal.SIGKILL)
+            self.wait_for(lambda: len(self.running(supervisor)) == 2
+                and pids[0] not in self.running(supervisor))
+
+            # Shrinking the pool retires the surplus worker.
+            surplus = supervisor.slots[1].pid
+            with self.assertLogs(supervisor.logger, 'INFO') as logs:
+                supervisor.workers = 1
+                supervisor.wakeup()
+                self.wait_for(lambda: len(supervisor.slots) == 1)
+                pids = self.running(supervisor)
+                self.wait_for(lambda: surplus not in supervisor.retiring)
+            self.assertIn("Retired worker 1 (pid {0})".format(surplus),
+                '\n'.join(logs.output))
+            self.assertRaises(ProcessLookupError, os.kill, surplus, 0)
+        finally:
+            supervisor.stop()
+            supervisor.thread.join(10)
+        self.assertFalse(supervisor.thread.is_alive())
+        self.assertRaises(ProcessLookupError, os.kill, pids[0], 0)
+
+    def test_restart_backoff(self):
+        supervisor = Supervisor(SleepingProcess, workers=1, min_backoff=1,
+            max_backoff=4, stable_after=10)
+        supervisor.logger = logging.getLogger(supervisor.logger_name)
+        slot = WorkerSlot(0)
+        delays = []
+        for i in range(4):
+            slot.pid = 1
+            slot.started = time.monotonic()
+            with self.assertLogs(supervisor.logger, 'WARNING'):
+                supervisor.on_worker_exit(slot, 1)
+            delays.append(round(slot.next_start - time.monotonic()))
+        self.assertEqual(delays, [1, 2, 4, 4])
+
+        # A worker that ran for longer than stable_after starts over.
+        slot.pid = 1
+        slot.started = time.monotonic() - 10
+        with self.assertLogs(supervisor.logger, 'WARNING'):
+            supervisor.on_worker_exit(slot, 1)
+        self.assertEqual(slot.failures, 1)
+
+
+class RecyclingProcess(CountingProcess):
+
+    def main_event(self):
+        self.count += 1
+
+
+class RecyclingTestCase(unittest.TestCase):
+
+    def run_process(self, **attrs):
+        p = RecyclingProcess(framerate=0.01)
+        for name, value in attrs.items():
+            setattr(p, name, value)
+        p.start_threaded()
+        p.thread.join(5)
+        self.assertFalse(p.thread.is_alive())
+        return p
+
+    def test_max_events(self):
+        p = self.run_process(max_events=5)
+        self.assertEqual(p.count, 5)
+
+    def test_max_lifetime(self):
+        started = time.monotonic()
+        self.run_process(max_lifetime=0.05, max_lifetime_jitter=0.05)
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+
+    def test_max_rss(self):
+        self.run_process(max_rss=1, rss_check_interval=0.01)
+
+    def test_supervisor_starts_replacement_first(self):
+        # The supervisor runs in the main thread, as it does in production;
+        # a thread stops it once the first worker was replaced twice.
+        RecyclingProcess.max_events = 10
+        self.addCleanup(delattr, RecyclingProcess, 'max_events')
+        supervisor = Supervisor(RecyclingProcess, workers=1, framerate=0.01,
+            shutdown_timeout=1)
+        for signum in supervisor.signals:
+            self.addCleanup(signal.signal, signum, signal.getsignal(signum))
+        pids = set()
+        def watch():
+            deadline = time.time() + 5
+            while len(pids) < 3 and time.time() < deadline:
+                pids.update(x.pid for x in supervisor.slots if x.running)
+                time.sleep(0.005)
+            supervisor.stop()
+        watcher = threading.Thread(target=watch)
+        watcher.start()
+        supervisor.start()
+        watcher.join(5)
+        self.assertGreaterEqual(len(pids), 3)
+        self.assertEqual(supervisor.slots[0].failures, 0)
+        self.assertEqual(supervisor.retiring, {})
+
+    def test_forked_child_registers_signals(self):
+        # A child forked from a thread, like the workers of a supervisor
+        # running in a thread, binds its signals.
+        r, w = os.pipe()
+        def fork():
+            pid = os.fork()
+            if pid == 0:
+                p = CountingProcess()
+                p.signals = (signal.SIGUSR2,)
+                p.register_signals()
+                handler = signal.getsignal(signal.SIGUSR2)
+                os.write(w, b'1' if handler == p.signal_handler else b'0')
+                os._exit(0)
+            os.waitpid(pid, 0)
+        thread = threading.Thread(target=fork)
+        thread.start()
+        thread.join(5)
+        os.close(w)
+        with os.fdopen(r, 'rb') as f:
+            self.assertEqual(f.read(), b'1')
+
+
+class CollectingHandler(logging.Handler):
+
+    def __init__(self, delay=0):
+        super(CollectingHandler, self).__init__()
+        self.delay = delay
+        self.messages = []
+        self.threads = set()
+
+    def emit(self, record):
+        time.sleep(self.delay)
+        self.threads.add(threading.get_ident())
+        self.messages.append(record.getMessage())
+
+
+class LoggingProcess(CountingProcess):
+    queued_logging = True
+
+    def main_event(self):
+        self.count += 1
+        self.logger.warning("tick {0}".format(self.count))
+        if self.count == 5:
+            self.stop()
+
+
+class QueuedLoggingTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger('tests.logqueue')
+        self.logger.propagate = False
+        self.handler = CollectingHandler()
+        self.logger.addHandler(self.handler)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def test_stop_writes_queued_records(self):
+        self.handler.delay = 0.01
+        instance = logqueue.start(self.logger)
+        self.assertNotIn(self.handler, self.logger.handlers)
+        started = time.monotonic()
+        for i in range(10):
+            self.logger.warning("record {0}".format(i))
+        self.assertLess(time.monotonic() - started, 0.05)
+        logqueue.stop(instance)
+        self.assertEqual(self.handler.messages,
+            ["record {0}".format(i) for i in range(10)])
+        self.assertNotIn(threading.get_ident(), self.handler.threads)
+        self.assertIn(self.handler, self.logger.handlers)
+        self.assertNotIn(instance.handler, self.logger.handlers)
+
+    def test_shared(self):
+        instance = logqueue.start(self.logger)
+        self.assertIs(logqueue.start(self.logger), instance)
+        logqueue.stop(instance)
+        self.assertIsNotNone(instance.listener)
+        logqueue.stop(instance)
+        self.assertIsNone(instance.listener)
+
+    def test_drop(self):
+        self.handler.delay = 0.05
+        instance = logqueue.start(self.logger, queue_size=2)
+        for i in range(10):
+            self.logger.warning("record {0}".format(i))
+        with self.assertLogs(instance.logger, 'WARNING'):
+            logqueue.stop(instance)
+        self.assertGreaterEqual(instance.dropped, 7)
+        self.assertEqual(len(self.handler.messages) + instance.dropped, 10)
+
+    def test_block(self):
+        self.handler.delay = 0.01
+        instance = logqueue.start(self.logger, queue_size=2,
+            policy=logqueue.BLOCK)
+        for i in range(10):
+            self.logger.warning("record {0}".format(i))
+        logqueue.stop(instance)
+        self.assertEqual(instance.dropped, 0)
+        self.assertEqual(len(self.handler.messages), 10)
+
+    def test_invalid_policy(self):
+        self.assertRaises(ValueError, logqueue.BoundedQueueHandler,
+            queue.Queue(), policy='foo')
+
+    def test_fork_restarts_listener(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.unlink, path)
+        handler = logging.FileHandler(path)
+        self.logger.addHandler(handler)
+        self.addCleanup(self.logger.removeHandler, handler)
+        instance = logqueue.start(self.logger)
+        self.addCleanup(logqueue.stop, instance)
+        pid = os.fork()
+        if pid == 0:
+            try:
+                self.logger.warning("child")
+                logqueue.stop(instance)
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        handler.close()
+        with open(path) as f:
+            self.assertEqual(f.read(), "child\n")
+
+    def test_process(self):
+        root = logging.getLogger()
+        root.addHandler(self.handler)
+        self.addCleanup(root.removeHandler, self.handler)
+        p = LoggingProcess(framerate=0.001)
+        p.start_threaded()
+        p.thread.join(5)
+        self.assertEqual(self.handler.messages[-5:],
+            ["tick {0}".format(i) for i in range(1, 6)])
+        self.assertNotIn(p.thread.ident, self.handler.threads)
+        self.assertIn(self.handler, root.handlers)
+        self.assertFalse([x for x in root.handlers
+            if isinstance(x, logqueue.BoundedQueueHandler)])
+
+
+def allocate(n):
+    return [str(i) * 10 for i in range(n)]
+
+
+class ProfiledProcess(CountingProcess):
+    memory_signal = signal.SIGUSR1
+
+
+class MemoryProfilerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+
+    def test_report(self):
+        profiler = MemoryProfiler(self.tempdir, limit=5)
+        profiler.toggle().join(10)
+        self.assertTrue(tracemalloc.is_tracing())
+        data = allocate(10000)
+        profiler.toggle().join(10)
+        self.assertFalse(tracemalloc.is_tracing())
+        path = os.path.join(self.tempdir, 'memory-{0}-{1}')
+        baseline = tracemalloc.Snapshot.load(
+            path.format(os.getpid(), 1) + '.snapshot')
+        snapshot = tracemalloc.Snapshot.load(
+            path.format(os.getpid(), 2) + '.snapshot')
+        self.assertGreater(len(snapshot.traces), len(baseline.traces))
+        with open(path.format(os.getpid(), 2) + '.txt') as f:
+            report = f.read().splitlines()
+        self.assertIn(__file__, report[0])
+        self.assertTrue(report[-1].startswith('Total: size=+'))
+        self.assertLessEqual(len(report), 7)
+        del data
+
+    def test_traceback(self):
+        profiler = MemoryProfiler(limit=1, key_type='traceback', frames=3)
+        profiler.toggle().join(10)
+        data = allocate(10000)
+        with self.assertLogs(profiler.logger, 'WARNING') as logs:
+            profiler.toggle().join(10)
+        report = logs.records[0].getMessage()
+        self.assertIn('allocate(10000)', report)
+        self.assertIn("return [str(i) * 10 for i in range(n)]", report)
+        del data
+
+    def test_invalid_key_type(self):
+        self.assertRaises(ValueError, MemoryProfiler, key_type='foo')
+
+    def test_signal(self):
+        p = ProfiledProcess()
+        p.memory_report_path = self.tempdir
+        self.assertIn(signal.SIGUSR1, p.signals)
+        p.start_threaded()
+        try:
+            p.signal_handler(signal.SIGUSR1, None)
+            p.signal_handler(signal.SIGUSR1, None)
+            deadline = time.time() + 10
+            while len(os.listdir(self.tempdir)) < 3 and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(len(os.listdir(self.tempdir)), 3)
+        finally:
+            p.stop()
+            p.thread.join(5)
+        self.assertFalse(tracemalloc.is_tracing())
+
+
+class AcceptingProcess(BaseProcess):
+
+    def setup(self):
+        self.sockets['http'].settimeout(0.01)
+
+    def main_event(self):
+        try:
+            conn, _ = self.sockets['http'].accept()
+        except socket.timeout:
+            return False
+        with conn:
+            conn.sendall(str(os.getpid()).encode('ascii'))
+
+
+class ListenersTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+
+    def connect(self, address):
+        with socket.create_connection(address, timeout=5) as conn:
+            return int(conn.recv(16))
+
+    def test_parse_address(self):
+        self.assertEqual(parse_address('unix:/tmp/foo'),
+            (socket.AF_UNIX, '/tmp/foo'))
+        self.assertEqual(parse_address('127.0.0.1:80'),
+            (socket.AF_INET, ('127.0.0.1', 80)))
+        self.assertEqual(parse_address('[::1]:80')[0], socket.AF_INET6)
+        self.assertRaises(ValueError, parse_address, 'localhost')
+
+    def test_bind_unix_socket(self):
+        path = os.path.join(self.tempdir, 'sock')
+        for i in range(2):
+            # A stale socket file is replaced.
+            sock = bind_socket('unix:' + path, mode=0o600)
+            sock.close()
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+
+    def test_reuse_port_shards(self):
+        listeners = Listeners({'http': '127.0.0.1:0'}, reuse_port=True,
+            shards=3)
+        listeners.bind()
+        self.addCleanup(listeners.close)
+        ports = set(x.getsockname()[1] for x in listeners.sockets['http'])
+        self.assertEqual(len(ports), 1)
+        self.assertEqual(sorted(listeners.get_sockets()),
+            ['http', 'http:1', 'http:2'])
+        self.assertIs(listeners.for_worker(4)['http'],
+            listeners.sockets['http'][1])
+
+        # Sockets received from a previous process are reused.
+        inherited = Listeners({'http': '127.0.0.1:0'}, reuse_port=True,
+            shards=3)
+        inherited.bind(listeners.get_sockets())
+        self.assertEqual(inherited.sockets, listeners.sockets)
+
+    def test_supervisor_workers_inherit_sockets(self):
+        listeners = Listeners({'http': '127.0.0.1:0'}, reuse_port=True,
+            shards=2)
+        supervisor = Supervisor(AcceptingProcess, workers=2,
+            listeners=listeners, framerate=0.05)
+        supervisor.start_threaded()
+        try:
+            deadline = time.time() + 10
+            while not all(x.running for x in supervisor.slots[:2])\
+            or len(supervisor.slots) < 2:
+                self.assertLess(time.time(), deadline)
+                time.sleep(0.01)
+            address = listeners.sockets['http'][0].getsockname()
+            pids = set(x.pid for x in supervisor.slots)
+            for i in range(10):
+                self.assertIn(self.connect(address), pids)
+        finally:
+            supervisor.stop()
+            supervisor.thread.join(10)
+            listeners.close()
+
+    def test_send_sockets(self):
+        listeners = Listeners({'http': '127.0.0.1:0'})
+        listeners.bind()
+        self.addCleanup(listeners.close)
+        p = AcceptingProcess()
+        p.sockets_path = os.path.join(self.tempdir, 'handoff')
+        p.start_threaded()
+        try:
+            deadline = time.time() + 5
+            while True:
+                try:
+                    listeners.send(p.sockets_path)
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    self.assertLess(time.time(), deadline)
+                    time.sleep(0.01)
+            address = listeners.sockets['http'][0].getsockname()
+            self.assertEqual(self.connect(address), os.getpid())
+        finally:
+            p.stop()
+            p.thread.join(5)
+
+
+class RangeProcess(WorkQueueProcess):
+    workers = 2
+    batch_size = 10
+    queue_size = 20
+
+    def setup(self):
+        self.items = iter(range(1000))
+        self.batches = []
+
+    def produce(self):
+        return [next(self.items, None)] if not self.must_exit() else []
+
+    def consume(self, batch):
+        time.sleep(0.001)
+        self.batches.append(batch)
+
+
+class SpawnedRangeProcess(RangeProcess):
+    start_method = 'spawn'
+
+    def produce(self):
+        item = next(self.items, None)
+        if item is None:
+            self.stop()
+            return []
+        return [item]
+
+
+class WorkQueueProcessTestCase(unittest.TestCase):
+
+    def test_spawn(self):
+        # The queue and the lock of the worker threads can not be
+        # pickled, and are recreated in the child.
+        process = SpawnedRangeProcess().start_process()
+        process.join(30)
+        self.assertEqual(process.exitcode, 0)
+
+    def test_stop_drains_queue(self):
+        p = RangeProcess()
+        p.start_threaded()
+        time.sleep(0.1)
+        p.stop()
+        p.thread.join(5)
+        self.assertFalse(p.thread.is_alive())
+        stats = p.queue_stats()
+        consumed = sum(len(x) for x in p.batches)
+        self.assertEqual(stats['produced'], consumed)
+        self.assertEqual(stats['consumed'], consumed)
+        self.assertEqual(stats['depth'], 0)
+        self.assertLessEqual(stats['max_depth'], RangeProcess.queue_size)
+        self.assertTrue(all(len(x) <= 10 for x in p.batches))
+
+    def test_batch_age(self):
+        # A batch that does not fill up is consumed after batch_age
+        # seconds.
+        p = RangeProcess()
+        p.batch_age = 0.01
+        p.produce = lambda: []
+        p.start_threaded()
+        p.put(1)
+        time.sleep(0.1)
+        self.assertEqual(p.batches, [[1]])
+        p.stop()
+        p.thread.join(5)
+
+
+def echo(channel):
+    for message in channel.recv_many(timeout=5):
+        channel.send(bytes(message).upper())
+    channel.close()
+
+
+class RingBufferTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.ring = RingBuffer(256)
+
+    def tearDown(self):
+        self.ring.release()
+        self.ring.close()
+
+    def test_requires_x86_64(self):
+        from libsousou.process import channel
+        self.addCleanup(setattr, channel, '_SUPPORTED', channel._SUPPORTED)
+        channel._SUPPORTED = False
+        self.assertRaises(RuntimeError, RingBuffer, 256)
+
+    def test_wrap_around(self):
+        # Messages of varying sizes are received intact while the
+        # positions wrap around the buffer many times.
+        rnd = random.Random(0)
+        sent, received = [], []
+        for i in range(5000):
+            message = bytes([i % 256]) * rnd.randint(0, 60)
+            try:
+                self.ring.send(message, block=False)
+                sent.append(message)
+            except queue.Full:
+                pass
+            if rnd.random() < 0.5:
+                try:
+                    received.append(self.ring.recv_bytes(block=False))
+                except queue.Empty:
+                    pass
+        received.extend(bytes(x) for x in self.ring.recv_many(block=False))
+        self.assertEqual(received, sent)
+
+    def test_full_and_empty(self):
+        self.assertRaises(queue.Empty, self.ring.recv, block=False)
+        self.assertRaises(queue.Empty, self.ring.recv, timeout=0.01)
+        while True:
+            try:
+                self.ring.send(b'x' * 60, block=False)
+            except queue.Full:
+                break
+        self.assertRaises(queue.Full, self.ring.send, b'x', timeout=0.01)
+        self.assertRaises(ValueError, self.ring.send, b'x' * 256)
+
+    def test_zero_copy(self):
+        self.ring.send_many([b'foo', b'bar'])
+        views = self.ring.recv_many()
+        self.assertEqual([bytes(x) for x in views], [b'foo', b'bar'])
+        self.assertIsInstance(views[0], memoryview)
+        del views
+
+
+class ChannelTestCase(unittest.TestCase):
+
+    def exchange(self, method):
+        channel = Channel(4096)
+        context = multiprocessing.get_context(method)
+        child = context.Process(target=echo, args=(channel,))
+        child.start()
+        try:
+            channel.send_many([b'foo', b'bar'])
+            self.assertEqual(channel.recv_bytes(timeout=10), b'FOO')
+            self.assertEqual(channel.recv_bytes(timeout=10), b'BAR')
+        finally:
+            child.join(10)
+            channel.close()
+
+    def test_fork(self):
+        self.exchange('fork')
+
+    def test_spawn(self):
+        self.exchange('spawn')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import threading
+import unittest
+
+from libsousou.web import base
+from libsousou.web import RequestController
+
+
+class Request(object):
+
+    def __init__(self, method):
+        self.method = method
+
+    def get_request_method(self):
+        return self.method
+
+
+class Controller(RequestController):
+    disable_authentication = True
+    instances = 0
+
+    def __init__(self):
+        type(self).instances += 1
+
+    def render(self, context):
+        return context
+
+    def response_factory(self, content, *args, **kwargs):
+        return (kwargs.get('status_code') or 200, kwargs.get('headers'),
+            content)
+
+    def get(self, request, *args, **kwargs):
+        return self.render_to_response({'id': id(self)})
+
+    @staticmethod
+    def delete(request, *args, **kwargs):
+        return 'deleted'
+
+
+class ContextController(Controller):
+    instance_mode = base.SHARED
+
+    def get(self, request, *args, **kwargs):
+        self.context.value = kwargs['value']
+        return self.context.value
+
+
+class RequestControllerTestCase(unittest.TestCase):
+
+    def get_controller(self, **attrs):
+        attrs.setdefault('instances', 0)
+        cls = type('Controller', (Controller,), attrs)
+        return cls, cls.as_view()
+
+    def test_dispatch(self):
+        cls, view = self.get_controller()
+        self.assertEqual(view(Request('GET'))[0], 200)
+        self.assertEqual(view(Request('get'))[0], 200)
+        self.assertEqual(view(Request('DELETE')), 'deleted')
+        self.assertEqual(cls.instances, 3)
+
+    def test_method_not_allowed(self):
+        cls, view = self.get_controller()
+        status, headers, _ = view(Request('PUT'))
+        self.assertEqual(status, 405)
+        self.assertEqual(headers, {'Allow': 'GET, DELETE'})
+        self.assertEqual(cls().allowed_methods, ['GET', 'DELETE'])
+
+    def test_controller_methods_are_not_dispatched(self):
+        _, view = self.get_controller()
+        self.assertEqual(view(Request('DISPATCH'))[0], 405)
+
+    def test_authentication(self):
+        _, view = self.get_controller(disable_authentication=['GET'],
+            post=lambda self, request: 'posted')
+        self.assertEqual(view(Request('GET'))[0], 200)
+        self.assertEqual(view(Request('POST'))[0], 401)
+
+    def test_dispatch_table_per_class(self):
+        cls, _ = self.get_controller(put=lambda self, request: 'put')
+        self.assertEqual(cls().allowed_methods, ['GET', 'PUT', 'DELETE'])
+        self.assertEqual(Controller().allowed_methods, ['GET', 'DELETE'])
+        self.assertIs(cls.get_dispatch_table(), cls.get_dispatch_table())
+
+    def test_instance_attributes(self):
+        cls, _ = self.get_controller()
+        controller = cls()
+        controller.disable_authentication = False
+        self.assertEqual(controller.dispatch(Request('GET'))[0], 401)
+
+        controller = cls()
+        controller.get = lambda request: 'instance'
+        controller.http_methods = ('GET', 'PUT')
+        self.assertEqual(controller.dispatch(Request('GET')), 'instance')
+        self.assertEqual(controller.dispatch(Request('DELETE'))[0], 405)
+        self.assertEqual(controller.allowed_methods, ['GET'])
+        self.assertEqual(cls().dispatch(Request('DELETE')), 'deleted')
+
+    def test_view_names(self):
+        _, view = self.get_controller()
+        _, other = self.get_controller()
+        self.assertTrue(view.__name__.startswith('Controller_'))
+        self.assertNotEqual(view.__name__, other.__name__)
+
+    def test_shared(self):
+        cls, view = self.get_controller(instance_mode=base.SHARED)
+        first = view(Request('GET'))[2]['id']
+        self.assertEqual(view(Request('GET'))[2]['id'], first)
+        self.assertEqual(cls.instances, 1)
+
+    def test_pooled(self):
+        cls, view = self.get_controller(instance_mode=base.POOLED,
+            pool_size=1)
+        first = view(Request('GET'))[2]['id']
+        self.assertEqual(view(Request('GET'))[2]['id'], first)
+        self.assertEqual(cls.instances, 1)
+
+    def test_context(self):
+        view = ContextController.as_view()
+        results = []
+        def target(value):
+            results.append(view(Request('GET'), value=value))
+        threads = [threading.Thread(target=target, args=(i,))
+            for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), list(range(10)))
+        self.assertRaises(LookupError, getattr, ContextController(), 'context')
+
+
+if __name__ == '__main__':
+    unittest.main()